@@ -2,11 +2,13 @@
 # (FIXED: Đã cập nhật để đọc SQL từ file với BigQueryInsertJobOperator)
 # (UPDATED: Thêm pipeline huấn luyện model dự đoán giá cước)
 
+import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from airflow.decorators import dag
 from airflow.models.variable import Variable
 from airflow.operators.bash import BashOperator
+from airflow.utils.task_group import TaskGroup
 from airflow.providers.google.cloud.operators.bigquery import BigQueryInsertJobOperator
 
 # --- Helper function để đọc SQL files ---
@@ -20,6 +22,31 @@ def read_sql_file(file_path):
         # In a real scenario, you'd want more robust error handling
         return f"-- SQL file not found at {file_path}"
 
+# --- Helper function để đọc đồ thị model từ dbt manifest ---
+def load_dbt_model_graph(manifest_path, project_name="nyc_taxi_pipeline"):
+    """Returns {model_name: [upstream model names]} from dbt's manifest.json (ref() edges).
+
+    Returns None when the manifest does not exist (chưa chạy `dbt parse`).
+    """
+    try:
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return None
+
+    graph = {}
+    for unique_id, node in manifest["nodes"].items():
+        if node["resource_type"] != "model" or node["package_name"] != project_name:
+            continue
+        if not node["config"].get("enabled", True):
+            continue
+        graph[node["name"]] = [
+            parent.split(".")[-1]
+            for parent in node["depends_on"]["nodes"]
+            if parent.startswith(f"model.{project_name}.")
+        ]
+    return graph
+
 # --- Biến Cấu hình ---
 # Lấy Project ID từ kết nối Airflow hoặc biến môi trường
 GCP_PROJECT_ID = os.environ.get("GCP_PROJECT", "nyc-taxi-project-477115")
@@ -32,14 +59,61 @@ DAGS_FOLDER_PATH = Variable.get("DAGS_FOLDER_PATH", "/home/airflow/gcs/dags")
 # Xác định đường dẫn cho các dự án con
 DBT_PROJECT_DIR = f"{DAGS_FOLDER_PATH}/nyc_taxi_pipeline"
 BQML_SCRIPT_DIR = f"{DAGS_FOLDER_PATH}/bqml_scripts"
+TOOLS_DIR = f"{DAGS_FOLDER_PATH}/tools"
+
+# Bảng lịch sử runtime / bytes / slot-ms của từng model dbt
+DBT_PERF_HISTORY_TABLE = f"{GCP_PROJECT_ID}.monitoring.dbt_model_runs"
+
+# Ngày trong tuần (Monday = 0) chạy dbt test trên toàn bộ lịch sử thay vì cửa sổ gần đây
+# Run do nyc-taxi-partition-watch trigger: conf.test_full_history (lần trigger đầu tiên mỗi tuần)
+DBT_TEST_FULL_HISTORY_WEEKDAY = 6
+DBT_TEST_VARS = (
+    " {% if dag_run.conf.get('test_full_history', logical_date.weekday() == "
+    + str(DBT_TEST_FULL_HISTORY_WEEKDAY) + ") %}"
+    "--vars '{test_full_history: true}'{% endif %}"
+)
+
+# manifest.json sinh bởi `dbt parse` lúc deploy -> mỗi model dbt là một task Airflow
+DBT_MANIFEST_PATH = Variable.get("DBT_MANIFEST_PATH", f"{DBT_PROJECT_DIR}/target/manifest.json")
+# Pool giới hạn số model chạy đồng thời (tạo pool trong Airflow UI, vd. `dbt_models` với 4 slots)
+DBT_POOL = Variable.get("DBT_POOL", "default_pool")
+DBT_NODE_RETRIES = 2
+
+# Job BigQuery (BQML) chạy ở chế độ deferrable: task nhả worker slot trong lúc job chạy,
+# triggerer poll trạng thái job mỗi BQ_POLL_INTERVAL giây (Composer cần bật triggerer)
+BQ_DEFERRABLE = Variable.get("BQ_DEFERRABLE", "true").lower() == "true"
+BQ_POLL_INTERVAL = 30
+
+# Task BQML -> model dbt mà nó đọc
+BQML_UPSTREAM_MODELS = {
+    "bqml_train_demand_model": ["fct_hourly_features"],
+    "bqml_train_fare_model": ["fct_fare_training_sample"],
+}
+
+# --- Lệnh cho từng node dbt ---
+def dbt_node_command(model_name):
+    """`dbt build` cho một model (chạy model + test của nó), rồi ghi báo cáo hiệu năng của node.
+
+    Mỗi node có target-path riêng để các task chạy song song không ghi đè run_results.json của nhau.
+    """
+    node_target = f"target/airflow/{model_name}"
+    return (
+        f"cd {DBT_PROJECT_DIR} && "
+        f"dbt build --select {model_name} --target-path {node_target} --log-path {node_target}/logs"
+        + DBT_TEST_VARS +
+        f"; status=$?; python {TOOLS_DIR}/dbt_perf_report.py"
+        f" --run-results {DBT_PROJECT_DIR}/{node_target}/run_results.json"
+        f" --target prod --bq-table {DBT_PERF_HISTORY_TABLE} --enrich-jobs || true; exit $status"
+    )
 
 # --- Định nghĩa DAG ---
 
 @dag(
     dag_id='nyc-taxi-orchestrator',
     start_date=datetime(2025, 1, 1),
-    schedule_interval='@daily', # Chạy hàng ngày
+    schedule_interval=None, # Trigger bởi nyc-taxi-partition-watch khi có đủ dữ liệu mới (nyc_taxi_event_dag.py)
     catchup=False,
+    max_active_runs=1, # Các trigger dồn dập xếp hàng thay vì build chồng nhau
     tags=['nyc-taxi', 'dbt', 'bqml'],
     template_searchpath=DAGS_FOLDER_PATH # Cho phép Airflow tìm SQL files
 )
@@ -64,21 +138,75 @@ def nyc_taxi_pipeline():
         bash_command=f"cd {DBT_PROJECT_DIR} && dbt seed"
     )
 
-    # Task 3: Chạy tất cả model dbt (staging, dims, facts)
-    dbt_run = BashOperator(
-        task_id='dbt_run',
-        bash_command=f"cd {DBT_PROJECT_DIR} && dbt run"
-    )
+    # Task 3: Mỗi model dbt là một task `dbt build --select <model>` (model + test của nó)
+    # dbt-bigquery chờ job đồng bộ nên các task này không defer được; DBT_POOL giới hạn số worker chúng giữ
+    # Phụ thuộc giữa các task = cạnh ref() trong manifest.json -> các nhánh độc lập
+    # (dimensions, fct_pca_features, fct_fare_prediction_training, ...) chạy song song trong DBT_POOL,
+    # model lỗi chỉ retry / chạy lại đúng node đó.
+    # Test chỉ quét các partition gần đây (var test_window_days, xem macros/test_window.sql);
+    # Chủ nhật quét toàn bộ lịch sử.
+    dbt_model_graph = load_dbt_model_graph(DBT_MANIFEST_PATH)
+    dbt_model_tasks = {}
 
-    # Task 4: Chạy dbt test (kiểm tra chất lượng dữ liệu)
-    dbt_test = BashOperator(
-        task_id='dbt_test',
-        bash_command=f"cd {DBT_PROJECT_DIR} && dbt test",
-        trigger_rule='all_done'
-    )
+    if dbt_model_graph:
+        with TaskGroup(group_id='dbt_models') as dbt_models:
+            for model_name in dbt_model_graph:
+                dbt_model_tasks[model_name] = BashOperator(
+                    task_id=model_name,
+                    bash_command=dbt_node_command(model_name),
+                    pool=DBT_POOL,
+                    retries=DBT_NODE_RETRIES,
+                    retry_delay=timedelta(minutes=5)
+                )
+            for model_name, parents in dbt_model_graph.items():
+                for parent in parents:
+                    dbt_model_tasks[parent] >> dbt_model_tasks[model_name]
+        dbt_seed >> dbt_models
+    else:
+        # Chưa có manifest (deploy lần đầu): chạy cả project như trước
+        dbt_run = BashOperator(
+            task_id='dbt_run',
+            bash_command=f"cd {DBT_PROJECT_DIR} && dbt run"
+        )
+
+        # Báo cáo hiệu năng từng model (run_results.json + BigQuery job stats)
+        # Chạy trước dbt_test vì dbt test ghi đè target/run_results.json
+        dbt_perf_report = BashOperator(
+            task_id='dbt_perf_report',
+            bash_command=(
+                f"python {TOOLS_DIR}/dbt_perf_report.py"
+                f" --run-results {DBT_PROJECT_DIR}/target/run_results.json"
+                f" --target prod --bq-table {DBT_PERF_HISTORY_TABLE} --enrich-jobs"
+            ),
+            trigger_rule='all_done'
+        )
+
+        # Task 4: Chạy dbt test (kiểm tra chất lượng dữ liệu)
+        dbt_test = BashOperator(
+            task_id='dbt_test',
+            bash_command=f"cd {DBT_PROJECT_DIR} && dbt test" + DBT_TEST_VARS,
+            trigger_rule='all_done'
+        )
+        dbt_seed >> dbt_run >> dbt_perf_report >> dbt_test
 
     # === BQML TASKS ===
 
+    # Task 5: Tạo / cập nhật stored procedures kiểm tra fingerprint dữ liệu train
+    # (các script train bỏ qua CREATE MODEL khi dữ liệu không đổi đáng kể, xem training_procedures.sql)
+    bqml_create_procedures = BigQueryInsertJobOperator(
+        task_id='bqml_create_procedures',
+        configuration={
+            "query": {
+                "query": read_sql_file(f"{BQML_SCRIPT_DIR}/training_procedures.sql"),
+                "useLegacySql": False,
+            }
+        },
+        gcp_conn_id='google_cloud_default',
+        location='US',
+        deferrable=BQ_DEFERRABLE,
+        poll_interval=BQ_POLL_INTERVAL
+    )
+
     # --- Pipeline 1: Demand Forecasting ---
 
     # Task 5a: Huấn luyện model dự báo nhu cầu (Demand Forecast)
@@ -91,7 +219,9 @@ def nyc_taxi_pipeline():
             }
         },
         gcp_conn_id='google_cloud_default',
-        location='US'
+        location='US',
+        deferrable=BQ_DEFERRABLE,
+        poll_interval=BQ_POLL_INTERVAL
     )
 
     # Task 6a: Chạy dự báo nhu cầu
@@ -104,7 +234,9 @@ def nyc_taxi_pipeline():
             }
         },
         gcp_conn_id='google_cloud_default',
-        location='US'
+        location='US',
+        deferrable=BQ_DEFERRABLE,
+        poll_interval=BQ_POLL_INTERVAL
     )
 
     # --- Pipeline 2: Fare Prediction ---
@@ -119,16 +251,23 @@ def nyc_taxi_pipeline():
             }
         },
         gcp_conn_id='google_cloud_default',
-        location='US'
+        location='US',
+        deferrable=BQ_DEFERRABLE,
+        poll_interval=BQ_POLL_INTERVAL
     )
 
     # --- Sắp xếp thứ tự các Task ---
-    # dbt tasks run sequentially
-    dbt_deps >> dbt_seed >> dbt_run >> dbt_test
+    dbt_deps >> dbt_seed
+
+    # BQML tasks chạy sau đúng các model dbt mà chúng đọc (hoặc sau dbt_test khi không có manifest)
+    for bqml_task in (bqml_train_demand, bqml_train_fare):
+        if dbt_model_tasks:
+            for model_name in BQML_UPSTREAM_MODELS[bqml_task.task_id]:
+                dbt_model_tasks[model_name] >> bqml_task
+        else:
+            dbt_test >> bqml_task
 
-    # BQML tasks run after dbt tests are done
-    dbt_test >> bqml_train_demand
-    dbt_test >> bqml_train_fare
+    bqml_create_procedures >> [bqml_train_demand, bqml_train_fare]
 
     # The demand forecast runs after the demand model is trained
     bqml_train_demand >> bqml_forecast_demand
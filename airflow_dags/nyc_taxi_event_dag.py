@@ -0,0 +1,91 @@
+# airflow_dags/nyc_taxi_event_dag.py
+# Chạy nyc-taxi-orchestrator khi có đủ dữ liệu streaming mới thay vì theo lịch cố định
+#
+# Mỗi POLL_INTERVAL: đọc số dòng của các bảng streaming từ metadata (partition_watch.py, không quét bảng),
+# so với lần trigger trước. Đủ dữ liệu mới + burst đã lắng xuống (hoặc đã chờ quá lâu) -> trigger
+# orchestrator (dbt build incremental + forecast). Trạng thái giữa các lần poll lưu trong Variable.
+
+import json
+from datetime import datetime, timedelta, timezone
+from airflow.decorators import dag, task
+from airflow.models.variable import Variable
+from airflow.operators.trigger_dagrun import TriggerDagRunOperator
+
+from partition_watch import (
+    DEFAULT_MAX_WAIT_SECONDS,
+    DEFAULT_MIN_NEW_ROWS,
+    DEFAULT_QUIET_SECONDS,
+    bigquery_snapshot,
+    decide,
+    sqlite_snapshot,
+)
+
+# --- Biến Cấu hình ---
+POLL_INTERVAL = timedelta(minutes=5)
+STATE_VARIABLE = "PARTITION_WATCH_STATE"
+# {"min_new_rows": {...}, "quiet_seconds": ..., "max_wait_seconds": ...}; thiếu key thì dùng mặc định
+WATCH_CONFIG = Variable.get("PARTITION_WATCH_CONFIG", {}, deserialize_json=True)
+# Đường dẫn SQLite thay cho metadata BigQuery (chạy local); để trống = BigQuery
+WATCH_SQLITE_PATH = Variable.get("PARTITION_WATCH_SQLITE", "")
+
+
+@dag(
+    dag_id='nyc-taxi-partition-watch',
+    start_date=datetime(2025, 1, 1),
+    schedule_interval=POLL_INTERVAL,
+    catchup=False,
+    max_active_runs=1,
+    tags=['nyc-taxi', 'sensor'],
+    render_template_as_native_obj=True # conf của trigger_orchestrator là dict, không phải string
+)
+def nyc_taxi_partition_watch():
+    """
+    Trigger layer cho nyc-taxi-orchestrator:
+    1. partition_delta: snapshot metadata + debounce, short-circuit khi chưa cần chạy.
+    2. trigger_orchestrator: chạy DAG chính (không chờ nó xong).
+    """
+
+    @task.short_circuit(task_id='partition_delta')
+    def partition_delta(ti=None):
+        min_new_rows = {**DEFAULT_MIN_NEW_ROWS, **WATCH_CONFIG.get("min_new_rows", {})}
+        tables = list(min_new_rows)
+        if WATCH_SQLITE_PATH:
+            snapshot = sqlite_snapshot(WATCH_SQLITE_PATH, tables)
+        else:
+            snapshot = bigquery_snapshot(tables)
+
+        state = Variable.get(STATE_VARIABLE, {}, deserialize_json=True)
+        now = datetime.now(timezone.utc)
+        trigger, new_state, new_rows = decide(
+            snapshot, state, now,
+            min_new_rows=min_new_rows,
+            quiet_seconds=WATCH_CONFIG.get("quiet_seconds", DEFAULT_QUIET_SECONDS),
+            max_wait_seconds=WATCH_CONFIG.get("max_wait_seconds", DEFAULT_MAX_WAIT_SECONDS),
+        )
+
+        # Quét test toàn bộ lịch sử ở lần trigger đầu tiên của mỗi tuần (thay cho Chủ nhật của lịch @daily)
+        week = now.strftime("%G-W%V")
+        test_full_history = trigger and state.get("full_history_week") != week
+        new_state["full_history_week"] = week if test_full_history else state.get("full_history_week")
+        Variable.set(STATE_VARIABLE, new_state, serialize_json=True)
+
+        print(f"Snapshot: {json.dumps(snapshot)} | new rows: {json.dumps(new_rows)} | trigger: {trigger}")
+        ti.xcom_push(key="conf", value={
+            "trigger": "partition_watch",
+            "new_rows": new_rows,
+            "test_full_history": test_full_history,
+        })
+        return trigger
+
+    # max_active_runs=1 ở orchestrator: trigger trong lúc đang chạy sẽ xếp hàng, không chạy chồng
+    trigger_orchestrator = TriggerDagRunOperator(
+        task_id='trigger_orchestrator',
+        trigger_dag_id='nyc-taxi-orchestrator',
+        conf="{{ ti.xcom_pull(task_ids='partition_delta', key='conf') }}",
+        wait_for_completion=False,
+    )
+
+    partition_delta() >> trigger_orchestrator
+
+# Gọi hàm để tạo DAG
+nyc_taxi_partition_watch()
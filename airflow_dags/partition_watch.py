@@ -0,0 +1,136 @@
+"""
+partition_watch.py
+Metadata-only watcher for new rows in the streaming tables (processed_trips, weather_api_data)
+
+Snapshots (row count per table) come from table metadata, never from scanning the tables:
+- BigQuery: tables.get -> num_rows + streaming buffer estimate (free, no query job)
+- SQLite stand-in for local runs: a `partitions` table shaped like INFORMATION_SCHEMA.PARTITIONS
+
+Debouncing: a run is triggered when some table gained at least its `min_new_rows` since the last
+trigger AND either nothing new arrived for `quiet_seconds` (the burst is over) or the first pending
+row has waited `max_wait_seconds` (continuous streaming / small trickles still trigger regularly).
+
+Usage (local stand-in):
+    python airflow_dags/partition_watch.py --sqlite watch.db --state watch_state.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+GCP_PROJECT_ID = os.environ.get("GCP_PROJECT", "nyc-taxi-project-477115")
+
+# Bảng được theo dõi -> số dòng mới tối thiểu để chạy pipeline
+DEFAULT_MIN_NEW_ROWS = {
+    "streaming.processed_trips": 5000,
+    "raw_data.weather_api_data": 6,   # ~6 giờ quan sát thời tiết
+}
+DEFAULT_QUIET_SECONDS = 15 * 60
+DEFAULT_MAX_WAIT_SECONDS = 6 * 3600
+
+
+# =====================
+# Snapshots
+# =====================
+def bigquery_snapshot(tables, project_id=GCP_PROJECT_ID):
+    """Row count per table from BigQuery table metadata (committed rows + streaming buffer)."""
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=project_id)
+    snapshot = {}
+    for table_name in tables:
+        table = client.get_table(f"{project_id}.{table_name}")
+        buffered = table.streaming_buffer.estimated_rows if table.streaming_buffer else 0
+        snapshot[table_name] = (table.num_rows or 0) + (buffered or 0)
+    return snapshot
+
+
+def sqlite_snapshot(path, tables):
+    """Row count per table from a local SQLite stand-in.
+
+    Schema: partitions(table_name TEXT, partition_id TEXT, total_rows INTEGER, last_modified TEXT)
+    """
+    con = sqlite3.connect(path)
+    try:
+        rows = dict(con.execute(
+            f"SELECT table_name, SUM(total_rows) FROM partitions "
+            f"WHERE table_name IN ({', '.join('?' for _ in tables)}) GROUP BY table_name",
+            list(tables),
+        ).fetchall())
+    finally:
+        con.close()
+    return {table_name: int(rows.get(table_name) or 0) for table_name in tables}
+
+
+# =====================
+# Debounced decision
+# =====================
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def decide(snapshot, state, now, min_new_rows=None, quiet_seconds=DEFAULT_QUIET_SECONDS,
+           max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS):
+    """Returns (trigger, new_state, new_rows) for one poll.
+
+    state = {"baseline": rows at last trigger, "last_seen": rows at last poll,
+             "last_change_at": iso time rows last changed, "first_pending_at": iso time of first pending row}
+    """
+    min_new_rows = min_new_rows or DEFAULT_MIN_NEW_ROWS
+    if not state or "baseline" not in state:
+        # Lần chạy đầu: lấy trạng thái hiện tại làm mốc
+        return False, {"baseline": snapshot, "last_seen": snapshot,
+                       "last_change_at": None, "first_pending_at": None}, {}
+
+    # Partition hết hạn (partition_expiration_days) làm số dòng giảm -> hạ mốc theo
+    baseline = {table: min(state["baseline"].get(table, 0), rows) for table, rows in snapshot.items()}
+    new_rows = {table: rows - baseline[table] for table, rows in snapshot.items()}
+
+    last_change_at = _parse_time(state.get("last_change_at"))
+    if snapshot != state.get("last_seen"):
+        last_change_at = now
+    first_pending_at = _parse_time(state.get("first_pending_at"))
+    if any(new_rows.values()) and first_pending_at is None:
+        first_pending_at = now
+
+    enough_rows = any(new_rows[table] >= min_new_rows.get(table, 1) for table in new_rows)
+    quiet = last_change_at is not None and (now - last_change_at).total_seconds() >= quiet_seconds
+    waited_too_long = first_pending_at is not None and (now - first_pending_at).total_seconds() >= max_wait_seconds
+    trigger = (enough_rows and quiet) or waited_too_long
+
+    if trigger:
+        baseline, first_pending_at = dict(snapshot), None
+    new_state = {
+        "baseline": baseline,
+        "last_seen": snapshot,
+        "last_change_at": last_change_at.isoformat() if last_change_at else None,
+        "first_pending_at": first_pending_at.isoformat() if first_pending_at else None,
+    }
+    return trigger, new_state, new_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll the watched tables once and print the trigger decision")
+    parser.add_argument("--sqlite", help="SQLite stand-in for BigQuery metadata (default: BigQuery)")
+    parser.add_argument("--state", default="partition_watch_state.json", help="JSON file with the watcher state")
+    parser.add_argument("--quiet-seconds", type=int, default=DEFAULT_QUIET_SECONDS)
+    parser.add_argument("--max-wait-seconds", type=int, default=DEFAULT_MAX_WAIT_SECONDS)
+    args = parser.parse_args()
+
+    tables = list(DEFAULT_MIN_NEW_ROWS)
+    snapshot = sqlite_snapshot(args.sqlite, tables) if args.sqlite else bigquery_snapshot(tables)
+    state = {}
+    if os.path.exists(args.state):
+        with open(args.state, "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+    trigger, state, new_rows = decide(snapshot, state, datetime.now(timezone.utc),
+                                      quiet_seconds=args.quiet_seconds, max_wait_seconds=args.max_wait_seconds)
+    with open(args.state, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    print(json.dumps({"trigger": trigger, "new_rows": new_rows, "snapshot": snapshot}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+test_partition_watch.py
+Debounce logic of partition_watch.decide() driven by the SQLite stand-in (partitions table)
+
+Run:
+    python -m pytest airflow_dags/test_partition_watch.py -q
+"""
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from partition_watch import decide, sqlite_snapshot
+
+TRIPS = "streaming.processed_trips"
+WEATHER = "raw_data.weather_api_data"
+TABLES = [TRIPS, WEATHER]
+MIN_NEW_ROWS = {TRIPS: 5000, WEATHER: 6}
+QUIET = 15 * 60
+MAX_WAIT = 6 * 3600
+T0 = datetime(2025, 12, 3, 8, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "watch.db")
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE partitions (table_name TEXT, partition_id TEXT, total_rows INTEGER, last_modified TEXT)")
+    con.executemany("INSERT INTO partitions VALUES (?, ?, ?, ?)", [
+        (TRIPS, "20251201", 10000, T0.isoformat()),
+        (TRIPS, "20251202", 10000, T0.isoformat()),
+        (WEATHER, "20251202", 24, T0.isoformat()),
+    ])
+    con.commit()
+    con.close()
+    return path
+
+
+def set_rows(path, table_name, partition_id, total_rows):
+    """Creates / updates one partition (total_rows = 0 drops it, like partition expiry)."""
+    con = sqlite3.connect(path)
+    con.execute("DELETE FROM partitions WHERE table_name = ? AND partition_id = ?", (table_name, partition_id))
+    if total_rows:
+        con.execute("INSERT INTO partitions VALUES (?, ?, ?, ?)", (table_name, partition_id, total_rows, T0.isoformat()))
+    con.commit()
+    con.close()
+
+
+def poll(path, state, now):
+    return decide(sqlite_snapshot(path, TABLES), state, now, MIN_NEW_ROWS, QUIET, MAX_WAIT)
+
+
+def test_snapshot_sums_partitions(db):
+    assert sqlite_snapshot(db, TABLES) == {TRIPS: 20000, WEATHER: 24}
+    assert sqlite_snapshot(db, ["streaming.missing"]) == {"streaming.missing": 0}
+
+
+def test_first_run_only_sets_the_baseline(db):
+    trigger, state, new_rows = poll(db, {}, T0)
+    assert not trigger
+    assert new_rows == {}
+    assert state["baseline"] == {TRIPS: 20000, WEATHER: 24}
+    assert state["last_change_at"] is None and state["first_pending_at"] is None
+
+
+def test_triggers_after_the_quiet_window(db):
+    _, state, _ = poll(db, {}, T0)
+    set_rows(db, TRIPS, "20251203", 6000)
+
+    # Burst vừa tới: đủ dòng nhưng chưa yên lặng
+    trigger, state, new_rows = poll(db, state, T0 + timedelta(minutes=5))
+    assert not trigger
+    assert new_rows[TRIPS] == 6000
+
+    trigger, state, _ = poll(db, state, T0 + timedelta(minutes=5 + 14))
+    assert not trigger
+
+    trigger, state, new_rows = poll(db, state, T0 + timedelta(minutes=5 + 15))
+    assert trigger
+    assert new_rows[TRIPS] == 6000
+    assert state["baseline"][TRIPS] == 26000
+    assert state["first_pending_at"] is None
+
+    # Đã chạy: không có dòng mới thì không chạy lại
+    trigger, _, new_rows = poll(db, state, T0 + timedelta(hours=1))
+    assert not trigger
+    assert new_rows[TRIPS] == 0
+
+
+def test_quiet_window_restarts_on_new_rows(db):
+    _, state, _ = poll(db, {}, T0)
+    set_rows(db, TRIPS, "20251203", 6000)
+    _, state, _ = poll(db, state, T0 + timedelta(minutes=5))
+    set_rows(db, TRIPS, "20251203", 6500)
+    trigger, state, _ = poll(db, state, T0 + timedelta(minutes=15))
+    assert not trigger
+
+    # 15 phút tính từ lần thay đổi cuối (phút 15), không phải từ dòng đầu tiên
+    trigger, _, _ = poll(db, state, T0 + timedelta(minutes=25))
+    assert not trigger
+    trigger, _, _ = poll(db, state, T0 + timedelta(minutes=30))
+    assert trigger
+
+
+def test_small_change_does_not_trigger_when_quiet(db):
+    _, state, _ = poll(db, {}, T0)
+    set_rows(db, TRIPS, "20251203", 100)
+    _, state, _ = poll(db, state, T0 + timedelta(minutes=5))
+    trigger, _, new_rows = poll(db, state, T0 + timedelta(hours=1))
+    assert not trigger
+    assert new_rows[TRIPS] == 100
+
+
+def test_max_wait_triggers_a_continuous_trickle(db):
+    _, state, _ = poll(db, {}, T0)
+    rows = 0
+    now = T0
+    triggered_at = None
+    # 50 dòng mỗi 10 phút: không bao giờ đủ min_new_rows, cũng không bao giờ yên lặng 15 phút
+    for _ in range(40):
+        now += timedelta(minutes=10)
+        rows += 50
+        set_rows(db, TRIPS, "20251203", rows)
+        trigger, state, _ = poll(db, state, now)
+        if trigger:
+            triggered_at = now
+            break
+    # Dòng chờ đầu tiên thấy ở phút 10 -> chạy khi đã chờ đủ 6 giờ
+    assert triggered_at == T0 + timedelta(minutes=10) + timedelta(seconds=MAX_WAIT)
+    assert state["baseline"][TRIPS] == 20000 + rows
+
+
+def test_partition_expiry_lowers_the_baseline(db):
+    _, state, _ = poll(db, {}, T0)
+
+    # Partition cũ hết hạn: số dòng giảm, không tính là dòng mới
+    set_rows(db, TRIPS, "20251201", 0)
+    trigger, state, new_rows = poll(db, state, T0 + timedelta(minutes=5))
+    assert not trigger
+    assert new_rows[TRIPS] == 0
+    assert state["baseline"][TRIPS] == 10000
+    assert state["first_pending_at"] is None
+
+    # Dòng mới được đếm từ mốc đã hạ (tổng 16000 < mốc cũ 20000 vẫn kích hoạt)
+    set_rows(db, TRIPS, "20251203", 6000)
+    _, state, new_rows = poll(db, state, T0 + timedelta(minutes=10))
+    assert new_rows[TRIPS] == 6000
+    trigger, _, _ = poll(db, state, T0 + timedelta(minutes=25))
+    assert trigger
@@ -1,54 +1,244 @@
 -- bqml_scripts/run_forecast.sql
 -- File này sẽ được gọi bởi Airflow SAU KHI train model thành công.
+-- Dự báo đệ quy 1-48 giờ tới cho mọi ô H3, tính từ giờ cuối cùng có dữ liệu (forecast_origin):
+--   mỗi bước h = 1..48 dựng feature của giờ origin + h cho TẤT CẢ các ô trong một query
+--   (lag / rolling avg lấy từ chuỗi quan sát + các dự báo của bước trước), gọi ML.PREDICT một lần,
+--   rồi nối dự báo vào chuỗi để bước sau dùng làm lag.
+-- Kết quả MERGE vào ml_predictions.hourly_demand_forecast (partition theo ngày của timestamp_hour,
+-- cluster theo pickup_h3_id), giữ lịch sử theo model_version / horizon để theo dõi độ chính xác;
+-- actual_pickups được điền khi giờ đó có dữ liệu thật.
 
--- Xóa bảng cũ (nếu có) và tạo bảng dự báo mới
-CREATE OR REPLACE TABLE `nyc-taxi-project-477115.ml_predictions.hourly_demand_forecast`
-AS
-SELECT 
-    f.timestamp_hour,
-    f.pickup_h3_id,
-    f.total_pickups AS actual_pickups,
-    p.predicted_total_pickups,
+DECLARE max_horizon INT64 DEFAULT 48;
+DECLARE model_version STRING;
+DECLARE generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP();
+DECLARE forecast_origin TIMESTAMP;
+DECLARE step INT64 DEFAULT 1;
+
+-- Phiên bản model = lần train gần nhất trong model_training_log (training_procedures.sql);
+-- lần train bị bỏ qua thì giữ nguyên phiên bản cũ
+SET model_version = (
+    SELECT FORMAT('timeseries_hotspot_model@%s', FORMAT_TIMESTAMP('%Y%m%dT%H%M%S', MAX(run_at)))
+    FROM `nyc-taxi-project-477115.ml_models.model_training_log`
+    WHERE model_name = 'timeseries_hotspot_model'
+      AND status = 'trained'
+);
+SET model_version = IFNULL(model_version, 'timeseries_hotspot_model@unversioned');
+
+SET forecast_origin = (
+    SELECT MAX(timestamp_hour)
+    FROM `nyc-taxi-project-477115.facts.fct_hourly_features`
+);
+
+-- Bước 1: Chuỗi nhu cầu 168 giờ gần nhất của mỗi ô (đủ cho LAG 1 tuần);
+-- fct_hourly_features đã bù giờ 0 chuyến nên mỗi ô có đủ mọi giờ
+CREATE TEMP TABLE demand_series AS
+SELECT
+    pickup_h3_id,
+    timestamp_hour,
+    CAST(total_pickups AS FLOAT64) AS pickups
+FROM
+    `nyc-taxi-project-477115.facts.fct_hourly_features`
+WHERE
+    timestamp_hour > TIMESTAMP_SUB(forecast_origin, INTERVAL 168 HOUR);
+
+-- Bước 2: Feature lịch / thời tiết của các giờ tương lai (giống nhau cho mọi ô)
+-- Thời tiết: dim_weather nếu có ngày đó, không thì giữ giá trị của forecast_origin (persistence)
+CREATE TEMP TABLE future_hours AS
+WITH hours AS (
+    SELECT
+        horizon,
+        TIMESTAMP_ADD(forecast_origin, INTERVAL horizon HOUR) AS timestamp_hour
+    FROM UNNEST(GENERATE_ARRAY(1, max_horizon)) AS horizon
+),
+last_observed AS (
+    SELECT avg_temp_celsius, total_precipitation_mm, had_rain, had_snow
+    FROM `nyc-taxi-project-477115.facts.fct_hourly_features`
+    WHERE timestamp_hour = forecast_origin
+    LIMIT 1
+)
+SELECT
+    hours.horizon,
+    hours.timestamp_hour,
+    EXTRACT(HOUR FROM hours.timestamp_hour) AS hour_of_day,
+    EXTRACT(DAYOFWEEK FROM hours.timestamp_hour) AS day_of_week,
+    EXTRACT(MONTH FROM hours.timestamp_hour) AS month,
+    EXTRACT(QUARTER FROM hours.timestamp_hour) AS quarter,
+    EXTRACT(DAYOFYEAR FROM hours.timestamp_hour) AS day_of_year,
+    EXTRACT(DAYOFWEEK FROM hours.timestamp_hour) IN (1, 7) AS is_weekend,
+    IFNULL(dt.is_holiday, FALSE) AS is_holiday,
+    IFNULL(weather.avg_temp_celsius, last_observed.avg_temp_celsius) AS avg_temp_celsius,
+    IFNULL(weather.total_precipitation_mm, last_observed.total_precipitation_mm) AS total_precipitation_mm,
+    IFNULL(weather.had_rain, last_observed.had_rain) AS had_rain,
+    IFNULL(weather.had_snow, last_observed.had_snow) AS had_snow
+FROM hours
+CROSS JOIN last_observed
+LEFT JOIN `nyc-taxi-project-477115.dimensions.dim_datetime` dt
+    ON dt.full_date = DATE(hours.timestamp_hour)
+LEFT JOIN `nyc-taxi-project-477115.dimensions.dim_weather` weather
+    ON weather.weather_date = DATE(hours.timestamp_hour);
+
+CREATE TEMP TABLE forecasts (
+    pickup_h3_id STRING,
+    timestamp_hour TIMESTAMP,
+    horizon INT64,
+    predicted_total_pickups FLOAT64
+);
+
+-- Bước 3: Dự báo đệ quy, mỗi vòng một giờ cho toàn bộ các ô
+-- avg_pickups_7h / avg_pickups_24h / pickups_change_24h lúc train có chứa chính giờ cần dự báo
+-- (ROWS ... AND CURRENT ROW); khi dự báo giờ đó chưa biết nên dùng giá trị giờ trước làm xấp xỉ.
+WHILE step <= max_horizon DO
+    INSERT INTO forecasts
+    SELECT
+        pickup_h3_id,
+        timestamp_hour,
+        step,
+        GREATEST(predicted_total_pickups, 0)
+    FROM
+        ML.PREDICT(
+            MODEL `nyc-taxi-project-477115.ml_models.timeseries_hotspot_model`,
+            (
+                WITH lags AS (
+                    SELECT
+                        series.pickup_h3_id,
+                        MAX(IF(series.timestamp_hour = TIMESTAMP_SUB(target.timestamp_hour, INTERVAL 1 HOUR), series.pickups, NULL)) AS pickups_1h_ago,
+                        MAX(IF(series.timestamp_hour = TIMESTAMP_SUB(target.timestamp_hour, INTERVAL 24 HOUR), series.pickups, NULL)) AS pickups_24h_ago,
+                        MAX(IF(series.timestamp_hour = TIMESTAMP_SUB(target.timestamp_hour, INTERVAL 168 HOUR), series.pickups, NULL)) AS pickups_1week_ago,
+                        SUM(IF(series.timestamp_hour >= TIMESTAMP_SUB(target.timestamp_hour, INTERVAL 6 HOUR), series.pickups, 0)) AS sum_6h,
+                        COUNTIF(series.timestamp_hour >= TIMESTAMP_SUB(target.timestamp_hour, INTERVAL 6 HOUR)) AS n_6h,
+                        SUM(IF(series.timestamp_hour >= TIMESTAMP_SUB(target.timestamp_hour, INTERVAL 23 HOUR), series.pickups, 0)) AS sum_23h,
+                        COUNTIF(series.timestamp_hour >= TIMESTAMP_SUB(target.timestamp_hour, INTERVAL 23 HOUR)) AS n_23h
+                    FROM (
+                        SELECT pickup_h3_id, timestamp_hour, pickups FROM demand_series
+                        UNION ALL
+                        SELECT pickup_h3_id, timestamp_hour, predicted_total_pickups FROM forecasts
+                    ) series
+                    CROSS JOIN (SELECT timestamp_hour FROM future_hours WHERE horizon = step) target
+                    WHERE series.timestamp_hour >= TIMESTAMP_SUB(target.timestamp_hour, INTERVAL 168 HOUR)
+                    GROUP BY series.pickup_h3_id
+                )
+                SELECT
+                    future.timestamp_hour,
+                    lags.pickup_h3_id,
+                    future.hour_of_day,
+                    future.day_of_week,
+                    CAST(ROUND(lags.pickups_1h_ago) AS INT64) AS pickups_1h_ago,
+                    CAST(ROUND(lags.pickups_24h_ago) AS INT64) AS pickups_24h_ago,
+                    CAST(ROUND(lags.pickups_1week_ago) AS INT64) AS pickups_1week_ago,
+                    (lags.sum_6h + lags.pickups_1h_ago) / (lags.n_6h + 1) AS avg_pickups_7h,
+                    (lags.sum_23h + lags.pickups_1h_ago) / (lags.n_23h + 1) AS avg_pickups_24h,
+                    future.avg_temp_celsius,
+                    future.total_precipitation_mm,
+                    future.had_rain,
+                    future.had_snow,
+                    future.is_weekend,
+                    future.is_holiday,
+                    CAST(ROUND(lags.pickups_1h_ago - lags.pickups_24h_ago) AS INT64) AS pickups_change_24h,
+                    CASE
+                        WHEN future.had_rain AND future.hour_of_day BETWEEN 7 AND 9 THEN 1
+                        WHEN future.had_rain AND future.hour_of_day BETWEEN 17 AND 19 THEN 1
+                        ELSE 0
+                    END AS rain_during_rush_hour,
+                    future.month,
+                    future.quarter,
+                    future.day_of_year
+                FROM lags
+                CROSS JOIN (SELECT * FROM future_hours WHERE horizon = step) future
+            )
+        );
+    SET step = step + 1;
+END WHILE;
+
+-- Bước 4: Bảng dự báo (partition theo giờ dự báo, cluster theo ô)
+CREATE SCHEMA IF NOT EXISTS `nyc-taxi-project-477115.ml_predictions`;
+
+-- Bảng cũ (CREATE OR REPLACE, không partition, không model_version) -> đổi tên để giữ lại, tạo bảng mới
+IF EXISTS (
+    SELECT 1
+    FROM `nyc-taxi-project-477115.ml_predictions.INFORMATION_SCHEMA.TABLES`
+    WHERE table_name = 'hourly_demand_forecast'
+) AND NOT EXISTS (
+    SELECT 1
+    FROM `nyc-taxi-project-477115.ml_predictions.INFORMATION_SCHEMA.COLUMNS`
+    WHERE table_name = 'hourly_demand_forecast'
+      AND column_name = 'model_version'
+) THEN
+    ALTER TABLE `nyc-taxi-project-477115.ml_predictions.hourly_demand_forecast`
+    RENAME TO hourly_demand_forecast_legacy;
+END IF;
+
+CREATE TABLE IF NOT EXISTS `nyc-taxi-project-477115.ml_predictions.hourly_demand_forecast` (
+    timestamp_hour TIMESTAMP,
+    pickup_h3_id STRING,
+    model_version STRING,
+    forecast_origin TIMESTAMP,    -- giờ cuối cùng có dữ liệu thật khi dự báo
+    horizon_hours INT64,          -- timestamp_hour - forecast_origin (1..48)
+    generated_at TIMESTAMP,
+    actual_pickups INT64,         -- NULL cho tới khi giờ đó có dữ liệu
+    predicted_total_pickups FLOAT64,
     -- Note: BOOSTED_TREE_REGRESSOR doesn't provide confidence intervals
     -- Include key features for analysis
-    f.avg_temp_celsius,
-    f.had_rain,
-    f.is_weekend,
-    f.is_holiday
-FROM
-    `nyc-taxi-project-477115.facts.fct_hourly_features` f
-INNER JOIN
-    ML.PREDICT(
-        MODEL `nyc-taxi-project-477115.ml_models.timeseries_hotspot_model`,
-        (
-            SELECT
-                pickup_h3_id,
-                EXTRACT(HOUR FROM timestamp_hour) AS hour_of_day,
-                EXTRACT(DAYOFWEEK FROM timestamp_hour) AS day_of_week,
-                pickups_1h_ago,
-                pickups_24h_ago,
-                pickups_1week_ago,
-                avg_pickups_7h,
-                avg_pickups_24h,
-                avg_temp_celsius,
-                total_precipitation_mm,
-                had_rain,
-                had_snow,
-                is_weekend,
-                is_holiday,
-                pickups_change_24h,
-                rain_during_rush_hour,
-                month,
-                quarter,
-                day_of_year
-            FROM
-                `nyc-taxi-project-477115.facts.fct_hourly_features`
-            WHERE
-                -- Predict cho 24 giờ gần nhất (hoặc data mới nhất)
-                timestamp_hour >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 24 HOUR)
-                AND pickups_24h_ago IS NOT NULL
-        )
-    ) p
-ON f.pickup_h3_id = p.pickup_h3_id
-    AND EXTRACT(HOUR FROM f.timestamp_hour) = p.hour_of_day
-    AND EXTRACT(DAYOFWEEK FROM f.timestamp_hour) = p.day_of_week;
\ No newline at end of file
+    avg_temp_celsius FLOAT64,
+    had_rain BOOL,
+    is_weekend BOOL,
+    is_holiday BOOL
+)
+PARTITION BY TIMESTAMP_TRUNC(timestamp_hour, DAY)
+CLUSTER BY pickup_h3_id;
+
+-- Bảng tạo trước khi có dự báo đệ quy
+ALTER TABLE `nyc-taxi-project-477115.ml_predictions.hourly_demand_forecast`
+    ADD COLUMN IF NOT EXISTS forecast_origin TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS horizon_hours INT64;
+
+-- Một dòng cho mỗi (giờ, ô, model_version, horizon): chạy lại cùng origin thì cập nhật dự báo
+MERGE `nyc-taxi-project-477115.ml_predictions.hourly_demand_forecast` T
+USING (
+    SELECT
+        forecasts.timestamp_hour,
+        forecasts.pickup_h3_id,
+        model_version AS model_version,
+        forecast_origin AS forecast_origin,
+        forecasts.horizon AS horizon_hours,
+        generated_at AS generated_at,
+        forecasts.predicted_total_pickups,
+        future.avg_temp_celsius,
+        future.had_rain,
+        future.is_weekend,
+        future.is_holiday
+    FROM forecasts
+    JOIN future_hours future
+        ON future.horizon = forecasts.horizon
+) S
+ON T.pickup_h3_id = S.pickup_h3_id
+    AND T.timestamp_hour = S.timestamp_hour
+    AND T.model_version = S.model_version
+    AND T.horizon_hours = S.horizon_hours
+    -- Chỉ quét các partition đang được ghi
+    AND T.timestamp_hour > forecast_origin
+WHEN MATCHED THEN UPDATE SET
+    forecast_origin = S.forecast_origin,
+    generated_at = S.generated_at,
+    predicted_total_pickups = S.predicted_total_pickups,
+    avg_temp_celsius = S.avg_temp_celsius,
+    had_rain = S.had_rain,
+    is_weekend = S.is_weekend,
+    is_holiday = S.is_holiday
+WHEN NOT MATCHED THEN INSERT (
+    timestamp_hour, pickup_h3_id, model_version, forecast_origin, horizon_hours, generated_at,
+    actual_pickups, predicted_total_pickups, avg_temp_celsius, had_rain, is_weekend, is_holiday
+) VALUES (
+    S.timestamp_hour, S.pickup_h3_id, S.model_version, S.forecast_origin, S.horizon_hours, S.generated_at,
+    NULL, S.predicted_total_pickups, S.avg_temp_celsius, S.had_rain, S.is_weekend, S.is_holiday
+);
+
+-- Bước 5: Điền actual_pickups cho các dự báo trước đây mà giờ đó nay đã có dữ liệu
+UPDATE `nyc-taxi-project-477115.ml_predictions.hourly_demand_forecast` T
+SET actual_pickups = f.total_pickups
+FROM `nyc-taxi-project-477115.facts.fct_hourly_features` f
+WHERE T.pickup_h3_id = f.pickup_h3_id
+    AND T.timestamp_hour = f.timestamp_hour
+    AND T.actual_pickups IS NULL
+    AND T.timestamp_hour > TIMESTAMP_SUB(forecast_origin, INTERVAL 14 DAY)
+    AND T.timestamp_hour <= forecast_origin
+    AND f.timestamp_hour > TIMESTAMP_SUB(forecast_origin, INTERVAL 14 DAY);
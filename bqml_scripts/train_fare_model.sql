@@ -1,10 +1,150 @@
 -- bqml_scripts/train_fare_model.sql
+-- Huấn luyện model giá cước trên fct_fare_training_sample (stratified sample, split cố định theo trip_id)
+-- rồi ghi chi phí train (bytes / slot-ms / thời gian) cạnh accuracy trên tập TEST vào ml_models.fare_training_runs
+-- Bỏ qua train lại khi fct_fare_prediction_training không đổi đáng kể (bqml_scripts/training_procedures.sql);
+-- đổi tham số sample (fare_training_sample_fraction, ...) thì đặt force_retrain = TRUE
+
+DECLARE force_retrain BOOL DEFAULT FALSE;
+DECLARE should_train BOOL;
+DECLARE input_partitions ARRAY<STRUCT<table_name STRING, partition_id STRING, total_rows INT64, last_modified_time TIMESTAMP>>;
+DECLARE changed_rows INT64;
+
+-- Bước 0: Fingerprint dữ liệu train
+CALL `nyc-taxi-project-477115.ml_models.check_training_inputs`(
+  'fare_estimation_model', ['fct_fare_prediction_training'],
+  0.001, 7, force_retrain, @@script.job_id,
+  should_train, input_partitions, changed_rows
+);
+
+IF NOT should_train THEN
+  RETURN;
+END IF;
+
+-- Bước 1: Train trên TRAIN, early stopping trên EVAL (data_split_col = is_eval)
 CREATE OR REPLACE MODEL `nyc-taxi-project-477115.ml_models.fare_estimation_model`
 OPTIONS(
   model_type='BOOSTED_TREE_REGRESSOR',
-  input_label_cols=['fare_amount']
+  input_label_cols=['fare_amount'],
+  data_split_method='CUSTOM',
+  data_split_col='is_eval'
 ) AS
 SELECT
-  *
+  fare_amount,
+  passenger_count,
+  trip_distance,
+  trip_duration_seconds,
+  hour_of_day,
+  day_of_week,
+  is_holiday,
+  is_weekend,
+  pickup_h3_id,
+  dropoff_h3_id,
+  avg_temp_celsius,
+  total_precipitation_mm,
+  had_rain,
+  had_snow,
+  historical_demand,
+  data_split = 'EVAL' AS is_eval
 FROM
-  `nyc-taxi-project-477115.facts.fct_fare_prediction_training`;
+  `nyc-taxi-project-477115.facts.fct_fare_training_sample`
+WHERE
+  data_split IN ('TRAIN', 'EVAL');
+
+-- Bước 2: Bảng lịch sử các lần train
+CREATE TABLE IF NOT EXISTS `nyc-taxi-project-477115.ml_models.fare_training_runs` (
+  trained_at TIMESTAMP,
+  model_name STRING,
+  script_job_id STRING,
+  training_rows INT64,        -- TRAIN + EVAL trong sample
+  test_rows INT64,
+  sampled_fraction FLOAT64,   -- số dòng sample / số dòng fct_fare_prediction_training
+  bytes_processed INT64,      -- của job CREATE MODEL
+  bytes_billed INT64,
+  slot_ms INT64,
+  training_seconds FLOAT64,
+  mean_absolute_error FLOAT64,
+  root_mean_squared_error FLOAT64,
+  r2_score FLOAT64
+)
+PARTITION BY DATE(trained_at);
+
+-- Bước 3: Chi phí job CREATE MODEL (job con của script này) + accuracy trên TEST
+INSERT INTO `nyc-taxi-project-477115.ml_models.fare_training_runs`
+WITH training_job AS (
+  SELECT
+    total_bytes_processed,
+    total_bytes_billed,
+    total_slot_ms,
+    TIMESTAMP_DIFF(end_time, start_time, MILLISECOND) / 1000 AS training_seconds
+  FROM
+    `nyc-taxi-project-477115.region-us.INFORMATION_SCHEMA.JOBS_BY_PROJECT`
+  WHERE
+    parent_job_id = @@script.job_id
+    AND statement_type = 'CREATE_MODEL'
+  ORDER BY creation_time DESC
+  LIMIT 1
+),
+sample_rows AS (
+  SELECT
+    COUNTIF(data_split IN ('TRAIN', 'EVAL')) AS training_rows,
+    COUNTIF(data_split = 'TEST') AS test_rows,
+    COUNT(*) AS sample_rows
+  FROM
+    `nyc-taxi-project-477115.facts.fct_fare_training_sample`
+),
+evaluation AS (
+  SELECT *
+  FROM ML.EVALUATE(
+    MODEL `nyc-taxi-project-477115.ml_models.fare_estimation_model`,
+    (
+      SELECT
+        fare_amount,
+        passenger_count,
+        trip_distance,
+        trip_duration_seconds,
+        hour_of_day,
+        day_of_week,
+        is_holiday,
+        is_weekend,
+        pickup_h3_id,
+        dropoff_h3_id,
+        avg_temp_celsius,
+        total_precipitation_mm,
+        had_rain,
+        had_snow,
+        historical_demand
+      FROM
+        `nyc-taxi-project-477115.facts.fct_fare_training_sample`
+      WHERE
+        data_split = 'TEST'
+    )
+  )
+)
+SELECT
+  CURRENT_TIMESTAMP() AS trained_at,
+  'fare_estimation_model' AS model_name,
+  @@script.job_id AS script_job_id,
+  sample_rows.training_rows,
+  sample_rows.test_rows,
+  SAFE_DIVIDE(
+    sample_rows.sample_rows,
+    (SELECT COUNT(*) FROM `nyc-taxi-project-477115.facts.fct_fare_prediction_training`)
+  ) AS sampled_fraction,
+  training_job.total_bytes_processed AS bytes_processed,
+  training_job.total_bytes_billed AS bytes_billed,
+  training_job.total_slot_ms AS slot_ms,
+  training_job.training_seconds,
+  evaluation.mean_absolute_error,
+  SQRT(evaluation.mean_squared_error) AS root_mean_squared_error,
+  evaluation.r2_score
+FROM
+  sample_rows
+CROSS JOIN
+  evaluation
+LEFT JOIN
+  training_job ON TRUE;
+
+-- Bước 4: Lưu fingerprint cùng phiên bản model
+CALL `nyc-taxi-project-477115.ml_models.log_training_run`(
+  'fare_estimation_model', @@script.job_id, input_partitions, changed_rows
+);
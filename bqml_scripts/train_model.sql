@@ -1,5 +1,21 @@
 -- bqml_scripts/train_model.sql
 -- File này sẽ được gọi bởi Airflow SAU KHI dbt run thành công.
+-- Bỏ qua train lại khi fct_hourly_features không đổi đáng kể (bqml_scripts/training_procedures.sql)
+
+DECLARE force_retrain BOOL DEFAULT FALSE;
+DECLARE should_train BOOL;
+DECLARE input_partitions ARRAY<STRUCT<table_name STRING, partition_id STRING, total_rows INT64, last_modified_time TIMESTAMP>>;
+DECLARE changed_rows INT64;
+
+CALL `nyc-taxi-project-477115.ml_models.check_training_inputs`(
+    'timeseries_hotspot_model', ['fct_hourly_features'],
+    0.001, 7, force_retrain, @@script.job_id,
+    should_train, input_partitions, changed_rows
+);
+
+IF NOT should_train THEN
+    RETURN;
+END IF;
 
 CREATE OR REPLACE MODEL `nyc-taxi-project-477115.ml_models.timeseries_hotspot_model`
 OPTIONS(
@@ -55,4 +71,8 @@ WHERE
     -- Loại bỏ rows có NULL trong lag features (first few rows)
     pickups_1h_ago IS NOT NULL
     AND pickups_24h_ago IS NOT NULL
-    AND pickups_1week_ago IS NOT NULL
\ No newline at end of file
+    AND pickups_1week_ago IS NOT NULL;
+
+CALL `nyc-taxi-project-477115.ml_models.log_training_run`(
+    'timeseries_hotspot_model', @@script.job_id, input_partitions, changed_rows
+);
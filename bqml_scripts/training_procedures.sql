@@ -0,0 +1,135 @@
+-- bqml_scripts/training_procedures.sql
+-- Stored procedures dùng chung cho các script train BQML (train_model.sql, train_fare_model.sql)
+-- Bỏ qua việc train lại khi dữ liệu train không thay đổi đáng kể so với lần train gần nhất.
+--
+-- Fingerprint của dữ liệu train = (partition_id, total_rows, last_modified_time) của từng partition
+-- trong INFORMATION_SCHEMA.PARTITIONS -> chỉ đọc metadata, không quét bảng.
+-- Mỗi lần chạy (trained / skipped) ghi một dòng vào ml_models.model_training_log.
+--
+-- Chạy lại file này trước các script train (Airflow: task bqml_create_procedures;
+-- Cloud Workflow: orchestration/workflows/deploy_workflow.ps1). CREATE OR REPLACE nên chạy nhiều lần không sao.
+
+CREATE SCHEMA IF NOT EXISTS `nyc-taxi-project-477115.ml_models`;
+
+CREATE TABLE IF NOT EXISTS `nyc-taxi-project-477115.ml_models.model_training_log` (
+  run_at TIMESTAMP,
+  model_name STRING,
+  status STRING,                -- 'trained' | 'skipped'
+  script_job_id STRING,
+  -- Fingerprint dữ liệu train lưu cùng phiên bản model
+  input_partitions ARRAY<STRUCT<table_name STRING, partition_id STRING, total_rows INT64, last_modified_time TIMESTAMP>>,
+  total_rows INT64,
+  changed_rows INT64,           -- tổng |chênh lệch số dòng| theo partition so với lần train gần nhất
+  slot_ms INT64,                -- trained: slot-ms / bytes của job CREATE MODEL
+  bytes_billed INT64,
+  saved_slot_ms INT64,          -- skipped: slot-ms / bytes của lần train gần nhất (compute tiết kiệm được)
+  saved_bytes_billed INT64
+)
+PARTITION BY DATE(run_at);
+
+
+-- Kiểm tra xem có cần train lại model_id không
+--   input_tables       : các bảng trong dataset facts mà model đọc
+--   min_change_ratio   : tỉ lệ dòng thay đổi tối thiểu để train lại (vd. 0.001 = 0.1%)
+--   max_model_age_days : model cũ hơn số ngày này thì luôn train lại
+--   force_retrain      : bỏ qua fingerprint (vd. sau khi đổi feature / tham số sample)
+-- Khi bỏ qua, procedure tự ghi dòng 'skipped' vào model_training_log.
+CREATE OR REPLACE PROCEDURE `nyc-taxi-project-477115.ml_models.check_training_inputs`(
+  model_id STRING,
+  input_tables ARRAY<STRING>,
+  min_change_ratio FLOAT64,
+  max_model_age_days INT64,
+  force_retrain BOOL,
+  script_job_id STRING,
+  OUT should_train BOOL,
+  OUT input_partitions ARRAY<STRUCT<table_name STRING, partition_id STRING, total_rows INT64, last_modified_time TIMESTAMP>>,
+  OUT changed_rows INT64
+)
+BEGIN
+  DECLARE last_run STRUCT<
+    run_at TIMESTAMP,
+    input_partitions ARRAY<STRUCT<table_name STRING, partition_id STRING, total_rows INT64, last_modified_time TIMESTAMP>>,
+    slot_ms INT64,
+    bytes_billed INT64
+  >;
+  DECLARE total_rows INT64;
+
+  SET input_partitions = (
+    SELECT ARRAY_AGG(
+      STRUCT(table_name, partition_id, total_rows, last_modified_time)
+      ORDER BY table_name, partition_id
+    )
+    FROM `nyc-taxi-project-477115.facts.INFORMATION_SCHEMA.PARTITIONS`
+    WHERE table_name IN UNNEST(input_tables)
+  );
+
+  SET last_run = (
+    SELECT AS STRUCT run_at, input_partitions, slot_ms, bytes_billed
+    FROM `nyc-taxi-project-477115.ml_models.model_training_log`
+    WHERE model_name = model_id
+      AND status = 'trained'
+    ORDER BY run_at DESC
+    LIMIT 1
+  );
+
+  -- Partition mới / bị xóa / đổi số dòng đều được tính; ghi đè partition mà số dòng không đổi
+  -- (incremental lookback, --full-refresh) thì không tính là thay đổi
+  SET (total_rows, changed_rows) = (
+    SELECT AS STRUCT
+      SUM(IFNULL(current_partition.total_rows, 0)),
+      SUM(ABS(IFNULL(current_partition.total_rows, 0) - IFNULL(previous_partition.total_rows, 0)))
+    FROM UNNEST(input_partitions) AS current_partition
+    FULL OUTER JOIN UNNEST(last_run.input_partitions) AS previous_partition
+      ON current_partition.table_name = previous_partition.table_name
+      AND current_partition.partition_id = previous_partition.partition_id
+  );
+
+  SET should_train = (
+    force_retrain
+    OR last_run IS NULL
+    OR total_rows IS NULL
+    OR TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), last_run.run_at, DAY) >= max_model_age_days
+    OR changed_rows > total_rows * min_change_ratio
+  );
+
+  IF NOT should_train THEN
+    INSERT INTO `nyc-taxi-project-477115.ml_models.model_training_log`
+    VALUES (
+      CURRENT_TIMESTAMP(), model_id, 'skipped', script_job_id, input_partitions,
+      total_rows, changed_rows, 0, 0, last_run.slot_ms, last_run.bytes_billed
+    );
+  END IF;
+END;
+
+
+-- Ghi dòng 'trained' (fingerprint + chi phí job CREATE MODEL của script) sau khi train xong
+CREATE OR REPLACE PROCEDURE `nyc-taxi-project-477115.ml_models.log_training_run`(
+  model_id STRING,
+  script_job_id STRING,
+  input_partitions ARRAY<STRUCT<table_name STRING, partition_id STRING, total_rows INT64, last_modified_time TIMESTAMP>>,
+  changed_rows INT64
+)
+BEGIN
+  INSERT INTO `nyc-taxi-project-477115.ml_models.model_training_log`
+  SELECT
+    CURRENT_TIMESTAMP(),
+    model_id,
+    'trained',
+    script_job_id,
+    input_partitions,
+    (SELECT SUM(total_rows) FROM UNNEST(input_partitions)),
+    changed_rows,
+    training_job.total_slot_ms,
+    training_job.total_bytes_billed,
+    NULL,
+    NULL
+  FROM (SELECT 1) AS placeholder
+  LEFT JOIN (
+    SELECT total_slot_ms, total_bytes_billed
+    FROM `nyc-taxi-project-477115.region-us.INFORMATION_SCHEMA.JOBS_BY_PROJECT`
+    WHERE parent_job_id = script_job_id
+      AND statement_type = 'CREATE_MODEL'
+    ORDER BY creation_time DESC
+    LIMIT 1
+  ) AS training_job ON TRUE;
+END;
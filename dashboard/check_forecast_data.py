@@ -11,7 +11,9 @@ SELECT
     COUNT(*) as row_count,
     COUNT(DISTINCT pickup_h3_id) as unique_zones,
     MIN(timestamp_hour) as earliest_forecast,
-    MAX(timestamp_hour) as latest_forecast
+    MAX(timestamp_hour) as latest_forecast,
+    COUNT(DISTINCT model_version) as model_versions,
+    MAX(generated_at) as last_generated_at
 FROM `nyc-taxi-project-477115.ml_predictions.hourly_demand_forecast`
 """
 
@@ -180,7 +180,7 @@ def get_demo_trip_data(num_trips=500):
         fare = round(2.5 + distance * 2.5 + np.random.normal(0, 2), 2)
         
         data.append({
-            'trip_id': f'DEMO-{i:06d}',
+            'trip_id': int(np.random.randint(1, 2**62, dtype=np.int64)),  # INT64 như FARM_FINGERPRINT
             'picked_up_at': trip_date,
             'dropped_off_at': trip_date + timedelta(minutes=int(distance * 5)),
             'passenger_count': np.random.randint(1, 5),
@@ -5,6 +5,7 @@ Adapted from Clustering/BigQuery/ml/pca_scoring.py
 """
 import pandas as pd
 import numpy as np
+import h3
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 from sklearn.cluster import KMeans
@@ -43,6 +44,65 @@ def load_pca_features(client, project_id="nyc-taxi-project-477115"):
         return pd.DataFrame()
 
 
+# Average H3 cell area (km²) per resolution of the demand cube
+H3_CELL_AREA_KM2 = {6: 36.129, 7: 5.161, 8: 0.737}
+
+
+def load_cell_features(client, project_id="nyc-taxi-project-477115", h3_resolution=8):
+    """Load PCA features per H3 cell from the pre-aggregated demand cube."""
+    query = f"""
+    WITH cell_demand AS (
+        SELECT
+            h3_cell,
+            SUM(total_pickups) AS total_trips,
+            AVG(total_pickups) AS avg_hourly_demand,
+            STDDEV(total_pickups) AS stddev_hourly_demand,
+            MAX(total_pickups) AS peak_hourly_demand,
+            AVG(IF(EXTRACT(DAYOFWEEK FROM timestamp_hour) IN (1, 7), total_pickups, NULL)) AS weekend_avg_demand,
+            AVG(IF(EXTRACT(DAYOFWEEK FROM timestamp_hour) NOT IN (1, 7), total_pickups, NULL)) AS weekday_avg_demand,
+            AVG(IF(EXTRACT(HOUR FROM timestamp_hour) BETWEEN 7 AND 9, total_pickups, NULL)) AS morning_rush_demand,
+            AVG(IF(EXTRACT(HOUR FROM timestamp_hour) BETWEEN 17 AND 19, total_pickups, NULL)) AS evening_rush_demand,
+            AVG(IF(EXTRACT(HOUR FROM timestamp_hour) >= 22 OR EXTRACT(HOUR FROM timestamp_hour) <= 4, total_pickups, NULL)) AS night_demand
+        FROM `{project_id}.facts.agg_hourly_demand_h3_cube`
+        WHERE h3_resolution = {int(h3_resolution)}
+            AND DATE(timestamp_hour) >= '2025-01-01'
+            AND DATE(timestamp_hour) <= CURRENT_DATE()
+        GROUP BY h3_cell
+    )
+    SELECT
+        h3_cell AS pickup_h3_id,
+        h3_cell AS zone_name,
+        'H3 res {int(h3_resolution)}' AS borough,
+        total_trips,
+        avg_hourly_demand,
+        total_trips / {H3_CELL_AREA_KM2[int(h3_resolution)]} AS trips_per_km2,
+        COALESCE(SAFE_DIVIDE(weekend_avg_demand, weekday_avg_demand), 1.0) AS weekend_ratio,
+        COALESCE(stddev_hourly_demand, 0.0) AS stddev_hourly_demand,
+        peak_hourly_demand,
+        COALESCE(morning_rush_demand, 0.0) AS morning_rush_demand,
+        COALESCE(evening_rush_demand, 0.0) AS evening_rush_demand,
+        COALESCE(night_demand, 0.0) AS night_demand,
+        SAFE_DIVIDE(
+            COALESCE(morning_rush_demand, 0) + COALESCE(evening_rush_demand, 0),
+            COALESCE(avg_hourly_demand, 1)
+        ) AS rush_hour_ratio
+    FROM cell_demand
+    WHERE total_trips > 0
+    ORDER BY total_trips DESC
+    """
+    
+    try:
+        df = client.query(query).to_dataframe()
+        # Cell centers for the maps (a few hundred cells at most)
+        centers = [h3.cell_to_latlng(cell) for cell in df['pickup_h3_id']]
+        df['latitude'] = [lat for lat, _ in centers]
+        df['longitude'] = [lng for _, lng in centers]
+        return df
+    except Exception as e:
+        st.error(f"Error loading H3 cell features: {e}")
+        return pd.DataFrame()
+
+
 def compute_pca_scores(df, n_components=2):
     """
     Compute PCA scores for demand clustering.
@@ -1,4 +1,5 @@
 import os
+import sys
 import streamlit as st
 import folium
 from streamlit_folium import st_folium
@@ -8,11 +9,14 @@ from datetime import datetime, date, timedelta
 import h3
 import plotly.express as px
 from streamlit_plotly_events import plotly_events
-from ml_pca_analysis import load_pca_features, compute_pca_scores, get_cluster_statistics, get_top_zones_by_cluster
+from ml_pca_analysis import load_pca_features, load_cell_features, compute_pca_scores, get_cluster_statistics, get_top_zones_by_cluster
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 
+# ml/ (fare_service, fare_model, demand_model) là các script phẳng, import theo tên module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml"))
+
 # ======================================================================================
 # Page Configuration
 # ======================================================================================
@@ -39,6 +43,30 @@ FARE_MODEL_ID = f"{GCP_PROJECT_ID}.ml_models.fare_estimation_model"
 HOURLY_FORECAST_TABLE = f"{GCP_PROJECT_ID}.ml_predictions.hourly_demand_forecast"
 STREAMING_WEATHER_TABLE = f"{GCP_PROJECT_ID}.raw_data.weather_api_data"
 
+# --- Fare inference backend ---
+# local: artefact của ml/fare_model.py nạp vào bộ nhớ (FARE_MODEL_PATH, mặc định bản LATEST trong artifacts/)
+# bqml:  ML.PREDICT trên FARE_MODEL_ID (mỗi cache miss = 1 BigQuery job); cũng là fallback khi chưa có artefact
+FARE_BACKEND = os.environ.get("FARE_BACKEND", "local").lower()
+FARE_MODEL_PATH = os.environ.get(
+    "FARE_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "artifacts", "fare_model"),
+)
+FARE_CACHE_TTL_SECONDS = int(os.environ.get("FARE_CACHE_TTL_SECONDS", "300"))
+# Khi FARE_MODEL_PATH là thư mục model của registry (có manifest.json), bản current được nạp lại
+# mỗi khi promote / rollback, kiểm tra tối đa mỗi MODEL_RELOAD_SECONDS giây, không cần restart
+MODEL_RELOAD_SECONDS = int(os.environ.get("MODEL_RELOAD_SECONDS", "30"))
+# Baseline hour-of-week (ml/baseline.py) cho Tab 2 khi hourly_demand_forecast rỗng / cũ;
+# không có artefact thì fit trực tiếp từ agg_hourly_demand_h3
+BASELINE_MODEL_PATH = os.environ.get(
+    "BASELINE_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "artifacts", "baseline"),
+)
+# Ma trận quãng đường / thời gian giữa các zone (ml/od_matrix.py); không có thì dùng haversine + 10 mph
+OD_MATRIX_PATH = os.environ.get(
+    "OD_MATRIX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "artifacts", "od_matrix"),
+)
+
 # Function to get BigQuery client, cached for performance
 @st.cache_resource
 def get_gcp_client():
@@ -60,6 +88,8 @@ if 'dropoff_loc' not in st.session_state:
     st.session_state.dropoff_loc = None
 if 'predicted_fare' not in st.session_state:
     st.session_state.predicted_fare = None
+if 'map_zoom' not in st.session_state:
+    st.session_state.map_zoom = 12
 
 # ======================================================================================
 # Data Warehouse Helper Functions
@@ -119,15 +149,21 @@ def get_live_weather_data(_client):
 
 @st.cache_data(ttl=3600)
 def get_all_active_zones(_client):
-    """Get all zones that have any historical trip data."""
+    """Get all zones with their names and precomputed H3 cell centers."""
     if DEMO_MODE:
         return get_demo_all_zones()
     
+    # h3_id is a real H3 cell; its center is precomputed in dim_location (model zone_h3_mapping)
     query = f"""
-        SELECT DISTINCT
-            h3_id as pickup_h3_id
+        SELECT
+            h3_id as pickup_h3_id,
+            ANY_VALUE(zone_name) as zone_name,
+            ANY_VALUE(borough) as borough,
+            ANY_VALUE(h3_cell_latitude) as latitude,
+            ANY_VALUE(h3_cell_longitude) as longitude
         FROM `{GCP_PROJECT_ID}.dimensions.dim_location`
         WHERE h3_id IS NOT NULL
+        GROUP BY h3_id
         ORDER BY h3_id
     """
     try:
@@ -137,18 +173,27 @@ def get_all_active_zones(_client):
         st.warning(f"Could not load all zones: {e}")
         return pd.DataFrame()
 
+def get_h3_resolution_for_zoom(zoom):
+    """Maps a map zoom level to the matching pre-aggregated H3 resolution of the demand cube."""
+    if zoom >= 12:
+        return 8
+    if zoom >= 11:
+        return 7
+    return 6
+
 @st.cache_data(ttl=3600)
-def get_high_demand_zones(_client):
-    """Queries actual demand data and converts H3 IDs to GeoJSON polygons."""
+def get_high_demand_zones(_client, h3_resolution=8):
+    """Queries pre-aggregated demand cells from the H3 cube and converts them to GeoJSON polygons."""
     if DEMO_MODE:
         return get_demo_high_demand_zones()
     
     query = f"""
         SELECT
-            pickup_h3_id,
+            h3_cell AS pickup_h3_id,
             total_pickups AS total_pickups_forecast
-        FROM `{GCP_PROJECT_ID}.facts.fct_hourly_features`
-        WHERE timestamp_hour >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 1 HOUR)
+        FROM `{GCP_PROJECT_ID}.facts.agg_hourly_demand_h3_cube`
+        WHERE h3_resolution = {int(h3_resolution)}
+            AND timestamp_hour >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 1 HOUR)
         ORDER BY total_pickups DESC
         LIMIT 200 # Get top 200 high-demand hexes
     """
@@ -175,19 +220,21 @@ def get_high_demand_zones(_client):
 
 @st.cache_data(ttl=3600)
 def get_hourly_demand_by_zone(_client):
-    """Get hourly demand forecast data from ML predictions table."""
+    """Get the next 24 forecast hours (latest forecast run) from ML predictions table."""
     if DEMO_MODE:
         return get_demo_hourly_demand()
     
+    # run_forecast.sql dự báo 1-48 giờ sau forecast_origin; lấy 24 giờ đầu của lần dự báo mới nhất
     query = f"""
         SELECT
             pickup_h3_id,
             timestamp_hour,
             predicted_total_pickups,
             EXTRACT(HOUR FROM timestamp_hour) as hour
-        FROM `{GCP_PROJECT_ID}.ml_predictions.hourly_demand_forecast`
+        FROM `{HOURLY_FORECAST_TABLE}`
         WHERE timestamp_hour >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 7 DAY)
-            AND timestamp_hour <= CURRENT_TIMESTAMP()
+            AND horizon_hours <= 24
+        QUALIFY generated_at = MAX(generated_at) OVER ()
         ORDER BY pickup_h3_id, timestamp_hour
     """
     try:
@@ -197,6 +244,23 @@ def get_hourly_demand_by_zone(_client):
         st.error(f"Error loading hourly demand forecast: {e}")
         return pd.DataFrame()
 
+@st.cache_data(ttl=3600)
+def get_baseline_hourly_demand(_client):
+    """Next 24 hours from the hour-of-week + EWMA level baseline, shaped like get_hourly_demand_by_zone."""
+    from baseline import BaselineForecaster, fetch_history
+
+    try:
+        if os.path.exists(BASELINE_MODEL_PATH):
+            baseline = BaselineForecaster.load(BASELINE_MODEL_PATH)
+        else:
+            baseline = BaselineForecaster.fit(*fetch_history(client=_client))
+        df = baseline.forecast_frame(start=pd.Timestamp.now(tz='UTC').floor('h'), hours=24)
+        df['hour'] = df['timestamp_hour'].dt.hour
+        return df[['pickup_h3_id', 'timestamp_hour', 'predicted_total_pickups', 'hour']]
+    except Exception as e:
+        st.error(f"Error computing baseline forecast: {e}")
+        return pd.DataFrame()
+
 @st.cache_data(ttl=3600)
 def get_rfm_analysis(_client, days=30):
     """
@@ -277,6 +341,17 @@ def get_rfm_analysis(_client, days=30):
         st.error(f"Error loading RFM analysis: {e}")
         return pd.DataFrame()
 
+def index_trips_by_id(df):
+    """Indexes trips by the INT64 trip_id and adds trip_key (string) for Plotly customdata.
+
+    JavaScript numbers lose precision above 2^53, so the id travels to the browser as a string.
+    """
+    df = df.copy()
+    df['trip_id'] = df['trip_id'].astype('int64')
+    df['trip_key'] = df['trip_id'].astype(str)
+    df.index = pd.Index(df['trip_id'], name=None)
+    return df
+
 def get_segment_color(segment):
     """Returns color for each RFM segment."""
     colors = {
@@ -310,81 +385,83 @@ def get_circle_radius(demand, max_demand, min_radius=250, max_radius=600):
     ratio = demand / max_demand
     return min_radius + (max_radius - min_radius) * ratio
 
-def predict_fare_from_bqml(_client, pickup_loc, dropoff_loc):
-    """Constructs a query to call the BQML model for fare prediction."""
+@st.cache_data(ttl=600)
+def get_zone_demand(_client):
+    """
+    Average forecast demand over the last 24h for every pickup cell, loaded in one query.
+    Used as the `historical_demand` feature of the fare model (10.0 for unknown cells).
+    """
+    query = f"""
+        SELECT pickup_h3_id, AVG(predicted_total_pickups) AS avg_demand
+        FROM (
+            SELECT pickup_h3_id, predicted_total_pickups
+            FROM `{HOURLY_FORECAST_TABLE}`
+            WHERE timestamp_hour >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 24 HOUR)
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY pickup_h3_id, timestamp_hour ORDER BY generated_at DESC) = 1
+        )
+        GROUP BY pickup_h3_id
+    """
+    try:
+        df = _client.query(query).to_dataframe()
+        return dict(zip(df['pickup_h3_id'], df['avg_demand']))
+    except Exception as e:
+        st.warning(f"Could not load zone demand, using default: {e}")
+        return {}
+
+@st.cache_resource
+def get_fare_service(_client):
+    """Fare service shared by all sessions; its TTL/LRU cache survives reruns."""
+    from fare_service import BQMLFareBackend, FareService, LocalFareBackend, ZoneSnapper
+    from od_matrix import ODMatrix
+    from registry import MANIFEST, HotModel
+
+    model_path = os.path.normpath(FARE_MODEL_PATH)
+    if FARE_BACKEND == "bqml" or not os.path.exists(model_path):
+        backend = BQMLFareBackend(_client, FARE_MODEL_ID)
+    elif os.path.exists(os.path.join(model_path, MANIFEST)):
+        backend = HotModel(os.path.basename(model_path), LocalFareBackend,
+                           root=os.path.dirname(model_path), check_interval=MODEL_RELOAD_SECONDS)
+    else:
+        backend = LocalFareBackend(model_path)
+    # Điểm click -> h3_id của taxi zone (model, demand và OD matrix chỉ biết các ô này)
+    try:
+        zone_snapper = ZoneSnapper.from_bigquery(_client, GCP_PROJECT_ID)
+    except Exception as e:
+        st.warning(f"Could not load the zone mapping, fares use raw H3 cells: {e}")
+        zone_snapper = None
+    return FareService(
+        backend,
+        demand_lookup=lambda cell: get_zone_demand(_client).get(cell),
+        ttl_seconds=FARE_CACHE_TTL_SECONDS,
+        travel_matrix=ODMatrix(OD_MATRIX_PATH) if os.path.exists(OD_MATRIX_PATH) else None,
+        zone_snapper=zone_snapper,
+    )
+
+def fare_model_label(_client):
+    """'demo', or the serving backend name and model version (changes after a hot reload)."""
+    if DEMO_MODE:
+        return 'demo'
+    backend = get_fare_service(_client).active_backend()
+    return f"{backend.name} {backend.version}"
+
+def predict_fare(_client, pickup_loc, dropoff_loc):
+    """Predicts the fare through the in-process fare service (local model or BQML backend)."""
     if DEMO_MODE:
         st.session_state.predicted_fare = predict_demo_fare(pickup_loc, dropoff_loc)
         return
     
     with st.spinner('Analyzing route, weather, and demand...'):
         try:
-            # Convert lat/lon to H3 hexagons (resolution 8, as used in training)
-            pickup_h3 = h3.latlng_to_cell(pickup_loc[0], pickup_loc[1], 8)
-            dropoff_h3 = h3.latlng_to_cell(dropoff_loc[0], dropoff_loc[1], 8)
-            now = datetime.now()
-            
-            # Calculate approximate trip distance (simple Haversine)
-            from math import radians, sin, cos, sqrt, atan2
-            lat1, lon1 = radians(pickup_loc[0]), radians(pickup_loc[1])
-            lat2, lon2 = radians(dropoff_loc[0]), radians(dropoff_loc[1])
-            dlat = lat2 - lat1
-            dlon = lon2 - lon1
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * atan2(sqrt(a), sqrt(1-a))
-            distance_miles = 3959 * c  # Earth radius in miles
-            
-            # Estimate trip duration (avg NYC taxi speed ~10 mph in traffic)
-            estimated_duration_seconds = (distance_miles / 10) * 3600
-            
-            # Get real-time weather data
             weather_data = get_live_weather_data(_client)
-            temp_celsius = weather_data.get('temperature_celsius', 20.0)
-            
-            # Get historical demand for pickup location
-            demand_query = f"""
-                SELECT COALESCE(AVG(predicted_total_pickups), 10.0) AS avg_demand
-                FROM `{HOURLY_FORECAST_TABLE}`
-                WHERE pickup_h3_id = '{pickup_h3}'
-                    AND timestamp_hour >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 24 HOUR)
-            """
-            demand_df = _client.query(demand_query).to_dataframe()
-            historical_demand = demand_df['avg_demand'].iloc[0] if not demand_df.empty else 10.0
-            
-            # Construct the ML.PREDICT query with all required features
-            query = f"""
-                SELECT
-                    predicted_fare_amount
-                FROM
-                    ML.PREDICT(MODEL `{FARE_MODEL_ID}`,
-                        (
-                            SELECT
-                                CAST(1 AS INT64) AS passenger_count,
-                                CAST({distance_miles:.2f} AS NUMERIC) AS trip_distance,
-                                CAST({estimated_duration_seconds:.0f} AS INT64) AS trip_duration_seconds,
-                                CAST({now.hour} AS INT64) AS hour_of_day,
-                                CAST({now.weekday()} AS INT64) AS day_of_week,
-                                FALSE AS is_holiday,
-                                CAST({1 if now.weekday() >= 5 else 0} AS BOOL) AS is_weekend,
-                                '{pickup_h3}' AS pickup_h3_id,
-                                '{dropoff_h3}' AS dropoff_h3_id,
-                                CAST({temp_celsius:.2f} AS NUMERIC) AS avg_temp_celsius,
-                                CAST(0.0 AS NUMERIC) AS total_precipitation_mm,
-                                FALSE AS had_rain,
-                                FALSE AS had_snow,
-                                CAST({historical_demand:.0f} AS INT64) AS historical_demand
-                        )
-                    )
-            """
-            
-            df = _client.query(query).to_dataframe()
-            
-            if not df.empty:
-                prediction = df['predicted_fare_amount'].iloc[0]
-                st.session_state.predicted_fare = round(prediction, 2)
-            else:
-                st.error("Prediction failed.")
-                st.session_state.predicted_fare = None
-
+            condition = weather_data.get('weather_condition') or ''
+            weather = {
+                'temperature_celsius': weather_data.get('temperature_celsius'),
+                'is_rainy': condition in ('Rain', 'Drizzle', 'Thunderstorm'),
+                'is_snowy': condition == 'Snow',
+            }
+            st.session_state.predicted_fare = get_fare_service(_client).predict(
+                pickup_loc, dropoff_loc, datetime.now(), weather
+            )
         except Exception as e:
             st.error(f"An error occurred during prediction: {e}")
             st.session_state.predicted_fare = None
@@ -423,9 +500,10 @@ with tab1:
         st.markdown("Click on the map to set your pickup and drop-off locations.")
 
         NYC_CENTER = [40.7128, -74.0060]
-        m = folium.Map(location=NYC_CENTER, zoom_start=12)
+        m = folium.Map(location=NYC_CENTER, zoom_start=st.session_state.map_zoom)
 
-        demand_zones = get_high_demand_zones(client)
+        # Hexagons come from the pre-aggregated H3 cube at the resolution matching the current zoom
+        demand_zones = get_high_demand_zones(client, get_h3_resolution_for_zoom(st.session_state.map_zoom))
         if demand_zones['features']:
             folium.GeoJson(
                 demand_zones,
@@ -444,6 +522,9 @@ with tab1:
 
         map_data = st_folium(m, width='100%', height=500)
 
+        if map_data and map_data.get('zoom'):
+            st.session_state.map_zoom = map_data['zoom']
+
         if map_data and map_data['last_clicked']:
             clicked_lat = map_data['last_clicked']['lat']
             clicked_lng = map_data['last_clicked']['lng']
@@ -473,10 +554,16 @@ with tab1:
         st.markdown("---")
 
         if st.button("Predict Fare 💰", type="primary", disabled=(not st.session_state.pickup_loc or not st.session_state.dropoff_loc)):
-            predict_fare_from_bqml(client, st.session_state.pickup_loc, st.session_state.dropoff_loc)
+            predict_fare(client, st.session_state.pickup_loc, st.session_state.dropoff_loc)
 
         if st.session_state.predicted_fare is not None:
-            st.metric(label="Predicted Fare", value=f"${st.session_state.predicted_fare}", delta="Based on BQML model")
+            st.metric(label="Predicted Fare", value=f"${st.session_state.predicted_fare}", delta=f"Based on {fare_model_label(client)} model")
+            if not DEMO_MODE:
+                od_stats = get_fare_service(client).stats().get('od_matrix')
+                if od_stats and od_stats['lookups']:
+                    # hit rate thấp = OD matrix gần như không được dùng (ô không phải ô zone / matrix cũ)
+                    st.caption(f"OD matrix: {od_stats['hits']}/{od_stats['lookups']} trips priced from observed travel times "
+                               f"({od_stats['unknown_cell']} unknown cells, {od_stats['sparse_pair']} sparse pairs)")
         else:
             st.info("Set both pickup and drop-off locations to predict the fare.")
 
@@ -510,6 +597,17 @@ with tab2:
     with st.spinner("Loading demand forecasts..."):
         hourly_data = get_hourly_demand_by_zone(client)
     
+    # Forecast rỗng hoặc toàn giờ đã qua -> baseline hour-of-week (gần như không tốn chi phí)
+    forecast_stale = hourly_data.empty or (
+        pd.to_datetime(hourly_data['timestamp_hour'], utc=True).max() < pd.Timestamp.now(tz='UTC').floor('h')
+    )
+    if forecast_stale and not DEMO_MODE:
+        with st.spinner("ML forecast unavailable, computing baseline..."):
+            baseline_data = get_baseline_hourly_demand(client)
+        if not baseline_data.empty:
+            st.info("ℹ️ The ML forecast is empty or stale. Showing the hour-of-week baseline (recent weeks' profile × recent level).")
+            hourly_data = baseline_data
+    
     # Debug info
     # if not hourly_data.empty:
     #     st.info(f"✅ Loaded {len(hourly_data)} forecast records from {hourly_data['timestamp_hour'].min()} to {hourly_data['timestamp_hour'].max()}")
@@ -544,6 +642,13 @@ with tab2:
             zones_with_forecast = set(hour_data['pickup_h3_id'].tolist())
             zones_without_forecast = all_zones_df[~all_zones_df['pickup_h3_id'].isin(zones_with_forecast)]
             
+            # Attach zone names and cell centers (precomputed, no per-row H3 conversion)
+            hour_data = hour_data.merge(
+                all_zones_df[['pickup_h3_id', 'zone_name', 'borough', 'latitude', 'longitude']],
+                on='pickup_h3_id',
+                how='left'
+            )
+            
             # Stats
             col1, col2, col3, col4, col5 = st.columns(5)
             with col1:
@@ -567,38 +672,26 @@ with tab2:
             
             max_demand = hour_data['predicted_total_pickups'].max()
             
-            # Show all zones (we only have ~103 unique zones after aggregation)
-            top_zones_to_show = hour_data
-            
             zones_rendered = 0
             gray_zones_rendered = 0
             errors = []
             
             # First render zones WITH forecast (colored by demand)
-            for idx, row in top_zones_to_show.iterrows():
+            for row in hour_data.itertuples(index=False):
                 try:
-                    h3_id = row['pickup_h3_id']
-                    
-                    # Check if it's custom format (h3_res8_LAT_LON) instead of real H3
-                    if h3_id.startswith('h3_res8_'):
-                        # Extract lat/lon from custom format: h3_res8_-73966_40769
-                        parts = h3_id.replace('h3_res8_', '').split('_')
-                        if len(parts) == 2:
-                            lon = float(parts[0]) / 1000.0  # -73966 -> -73.966
-                            lat = float(parts[1]) / 1000.0  # 40769 -> 40.769
-                            # Convert to real H3
-                            h3_id = h3.latlng_to_cell(lat, lon, 8)
+                    lat, lng = row.latitude, row.longitude
+                    if pd.isna(lat):
+                        # Cell not in dim_location: it is still a real H3 cell
+                        lat, lng = h3.cell_to_latlng(row.pickup_h3_id)
                     
-                    # Get center point for circle
-                    center = h3.cell_to_latlng(h3_id)
-                    
-                    demand = row['predicted_total_pickups']
+                    demand = row.predicted_total_pickups
                     color = get_color_for_demand(demand, max_demand)
                     radius = get_circle_radius(demand, max_demand)
+                    zone_label = row.zone_name if pd.notna(row.zone_name) else row.pickup_h3_id
                     
                     # Draw circle with single color (no border)
                     folium.Circle(
-                        location=[center[0], center[1]],
+                        location=[lat, lng],
                         radius=radius,
                         color=color,
                         fill=True,
@@ -606,32 +699,20 @@ with tab2:
                         fillOpacity=0.8,
                         weight=1,
                         opacity=0.8,
-                        popup=folium.Popup(f"<b>Demand:</b> {demand:.0f} trips<br><b>Zone:</b> {h3_id[:10]}...", max_width=400)
+                        popup=folium.Popup(f"<b>Demand:</b> {demand:.0f} trips<br><b>Zone:</b> {zone_label}", max_width=400)
                     ).add_to(demand_map)
                     zones_rendered += 1
                 except Exception as e:
                     if len(errors) < 5:  # Show first 5 errors
-                        errors.append(f"Zone {row['pickup_h3_id']}: {str(e)}")
+                        errors.append(f"Zone {row.pickup_h3_id}: {str(e)}")
                     continue
             
             # Then render zones WITHOUT forecast (gray)
-            for idx, row in zones_without_forecast.iterrows():
+            for row in zones_without_forecast.itertuples(index=False):
                 try:
-                    h3_id = row['pickup_h3_id']
-                    
-                    # Check if it's custom format
-                    if h3_id.startswith('h3_res8_'):
-                        parts = h3_id.replace('h3_res8_', '').split('_')
-                        if len(parts) == 2:
-                            lon = float(parts[0]) / 1000.0
-                            lat = float(parts[1]) / 1000.0
-                            h3_id = h3.latlng_to_cell(lat, lon, 8)
-                    
-                    center = h3.cell_to_latlng(h3_id)
-                    
                     # Dark gray circle for zones without forecast
                     folium.Circle(
-                        location=[center[0], center[1]],
+                        location=[row.latitude, row.longitude],
                         radius=200,  # Small fixed size
                         color='#404040',
                         fill=True,
@@ -639,7 +720,7 @@ with tab2:
                         fillOpacity=0.6,
                         weight=1,
                         opacity=0.6,
-                        popup=folium.Popup(f"<b>No forecast data</b><br><b>Zone:</b> {h3_id[:10]}...", max_width=400)
+                        popup=folium.Popup(f"<b>No forecast data</b><br><b>Zone:</b> {row.zone_name}", max_width=400)
                     ).add_to(demand_map)
                     gray_zones_rendered += 1
                 except Exception as e:
@@ -670,37 +751,15 @@ with tab2:
             # Top zones table
             st.markdown("---")
             st.subheader("Top 10 High Demand Zones")
-            top_zones = hour_data.nlargest(10, 'predicted_total_pickups')[['pickup_h3_id', 'predicted_total_pickups']].copy()
+            top_zones = hour_data.nlargest(10, 'predicted_total_pickups').copy()
             
-            # Get location names from dim_location
-            location_query = f"""
-                SELECT DISTINCT
-                    h3_id,
-                    zone_name,
-                    borough
-                FROM `{GCP_PROJECT_ID}.dimensions.dim_location`
-                WHERE h3_id IN UNNEST(@h3_ids)
-            """
-            from google.cloud.bigquery import ArrayQueryParameter
-            job_config = bigquery.QueryJobConfig(
-                query_parameters=[
-                    ArrayQueryParameter("h3_ids", "STRING", top_zones['pickup_h3_id'].tolist())
-                ]
+            # Location names were already attached from the cached zone lookup
+            top_zones['location'] = top_zones.apply(
+                lambda row: f"{row['zone_name']}, {row['borough']}" if pd.notna(row['zone_name']) else 'Unknown Location',
+                axis=1
             )
-            try:
-                location_df = client.query(location_query, job_config=job_config).to_dataframe()
-                # Merge location names
-                top_zones = top_zones.merge(location_df, left_on='pickup_h3_id', right_on='h3_id', how='left')
-                top_zones['location'] = top_zones.apply(
-                    lambda row: f"{row['zone_name']}, {row['borough']}" if pd.notna(row['zone_name']) else 'Unknown Location',
-                    axis=1
-                )
-                top_zones = top_zones[['location', 'predicted_total_pickups']]
-                top_zones.columns = ['Location', 'Predicted Pickups']
-            except Exception as e:
-                # Fallback if location lookup fails
-                st.warning(f"Could not load location names: {e}")
-                top_zones.columns = ['H3 Zone ID', 'Predicted Pickups']
+            top_zones = top_zones[['location', 'predicted_total_pickups']]
+            top_zones.columns = ['Location', 'Predicted Pickups']
             
             st.dataframe(top_zones, width='stretch', hide_index=True)
         else:
@@ -766,7 +825,7 @@ with tab3:
             with st.spinner("Generating demo trip data..."):
                 df = get_demo_trip_data(num_trips)
                 st.info(f"✅ Loaded {len(df)} demo trips successfully")
-                st.session_state['admin_df'] = df
+                st.session_state['admin_df'] = index_trips_by_id(df)
                 st.success(f"✅ Demo data processed and ready for analysis")
         else:
             # Query to fetch trip data from the facts table
@@ -821,7 +880,7 @@ with tab3:
 
                     # Store in session state so data persists across interactions
                     # This prevents re-querying BigQuery every time user clicks a point
-                    st.session_state['admin_df'] = df
+                    st.session_state['admin_df'] = index_trips_by_id(df)
                     st.success(f"✅ Data processed and ready for analysis")
 
                 else:
@@ -853,9 +912,9 @@ with tab3:
             x="trip_distance", 
             y="fare_amount",
             color="day_of_week",  # Color code by day to see patterns
-            custom_data=["trip_id"],  # Pass trip_id for click event handling
+            custom_data=["trip_key"],  # Pass trip_id (as string) for click event handling
             hover_data={
-                "trip_id": False,  # Hide from hover (shown in custom_data)
+                "trip_key": False,  # Hide from hover (shown in custom_data)
                 "picked_up_at": True,  # Show pickup time
                 "passenger_count": True,  # Show number of passengers
                 "total_amount": ':.2f',  # Show total with 2 decimals
@@ -888,11 +947,11 @@ with tab3:
         if selected_points:
             # Extract trip_id from the clicked point
             # selected_points[0] = first clicked point
-            # ['customdata'][0] = trip_id (first item in custom_data)
-            clicked_trip_id = selected_points[0]['customdata'][0]
+            # ['customdata'][0] = trip_id as string (first item in custom_data)
+            clicked_trip_id = int(selected_points[0]['customdata'][0])
             
-            # Filter dataframe to get the full row for this trip
-            selected_row = df[df['trip_id'] == clicked_trip_id]
+            # Index lookup on trip_id instead of scanning the whole dataframe
+            selected_row = df.loc[[clicked_trip_id]] if clicked_trip_id in df.index else df.iloc[0:0]
             
             if not selected_row.empty:
                 # Display all columns for the selected trip in a nice table
@@ -1174,11 +1233,22 @@ with tab5:
         st.info("💡 This table contains pre-computed demand metrics needed for PCA analysis.")
         st.stop()
     
+    # Spatial unit: taxi zones or pre-aggregated H3 cells from the demand cube
+    spatial_unit = st.selectbox(
+        "Spatial Unit",
+        options=["Taxi zones", "H3 res 8", "H3 res 7", "H3 res 6"],
+        index=0,
+        help="H3 options read pre-aggregated cells from agg_hourly_demand_h3_cube"
+    )
+    
     # Load PCA analysis
     with st.spinner("🔄 Computing PCA and clustering zones..."):
         try:
             # Load features from BigQuery
-            pca_features_df = load_pca_features(client, GCP_PROJECT_ID)
+            if spatial_unit == "Taxi zones":
+                pca_features_df = load_pca_features(client, GCP_PROJECT_ID)
+            else:
+                pca_features_df = load_cell_features(client, GCP_PROJECT_ID, int(spatial_unit[-1]))
             
             if pca_features_df.empty:
                 st.error("No data available for PCA analysis")
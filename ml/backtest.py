@@ -0,0 +1,310 @@
+"""
+backtest.py
+Walk-forward backtest of the demand forecasters (rolling origins in parallel)
+
+For every forecast origin o (last observed hour), each forecaster predicts hours o+1 .. o+horizon for all
+cells using only data up to o, and is scored against the actual pickups:
+- local:           demand_model retrained on the `train_days` before o, recursive forecast exactly like
+                   bqml_scripts/run_forecast.sql (lags / rolling averages from actuals + earlier predictions)
+- seasonal_naive:  pickups of the same hour one week earlier (predictions beyond 168h reuse themselves)
+- hour_of_week:    ml/baseline.py profile + EWMA level fitted on the weeks before o
+- bqml:            rows of ml_predictions.hourly_demand_forecast exported with `export-bqml` (same origins)
+
+Origins run in a process pool; metrics are vectorised over [origins, cells, horizon]:
+MAE, MAPE (over hours with actual > 0) and WAPE = sum|error| / sum(actual), per cell and horizon.
+Calendar and weather of the future hours come from the feature file (observed weather, an upper bound
+compared with the weather persistence run_forecast.sql uses beyond dim_weather).
+
+Usage:
+    python ml/backtest.py run --features data/features --origins 8 --step-hours 24 --horizon 48 --workers 4
+    python ml/backtest.py export-bqml --output data/bqml_forecasts.parquet
+    python ml/backtest.py run --features data/features --bqml-forecasts data/bqml_forecasts.parquet --origins-from-bqml
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from demand_model import GCP_PROJECT_ID, LABEL, load_features, predict, train
+
+# Feature theo giờ, giống nhau cho mọi ô (lấy từ file feature)
+HOUR_COLUMNS = [
+    "hour_of_day", "day_of_week", "month", "quarter", "day_of_year", "is_weekend", "is_holiday",
+    "avg_temp_celsius", "total_precipitation_mm", "had_rain", "had_snow",
+]
+DEFAULT_FORECASTERS = ["local", "seasonal_naive", "hour_of_week"]
+
+# Dữ liệu dùng chung cho các process con (set trong init_worker)
+CONTEXT = {}
+
+
+# =====================
+# Dữ liệu dạng dense
+# =====================
+def dense_context(frame):
+    """series[cells, hours] of total_pickups, per-hour calendar / weather, and the raw feature rows."""
+    hours = pd.date_range(frame["timestamp_hour"].min(), frame["timestamp_hour"].max(), freq="h")
+    cells = np.sort(frame["pickup_h3_id"].unique())
+    series = (
+        frame.pivot(index="pickup_h3_id", columns="timestamp_hour", values=LABEL)
+        .reindex(index=cells, columns=hours)
+        .to_numpy("float64")
+    )
+    calendar = frame.groupby("timestamp_hour")[HOUR_COLUMNS].first().reindex(hours)
+    return {"frame": frame, "cells": cells, "hours": hours, "series": series, "calendar": calendar}
+
+
+def init_worker(context, n_jobs):
+    CONTEXT.update(context, n_jobs=n_jobs)
+
+
+# =====================
+# Forecasters: (origin index, horizon) -> predictions[cells, horizon]
+# =====================
+def round_half_up(values):
+    return np.floor(values + 0.5)       # ROUND() của BigQuery (giá trị không âm)
+
+
+def recursive_features(series, t, calendar_row, cells):
+    """Features of hour index t for every cell, from `series` (actuals + previous predictions)."""
+    p1, p24, p168 = series[:, t - 1], series[:, t - 24], series[:, t - 168]
+    # avg_pickups_* lúc train chứa chính giờ t: dùng giá trị giờ trước làm xấp xỉ (như run_forecast.sql)
+    avg7 = (series[:, t - 6:t].sum(axis=1) + p1) / 7
+    avg24 = (series[:, t - 23:t].sum(axis=1) + p1) / 24
+    features = pd.DataFrame({
+        "pickup_h3_id": cells,
+        "pickups_1h_ago": round_half_up(p1),
+        "pickups_24h_ago": round_half_up(p24),
+        "pickups_1week_ago": round_half_up(p168),
+        "avg_pickups_7h": avg7,
+        "avg_pickups_24h": avg24,
+        "pickups_change_24h": round_half_up(p1 - p24),
+    })
+    for column in HOUR_COLUMNS:
+        features[column] = calendar_row[column]
+    rush_hour = calendar_row["hour_of_day"] in (7, 8, 9, 17, 18, 19)
+    features["rain_during_rush_hour"] = int(bool(calendar_row["had_rain"]) and rush_hour)
+    return features
+
+
+def forecast_local(origin, horizon):
+    frame, hours = CONTEXT["frame"], CONTEXT["hours"]
+    origin_time = hours[origin]
+    history = frame[(frame["timestamp_hour"] <= origin_time)
+                    & (frame["timestamp_hour"] > origin_time - pd.Timedelta(days=CONTEXT["train_days"]))]
+    model, _, metadata = train(history, holdout_days=0, n_jobs=CONTEXT["n_jobs"])
+
+    series = CONTEXT["series"][:, :origin + horizon + 1].copy()
+    series[:, origin + 1:] = np.nan
+    for step in range(1, horizon + 1):
+        t = origin + step
+        features = recursive_features(series, t, CONTEXT["calendar"].iloc[t], CONTEXT["cells"])
+        series[:, t] = predict(model, metadata, features)
+    return series[:, origin + 1:]
+
+
+def forecast_seasonal_naive(origin, horizon):
+    series = CONTEXT["series"][:, :origin + horizon + 1].copy()
+    for step in range(1, horizon + 1):
+        series[:, origin + step] = series[:, origin + step - 168]
+    return series[:, origin + 1:]
+
+
+def forecast_hour_of_week(origin, horizon):
+    from baseline import BaselineForecaster, epoch_hours
+
+    hours = epoch_hours(CONTEXT["hours"][origin:origin + horizon + 1])
+    baseline = BaselineForecaster.fit(CONTEXT["cells"], CONTEXT["series"][:, :origin + 1], int(hours[0]))
+    return baseline.forecast(hours[1:])
+
+
+FORECASTERS = {
+    "local": forecast_local,
+    "seasonal_naive": forecast_seasonal_naive,
+    "hour_of_week": forecast_hour_of_week,
+}
+
+
+def run_origin(task):
+    origin, horizon, names = task
+    start = time.perf_counter()
+    predictions = {name: FORECASTERS[name](origin, horizon) for name in names}
+    return origin, predictions, time.perf_counter() - start
+
+
+# =====================
+# Metrics
+# =====================
+def error_metrics(predicted, actual, axis):
+    """MAE / MAPE / WAPE over `axis` of [origins, cells, horizon] arrays; NaN pairs are skipped."""
+    valid = ~(np.isnan(predicted) | np.isnan(actual))
+    abs_error = np.where(valid, np.abs(predicted - actual), 0.0)
+    actual = np.where(valid, actual, 0.0)
+    positive = valid & (actual > 0)
+    n = valid.sum(axis=axis)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "n": n,
+            "mae": abs_error.sum(axis=axis) / n,
+            "mape": np.where(positive, abs_error / np.where(positive, actual, 1.0), 0.0).sum(axis=axis)
+            / positive.sum(axis=axis),
+            "wape": abs_error.sum(axis=axis) / actual.sum(axis=axis),
+        }
+
+
+def metrics_frames(predictions, actual, cells, horizon):
+    """(per cell x horizon, per horizon, overall) metric DataFrames for every forecaster."""
+    by_cell, by_horizon, overall = [], [], []
+    horizons = np.arange(1, horizon + 1)
+    for name, predicted in predictions.items():
+        cell_metrics = error_metrics(predicted, actual, axis=0)
+        grid_cells, grid_horizons = np.meshgrid(cells, horizons, indexing="ij")
+        by_cell.append(pd.DataFrame({
+            "forecaster": name, "pickup_h3_id": grid_cells.ravel(), "horizon": grid_horizons.ravel(),
+            **{key: value.ravel() for key, value in cell_metrics.items()},
+        }))
+        by_horizon.append(pd.DataFrame({"forecaster": name, "horizon": horizons,
+                                        **error_metrics(predicted, actual, axis=(0, 1))}))
+        overall.append({"forecaster": name, **{k: float(v) for k, v in
+                                               error_metrics(predicted, actual, axis=None).items()}})
+    return pd.concat(by_cell, ignore_index=True), pd.concat(by_horizon, ignore_index=True), pd.DataFrame(overall)
+
+
+# =====================
+# BQML
+# =====================
+def export_bqml(output_path, model_version=None):
+    """ml_predictions.hourly_demand_forecast (latest generation per origin / horizon) -> Parquet."""
+    import pyarrow.parquet as pq
+    from google.cloud import bigquery
+
+    version_filter = f"AND model_version = '{model_version}'" if model_version else ""
+    query = f"""
+        SELECT forecast_origin, horizon_hours, pickup_h3_id, predicted_total_pickups
+        FROM `{GCP_PROJECT_ID}.ml_predictions.hourly_demand_forecast`
+        WHERE forecast_origin IS NOT NULL {version_filter}
+        QUALIFY ROW_NUMBER() OVER (
+            PARTITION BY forecast_origin, horizon_hours, pickup_h3_id ORDER BY generated_at DESC) = 1
+    """
+    pq.write_table(bigquery.Client(project=GCP_PROJECT_ID).query(query).to_arrow(), output_path)
+    print(f"Exported BQML forecasts to {output_path}")
+
+
+def bqml_predictions(path, origins, hours, cells, horizon):
+    """[origins, cells, horizon] array of BQML forecasts (NaN where that origin / cell / horizon is missing)."""
+    frame = pd.read_parquet(path)
+    frame["forecast_origin"] = pd.to_datetime(frame["forecast_origin"], utc=True)
+    frame = frame[frame["horizon_hours"].between(1, horizon)]
+    origin_index = {hours[o]: i for i, o in enumerate(origins)}
+    cell_index = {cell: i for i, cell in enumerate(cells)}
+    o = frame["forecast_origin"].map(origin_index)
+    c = frame["pickup_h3_id"].map(cell_index)
+    keep = o.notna() & c.notna()
+
+    result = np.full((len(origins), len(cells), horizon), np.nan)
+    result[o[keep].astype(int), c[keep].astype(int), frame.loc[keep, "horizon_hours"].astype(int) - 1] = \
+        frame.loc[keep, "predicted_total_pickups"].to_numpy("float64")
+    return result
+
+
+# =====================
+# Runner
+# =====================
+def choose_origins(hours, count, step_hours, horizon, origin_times=None):
+    """Indices of the forecast origins: the last `count` ones every `step_hours`, with a full horizon after them."""
+    if origin_times is not None:
+        index = {hour: i for i, hour in enumerate(hours)}
+        return sorted(index[t] for t in origin_times if t in index and index[t] >= 168)
+    last = len(hours) - 1 - horizon
+    origins = [last - i * step_hours for i in range(count)]
+    return sorted(o for o in origins if o >= 168)
+
+
+def run_backtest(frame, origins=8, step_hours=24, horizon=48, forecasters=DEFAULT_FORECASTERS,
+                 workers=None, train_days=90, bqml_path=None, origins_from_bqml=False):
+    context = dense_context(frame)
+    hours, cells, series = context["hours"], context["cells"], context["series"]
+    context["train_days"] = train_days
+
+    origin_times = None
+    if origins_from_bqml:
+        origin_times = pd.to_datetime(pd.read_parquet(bqml_path, columns=["forecast_origin"])["forecast_origin"],
+                                      utc=True).unique()
+    origin_index = choose_origins(hours, origins, step_hours, horizon, origin_times)
+    if not origin_index:
+        raise ValueError("No forecast origin with 168 hours of history before it and a full horizon after it")
+
+    workers = workers or min(len(origin_index), os.cpu_count() or 1)
+    n_jobs = max((os.cpu_count() or 1) // workers, 1)      # OpenMP threads mỗi process
+    tasks = [(o, horizon, list(forecasters)) for o in origin_index]
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(context, n_jobs)) as pool:
+        for origin, predictions, seconds in pool.map(run_origin, tasks):
+            print(f"  origin {hours[origin]}: {seconds:.1f}s")
+            results[origin] = predictions
+
+    # actual[o, c, h] = series[c, o + 1 + h] (NaN nếu vượt quá dữ liệu)
+    padded = np.concatenate([series, np.full((len(cells), horizon), np.nan)], axis=1)
+    actual = np.stack([padded[:, o + 1:o + 1 + horizon] for o in origin_index])
+    predictions = {name: np.stack([results[o][name] for o in origin_index]) for name in forecasters}
+    if bqml_path:
+        predictions["bqml"] = bqml_predictions(bqml_path, origin_index, hours, cells, horizon)
+    return [hours[o] for o in origin_index], metrics_frames(predictions, actual, cells, horizon)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the demand forecasters")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Backtest over rolling origins")
+    run_parser.add_argument("--features", required=True, help="Parquet exported by demand_model.py export")
+    run_parser.add_argument("--origins", type=int, default=8)
+    run_parser.add_argument("--step-hours", type=int, default=24)
+    run_parser.add_argument("--horizon", type=int, default=48)
+    run_parser.add_argument("--forecasters", default=",".join(DEFAULT_FORECASTERS),
+                            help=f"Comma-separated subset of {sorted(FORECASTERS)}")
+    run_parser.add_argument("--train-days", type=int, default=90, help="Training window of the local model")
+    run_parser.add_argument("--workers", type=int, default=None, help="Processes (default: one per origin, <= cores)")
+    run_parser.add_argument("--bqml-forecasts", help="Parquet from `export-bqml` to score next to the others")
+    run_parser.add_argument("--origins-from-bqml", action="store_true", help="Use the BQML forecast origins")
+    run_parser.add_argument("--output", default="backtest_results", help="Output directory")
+
+    export_parser = subparsers.add_parser("export-bqml", help="hourly_demand_forecast -> Parquet")
+    export_parser.add_argument("--output", required=True)
+    export_parser.add_argument("--model-version", default=None)
+    args = parser.parse_args()
+
+    if args.command == "export-bqml":
+        export_bqml(args.output, args.model_version)
+        return
+
+    start = time.perf_counter()
+    origin_times, (by_cell, by_horizon, overall) = run_backtest(
+        load_features(args.features),
+        origins=args.origins,
+        step_hours=args.step_hours,
+        horizon=args.horizon,
+        forecasters=[name.strip() for name in args.forecasters.split(",") if name.strip()],
+        workers=args.workers,
+        train_days=args.train_days,
+        bqml_path=args.bqml_forecasts,
+        origins_from_bqml=args.origins_from_bqml,
+    )
+    os.makedirs(args.output, exist_ok=True)
+    by_cell.to_parquet(os.path.join(args.output, "metrics_by_cell_horizon.parquet"), index=False)
+    by_horizon.to_csv(os.path.join(args.output, "metrics_by_horizon.csv"), index=False)
+    overall.to_csv(os.path.join(args.output, "metrics_overall.csv"), index=False)
+
+    print(f"{len(origin_times)} origins ({origin_times[0]} .. {origin_times[-1]}) in {time.perf_counter() - start:.1f}s")
+    print(overall.to_string(index=False))
+    checkpoints = by_horizon[by_horizon["horizon"].isin([1, 6, 24, 48])]
+    print(checkpoints.pivot(index="horizon", columns="forecaster", values="wape").to_string())
+    print(f"Results in {args.output}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+baseline.py
+Hour-of-week profile + EWMA level baseline forecaster
+
+    forecast[cell, t] = profile[cell, hour_of_week(t)] * level[cell]
+
+- profile: dense [cells, 168] mean pickups per hour of the week over the last `weeks` weeks of
+  agg_hourly_demand_h3 (hours without trips count 0, like fct_hourly_features)
+- level: EWMA (half-life `halflife_hours`) of actual / profile over the recent hours, with a pseudo-count
+  so sparse cells stay close to 1, clipped to LEVEL_CLIP
+
+A forecast for any future hour is one fancy-indexing operation, so this is the fallback when
+hourly_demand_forecast is empty or stale, a sanity check for the ML models (ml/backtest.py `hour_of_week`)
+and a near-zero-cost forecast tier.
+
+Usage:
+    python ml/baseline.py build --source duckdb --db-path nyc_taxi_pipeline/nyc_taxi_local.duckdb
+    python ml/baseline.py forecast --model artifacts/baseline --hours 48 --output baseline_forecast.parquet
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from demand_model import DEFAULT_ARTIFACT_DIR, GCP_PROJECT_ID, resolve_artifact_path
+
+MODEL_NAME = "baseline"
+WEEKS = 8
+HALFLIFE_HOURS = 24
+PRIOR = 1.0                   # pseudo-count (chuyến) cho tử số / mẫu số của level
+LEVEL_CLIP = (0.25, 4.0)
+
+
+def hour_of_week(hours):
+    """0 = Sunday 00:00 ... 167 = Saturday 23:00 for hours since epoch (1970-01-01 is a Thursday)."""
+    return (np.asarray(hours, dtype="int64") + 4 * 24) % 168
+
+
+def epoch_hours(timestamps):
+    """Hours since epoch for datetimes / Timestamps (tz-aware values are taken in UTC)."""
+    index = pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True)).tz_localize(None)
+    return index.to_numpy().astype("datetime64[h]").astype("int64")
+
+
+class BaselineForecaster:
+    """Dense hour-of-week profile with a per-cell level; forecasts are array indexing."""
+
+    def __init__(self, cells, profile, level, last_hour, metadata=None):
+        self.cells = list(cells)
+        self.profile = np.asarray(profile, dtype="float32")
+        self.level = np.asarray(level, dtype="float32")
+        self.last_hour = int(last_hour)
+        self.metadata = metadata or {}
+
+    @classmethod
+    def fit(cls, cells, series, last_hour, weeks=WEEKS, halflife_hours=HALFLIFE_HOURS):
+        """`series[cells, hours]` of pickups whose last column is `last_hour` (NaN = unknown, skipped)."""
+        window = series[:, -min(series.shape[1], weeks * 168):]
+        hours = last_hour - window.shape[1] + 1 + np.arange(window.shape[1])
+        one_hot = np.zeros((window.shape[1], 168))
+        one_hot[np.arange(window.shape[1]), hour_of_week(hours)] = 1.0
+
+        valid = ~np.isnan(window)
+        values = np.where(valid, window, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            profile = np.nan_to_num((values @ one_hot) / (valid @ one_hot))
+
+        # Level: actual / profile gần đây, trọng số giảm dần theo half-life
+        weights = 0.5 ** ((last_hour - hours) / halflife_hours) * valid
+        expected = profile[:, hour_of_week(hours)]
+        level = ((weights * values).sum(axis=1) + PRIOR) / ((weights * expected).sum(axis=1) + PRIOR)
+        metadata = {
+            "weeks": weeks,
+            "halflife_hours": halflife_hours,
+            "history_hours": int(window.shape[1]),
+            "last_hour": pd.Timestamp(np.datetime64(last_hour, "h")).isoformat(),
+        }
+        return cls(cells, profile, np.clip(level, *LEVEL_CLIP), last_hour, metadata)
+
+    def forecast(self, hours):
+        """[cells, len(hours)] forecasts for hours since epoch."""
+        return self.profile[:, hour_of_week(hours)] * self.level[:, None]
+
+    def forecast_frame(self, start=None, hours=24):
+        """
+        Long DataFrame shaped like hourly_demand_forecast (timestamp_hour, pickup_h3_id,
+        predicted_total_pickups, horizon_hours) for `hours` hours from `start` (default: last_hour + 1).
+        """
+        first = self.last_hour + 1 if start is None else int(epoch_hours([start])[0])
+        target = first + np.arange(hours)
+        values = self.forecast(target)
+        timestamps = pd.to_datetime(target.astype("datetime64[h]")).tz_localize("UTC")
+        return pd.DataFrame({
+            "timestamp_hour": np.tile(timestamps, len(self.cells)),
+            "pickup_h3_id": np.repeat(self.cells, hours),
+            "predicted_total_pickups": values.ravel().astype("float64"),
+            "horizon_hours": np.tile(target - self.last_hour, len(self.cells)),
+        })
+
+    # ---------------------
+    # Artefact
+    # ---------------------
+    def save(self, artifact_dir=DEFAULT_ARTIFACT_DIR):
+        """Saves <artifact_dir>/baseline/<version>/{profile.npy, level.npy, metadata.json} and registers it."""
+        from registry import register
+
+        data_end = pd.Timestamp(np.datetime64(self.last_hour, "h")).strftime("%Y%m%d%H")
+        version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + "-" + data_end
+        model_dir = os.path.join(artifact_dir, MODEL_NAME, version)
+        os.makedirs(model_dir, exist_ok=True)
+        np.save(os.path.join(model_dir, "profile.npy"), self.profile)
+        np.save(os.path.join(model_dir, "level.npy"), self.level)
+        with open(os.path.join(model_dir, "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump({**self.metadata, "version": version, "cells": self.cells, "last_hour_epoch": self.last_hour}, f)
+
+        register(MODEL_NAME, version, {"data_fingerprint": data_end}, artifact_dir)
+        return model_dir
+
+    @classmethod
+    def load(cls, path):
+        path = resolve_artifact_path(path)
+        with open(os.path.join(path, "metadata.json"), "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        return cls(
+            metadata["cells"],
+            np.load(os.path.join(path, "profile.npy")),
+            np.load(os.path.join(path, "level.npy")),
+            metadata["last_hour_epoch"],
+            metadata,
+        )
+
+
+# =====================
+# Nạp lịch sử từ agg_hourly_demand_h3
+# =====================
+def fetch_history(source="bigquery", db_path=None, weeks=WEEKS, client=None):
+    """(cells, series[cells, hours], last_hour) of the last `weeks` weeks, zero-filled like fct_hourly_features."""
+    if source == "duckdb":
+        import duckdb
+
+        table = "facts.agg_hourly_demand_h3"
+        query = f"""
+            SELECT pickup_h3_id, timestamp_hour, total_pickups FROM {table}
+            WHERE timestamp_hour > (SELECT MAX(timestamp_hour) FROM {table}) - INTERVAL {weeks * 7} DAY
+        """
+        con = duckdb.connect(db_path, read_only=True)
+        frame = con.execute(query).df()
+        con.close()
+    else:
+        from google.cloud import bigquery
+
+        table = f"`{GCP_PROJECT_ID}.facts.agg_hourly_demand_h3`"
+        query = f"""
+            SELECT pickup_h3_id, timestamp_hour, total_pickups FROM {table}
+            WHERE timestamp_hour > TIMESTAMP_SUB((SELECT MAX(timestamp_hour) FROM {table}), INTERVAL {weeks * 7} DAY)
+        """
+        client = client or bigquery.Client(project=GCP_PROJECT_ID)
+        frame = client.query(query).to_dataframe()
+
+    hours = epoch_hours(frame["timestamp_hour"])
+    last_hour = int(hours.max())
+    first_hour = last_hour - weeks * 168 + 1
+    cells, cell_index = np.unique(frame["pickup_h3_id"].to_numpy(), return_inverse=True)
+    series = np.zeros((len(cells), weeks * 168))
+    np.add.at(series, (cell_index, hours - first_hour), frame["total_pickups"].to_numpy("float64"))
+    return cells.tolist(), series, last_hour
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hour-of-week profile + EWMA level baseline forecaster")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Fit from agg_hourly_demand_h3 and save the artefact")
+    build_parser.add_argument("--source", choices=["bigquery", "duckdb"], default="bigquery")
+    build_parser.add_argument("--db-path", help="DuckDB file (--source duckdb)")
+    build_parser.add_argument("--weeks", type=int, default=WEEKS)
+    build_parser.add_argument("--halflife-hours", type=float, default=HALFLIFE_HOURS)
+    build_parser.add_argument("--artifact-dir", default=DEFAULT_ARTIFACT_DIR)
+
+    forecast_parser = subparsers.add_parser("forecast", help="Forecast the next hours -> Parquet")
+    forecast_parser.add_argument("--model", default=os.path.join(DEFAULT_ARTIFACT_DIR, MODEL_NAME))
+    forecast_parser.add_argument("--start", default=None, help="First hour (default: the hour after the data)")
+    forecast_parser.add_argument("--hours", type=int, default=48)
+    forecast_parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        cells, series, last_hour = fetch_history(args.source, args.db_path, args.weeks)
+        baseline = BaselineForecaster.fit(cells, series, last_hour, args.weeks, args.halflife_hours)
+        model_dir = baseline.save(args.artifact_dir)
+        print(f"{len(cells)} cells x 168 hours-of-week up to {baseline.metadata['last_hour']}, "
+              f"level median {np.median(baseline.level):.2f}")
+        print(f"Saved {model_dir}")
+
+    elif args.command == "forecast":
+        baseline = BaselineForecaster.load(args.model)
+        frame = baseline.forecast_frame(args.start, args.hours)
+        frame.to_parquet(args.output, index=False)
+        print(f"Wrote {len(frame):,} rows ({len(baseline.cells)} cells x {args.hours} hours) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+demand_model.py
+Local gradient-boosted equivalent of the BQML `timeseries_hotspot_model`
+
+Steps:
+1. export: fct_hourly_features -> Parquet (BigQuery, or the local DuckDB target of tools/run_dbt_duckdb.py)
+2. train: HistGradientBoostingRegressor on the same features / label / row filter as
+   bqml_scripts/train_model.sql, on all cores, evaluated on the most recent days (time-based holdout).
+   The artefact is saved as <artifacts>/demand_model/<version>/{model.joblib, metadata.json}
+3. predict: vectorised batch inference for a Parquet file of feature rows (no BigQuery job)
+
+Metrics use the ML.EVALUATE names (mean_absolute_error, root_mean_squared_error, r2_score)
+so they can be compared directly with the BQML model.
+
+Usage:
+    python ml/demand_model.py export --source duckdb --db-path nyc_taxi_pipeline/nyc_taxi_local.duckdb --output data/features
+    python ml/demand_model.py export --source bigquery --output data/features --start 2025-06-01
+    python ml/demand_model.py train --features data/features --n-jobs 8
+    python ml/demand_model.py predict --model artifacts/demand_model/latest --features new_rows.parquet --output pred.parquet
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+GCP_PROJECT_ID = os.environ.get("GCP_PROJECT", "nyc-taxi-project-477115")
+DEFAULT_ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "artifacts")
+MODEL_NAME = "demand_model"
+
+# Giữ khớp với bqml_scripts/train_model.sql
+LABEL = "total_pickups"
+CATEGORICAL_FEATURES = ["pickup_h3_id"]
+NUMERIC_FEATURES = [
+    "hour_of_day",
+    "day_of_week",            # EXTRACT(DAYOFWEEK): 1 = Sunday ... 7 = Saturday
+    "pickups_1h_ago",
+    "pickups_24h_ago",
+    "pickups_1week_ago",
+    "avg_pickups_7h",
+    "avg_pickups_24h",
+    "avg_temp_celsius",
+    "total_precipitation_mm",
+    "had_rain",
+    "had_snow",
+    "is_weekend",
+    "is_holiday",
+    "pickups_change_24h",
+    "rain_during_rush_hour",
+    "month",
+    "quarter",
+    "day_of_year",
+]
+FEATURES = CATEGORICAL_FEATURES + NUMERIC_FEATURES
+
+# Tương ứng OPTIONS của CREATE MODEL (max_iterations=50, early_stop, min_rel_progress=0.01)
+DEFAULT_PARAMS = {
+    "max_iter": 50,
+    "learning_rate": 0.1,
+    "early_stopping": True,
+    "validation_fraction": 0.1,
+    "random_state": 42,
+}
+# min_rel_progress của BQML là tỉ lệ cải thiện loss; `tol` của HistGradientBoosting lại là ngưỡng tuyệt đối
+# trên loss validation (half squared error) -> train() đặt tol = MIN_REL_PROGRESS x loss ban đầu (0.5 * var(label))
+MIN_REL_PROGRESS = 0.01
+# HistGradientBoosting chỉ nhận biến categorical <= 255 giá trị: các ô ít dữ liệu hơn gộp thành "missing"
+MAX_CATEGORIES = 254
+
+EXPORT_QUERY = """
+    SELECT
+        timestamp_hour,
+        {label},
+        pickup_h3_id,
+        EXTRACT(HOUR FROM timestamp_hour) AS hour_of_day,
+        {day_of_week} AS day_of_week,
+        {columns}
+    FROM {table}
+    WHERE pickups_1h_ago IS NOT NULL
+      AND pickups_24h_ago IS NOT NULL
+      AND pickups_1week_ago IS NOT NULL
+      {date_filter}
+"""
+
+
+# =====================
+# Export
+# =====================
+def export_features(output_dir, source="bigquery", db_path=None, start=None, end=None):
+    """Writes the training rows of fct_hourly_features to <output_dir>/features.parquet."""
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, "features.parquet")
+    columns = ",\n        ".join(c for c in NUMERIC_FEATURES if c not in ("hour_of_day", "day_of_week"))
+    date_filter = ""
+    if start:
+        date_filter += f"AND timestamp_hour >= TIMESTAMP '{start}' "
+    if end:
+        date_filter += f"AND timestamp_hour < TIMESTAMP '{end}'"
+
+    if source == "duckdb":
+        import duckdb
+
+        query = EXPORT_QUERY.format(label=LABEL, columns=columns, table="facts.fct_hourly_features",
+                                    day_of_week="DAYOFWEEK(timestamp_hour) + 1", date_filter=date_filter)
+        con = duckdb.connect(db_path, read_only=True)
+        con.execute(f"COPY ({query}) TO '{output_path}' (FORMAT PARQUET)")
+        con.close()
+    else:
+        import pyarrow.parquet as pq
+        from google.cloud import bigquery
+
+        client = bigquery.Client(project=GCP_PROJECT_ID)
+        query = EXPORT_QUERY.format(label=LABEL, columns=columns,
+                                    table=f"`{GCP_PROJECT_ID}.facts.fct_hourly_features`",
+                                    day_of_week="EXTRACT(DAYOFWEEK FROM timestamp_hour)", date_filter=date_filter)
+        pq.write_table(client.query(query).to_arrow(), output_path)
+
+    print(f"Exported features to {output_path}")
+    return output_path
+
+
+def load_features(path):
+    """Reads an exported Parquet file (or a directory of them)."""
+    frame = pd.read_parquet(path)
+    frame["timestamp_hour"] = pd.to_datetime(frame["timestamp_hour"], utc=True)
+    return frame
+
+
+# =====================
+# Train / predict
+# =====================
+def prepare_matrix(frame, categories):
+    """Feature matrix with pickup_h3_id as a pandas categorical over the training categories."""
+    matrix = frame[FEATURES].copy()
+    known = matrix["pickup_h3_id"].where(matrix["pickup_h3_id"].isin(categories))
+    matrix["pickup_h3_id"] = pd.Categorical(known, categories=categories)
+    for column in NUMERIC_FEATURES:
+        matrix[column] = matrix[column].astype("float64")
+    return matrix
+
+
+def evaluate(y_true, y_pred):
+    """Same metric names as ML.EVALUATE for a regressor."""
+    y_true = np.asarray(y_true, dtype="float64")
+    y_pred = np.asarray(y_pred, dtype="float64")
+    residual = y_true - y_pred
+    total = ((y_true - y_true.mean()) ** 2).sum()
+    return {
+        "mean_absolute_error": float(np.abs(residual).mean()),
+        "root_mean_squared_error": float(np.sqrt((residual ** 2).mean())),
+        "r2_score": float(1 - (residual ** 2).sum() / total) if total else None,
+    }
+
+
+def data_fingerprint(frame):
+    """Hash of rows per day, to tell whether two artefacts were trained on the same data."""
+    per_day = frame.groupby(frame["timestamp_hour"].dt.strftime("%Y-%m-%d"))[LABEL].agg(["size", "sum"])
+    return hashlib.sha256(per_day.to_csv().encode()).hexdigest()[:16]
+
+
+def train(frame, holdout_days=7, n_jobs=None, params=None):
+    """Fits the model on all but the last `holdout_days` days; returns (model, categories, metadata)."""
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    from threadpoolctl import threadpool_limits
+
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    cutoff = frame["timestamp_hour"].max().normalize() - pd.Timedelta(days=holdout_days - 1)
+    train_frame = frame[frame["timestamp_hour"] < cutoff]
+    holdout_frame = frame[frame["timestamp_hour"] >= cutoff]
+
+    categories = (train_frame["pickup_h3_id"].value_counts().index[:MAX_CATEGORIES]).sort_values().tolist()
+    label = train_frame[LABEL].astype("float64")
+    params.setdefault("tol", MIN_REL_PROGRESS * 0.5 * float(label.var()))
+    model = HistGradientBoostingRegressor(categorical_features="from_dtype", **params)
+
+    start = time.perf_counter()
+    # OpenMP: một thread mỗi core (hoặc --n-jobs)
+    with threadpool_limits(limits=n_jobs, user_api="openmp"):
+        model.fit(prepare_matrix(train_frame, categories), label)
+        holdout_pred = model.predict(prepare_matrix(holdout_frame, categories)) if len(holdout_frame) else []
+    training_seconds = time.perf_counter() - start
+
+    metadata = {
+        "model_name": MODEL_NAME,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "features": FEATURES,
+        "label": LABEL,
+        "categories": categories,
+        "params": params,
+        "n_iter": int(model.n_iter_),
+        "training_rows": int(len(train_frame)),
+        "holdout_rows": int(len(holdout_frame)),
+        "holdout_start": cutoff.isoformat(),
+        "data_start": frame["timestamp_hour"].min().isoformat(),
+        "data_end": frame["timestamp_hour"].max().isoformat(),
+        "data_fingerprint": data_fingerprint(frame),
+        "training_seconds": round(training_seconds, 2),
+        "metrics": evaluate(holdout_frame[LABEL], holdout_pred) if len(holdout_frame) else {},
+    }
+    return model, categories, metadata
+
+
+def save_artifact(model, metadata, artifact_dir=DEFAULT_ARTIFACT_DIR, model_name=MODEL_NAME):
+    """Saves <artifact_dir>/<model_name>/<version>/ and registers it as the current version (manifest + LATEST)."""
+    import joblib
+
+    from registry import register
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + "-" + metadata["data_fingerprint"][:8]
+    model_dir = os.path.join(artifact_dir, model_name, version)
+    os.makedirs(model_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(model_dir, "model.joblib"))
+    with open(os.path.join(model_dir, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump({**metadata, "version": version}, f, indent=2)
+
+    register(model_name, version, metadata, artifact_dir)
+    return model_dir
+
+
+def resolve_artifact_path(path):
+    """Version directory for `path`: itself, or the one named by <model_name>/LATEST (also for .../latest)."""
+    if os.path.basename(os.path.normpath(path)) == "latest":
+        path = os.path.dirname(os.path.normpath(path))
+    if os.path.exists(os.path.join(path, "LATEST")):
+        with open(os.path.join(path, "LATEST"), "r", encoding="utf-8") as f:
+            path = os.path.join(path, f.read().strip())
+    return path
+
+
+def load_artifact(path):
+    """Loads (model, metadata) from a version directory, or from <model_name>/ via its LATEST pointer."""
+    import joblib
+
+    path = resolve_artifact_path(path)
+    with open(os.path.join(path, "metadata.json"), "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    return joblib.load(os.path.join(path, "model.joblib")), metadata
+
+
+def predict(model, metadata, frame):
+    """Predicted total_pickups for every row of `frame` (needs the FEATURES columns), clipped at 0."""
+    return np.clip(model.predict(prepare_matrix(frame, metadata["categories"])), 0, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local demand model (equivalent of timeseries_hotspot_model)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="fct_hourly_features -> Parquet")
+    export_parser.add_argument("--source", choices=["bigquery", "duckdb"], default="bigquery")
+    export_parser.add_argument("--db-path", help="DuckDB file (--source duckdb)")
+    export_parser.add_argument("--output", required=True, help="Output directory")
+    export_parser.add_argument("--start", help="First timestamp_hour (YYYY-MM-DD)")
+    export_parser.add_argument("--end", help="Exclusive end (YYYY-MM-DD)")
+
+    train_parser = subparsers.add_parser("train", help="Train and save a versioned artefact")
+    train_parser.add_argument("--features", required=True, help="Exported Parquet file or directory")
+    train_parser.add_argument("--artifact-dir", default=DEFAULT_ARTIFACT_DIR)
+    train_parser.add_argument("--holdout-days", type=int, default=7)
+    train_parser.add_argument("--n-jobs", type=int, default=None, help="Threads (default: all cores)")
+
+    predict_parser = subparsers.add_parser("predict", help="Batch inference")
+    predict_parser.add_argument("--model", required=True, help="Artefact version directory or demand_model/latest")
+    predict_parser.add_argument("--features", required=True)
+    predict_parser.add_argument("--output", required=True, help="Parquet with predicted_total_pickups")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_features(args.output, args.source, args.db_path, args.start, args.end)
+
+    elif args.command == "train":
+        frame = load_features(args.features)
+        model, _, metadata = train(frame, args.holdout_days, args.n_jobs)
+        model_dir = save_artifact(model, metadata, args.artifact_dir)
+        print(f"Trained on {metadata['training_rows']:,} rows in {metadata['training_seconds']}s "
+              f"({metadata['n_iter']} iterations)")
+        print(f"Holdout ({metadata['holdout_rows']:,} rows): {json.dumps(metadata['metrics'])}")
+        print(f"Saved {model_dir}")
+
+    elif args.command == "predict":
+        model, metadata = load_artifact(args.model)
+        frame = load_features(args.features)
+        start = time.perf_counter()
+        frame["predicted_total_pickups"] = predict(model, metadata, frame)
+        print(f"Predicted {len(frame):,} rows in {time.perf_counter() - start:.3f}s (model {metadata['version']})")
+        frame[["timestamp_hour", "pickup_h3_id", "predicted_total_pickups"]].to_parquet(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+fare_model.py
+Local equivalent of the BQML `fare_estimation_model`, trained on fct_fare_training_sample
+
+Same features / label / split as bqml_scripts/train_fare_model.sql: fit on TRAIN + EVAL
+(early stopping on an internal validation fraction), score on TEST with the ML.EVALUATE metric names.
+Features are encoded to a plain float matrix (H3 cells -> ordinal codes) so a single row can be
+predicted without building a DataFrame (ml/fare_service.py).
+
+Usage:
+    python ml/fare_model.py export --source duckdb --db-path nyc_taxi_pipeline/nyc_taxi_local.duckdb --output data/fare_features
+    python ml/fare_model.py train --features data/fare_features --n-jobs 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from demand_model import DEFAULT_ARTIFACT_DIR, GCP_PROJECT_ID, MAX_CATEGORIES, evaluate, save_artifact
+
+MODEL_NAME = "fare_model"
+
+# Giữ khớp với bqml_scripts/train_fare_model.sql
+LABEL = "fare_amount"
+CATEGORICAL_FEATURES = ["pickup_h3_id", "dropoff_h3_id"]
+FEATURES = [
+    "passenger_count",
+    "trip_distance",
+    "trip_duration_seconds",
+    "hour_of_day",
+    "day_of_week",            # dim_datetime.day_of_week: 1 = Sunday ... 7 = Saturday
+    "is_holiday",
+    "is_weekend",
+    "pickup_h3_id",
+    "dropoff_h3_id",
+    "avg_temp_celsius",
+    "total_precipitation_mm",
+    "had_rain",
+    "had_snow",
+    "historical_demand",
+]
+
+DEFAULT_PARAMS = {
+    "max_iter": 100,
+    "learning_rate": 0.1,
+    "early_stopping": True,
+    "validation_fraction": 0.1,
+    "random_state": 42,
+}
+
+
+# =====================
+# Export
+# =====================
+def export_features(output_dir, source="bigquery", db_path=None):
+    """Writes fct_fare_training_sample (features + label + data_split) to <output_dir>/fare_features.parquet."""
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, "fare_features.parquet")
+    columns = ", ".join(["pickup_date", "data_split", LABEL] + FEATURES)
+
+    if source == "duckdb":
+        import duckdb
+
+        con = duckdb.connect(db_path, read_only=True)
+        con.execute(f"COPY (SELECT {columns} FROM facts.fct_fare_training_sample) TO '{output_path}' (FORMAT PARQUET)")
+        con.close()
+    else:
+        import pyarrow.parquet as pq
+        from google.cloud import bigquery
+
+        client = bigquery.Client(project=GCP_PROJECT_ID)
+        query = f"SELECT {columns} FROM `{GCP_PROJECT_ID}.facts.fct_fare_training_sample`"
+        pq.write_table(client.query(query).to_arrow(), output_path)
+
+    print(f"Exported fare features to {output_path}")
+    return output_path
+
+
+# =====================
+# Encoding / train
+# =====================
+def encode_frame(frame, categories):
+    """Float matrix in FEATURES order; H3 cells -> ordinal code, unknown cells -> NaN (missing bin)."""
+    matrix = np.empty((len(frame), len(FEATURES)), dtype="float64")
+    for i, column in enumerate(FEATURES):
+        if column in CATEGORICAL_FEATURES:
+            codes = {cell: code for code, cell in enumerate(categories[column])}
+            matrix[:, i] = frame[column].map(codes).astype("float64").to_numpy()
+        else:
+            matrix[:, i] = frame[column].astype("float64").to_numpy()
+    return matrix
+
+
+def train(frame, n_jobs=None, params=None):
+    """Fits on TRAIN + EVAL, scores TEST; returns (model, metadata)."""
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    from threadpoolctl import threadpool_limits
+
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    train_frame = frame[frame["data_split"].isin(["TRAIN", "EVAL"])]
+    test_frame = frame[frame["data_split"] == "TEST"]
+
+    # HistGradientBoosting: tối đa 255 giá trị mỗi biến categorical
+    categories = {
+        column: train_frame[column].value_counts().index[:MAX_CATEGORIES].sort_values().tolist()
+        for column in CATEGORICAL_FEATURES
+    }
+    model = HistGradientBoostingRegressor(
+        categorical_features=[FEATURES.index(column) for column in CATEGORICAL_FEATURES], **params
+    )
+
+    start = time.perf_counter()
+    with threadpool_limits(limits=n_jobs, user_api="openmp"):
+        model.fit(encode_frame(train_frame, categories), train_frame[LABEL].astype("float64"))
+        test_pred = model.predict(encode_frame(test_frame, categories)) if len(test_frame) else []
+    training_seconds = time.perf_counter() - start
+
+    per_day = frame.groupby(frame["pickup_date"].astype(str))[LABEL].agg(["size", "sum"])
+    metadata = {
+        "model_name": MODEL_NAME,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "features": FEATURES,
+        "label": LABEL,
+        "categories": categories,
+        "params": params,
+        "n_iter": int(model.n_iter_),
+        "training_rows": int(len(train_frame)),
+        "test_rows": int(len(test_frame)),
+        "data_fingerprint": hashlib.sha256(per_day.to_csv().encode()).hexdigest()[:16],
+        "training_seconds": round(training_seconds, 2),
+        "metrics": evaluate(test_frame[LABEL], test_pred) if len(test_frame) else {},
+    }
+    return model, metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fare model (equivalent of fare_estimation_model)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="fct_fare_training_sample -> Parquet")
+    export_parser.add_argument("--source", choices=["bigquery", "duckdb"], default="bigquery")
+    export_parser.add_argument("--db-path", help="DuckDB file (--source duckdb)")
+    export_parser.add_argument("--output", required=True, help="Output directory")
+
+    train_parser = subparsers.add_parser("train", help="Train and save a versioned artefact")
+    train_parser.add_argument("--features", required=True, help="Exported Parquet file or directory")
+    train_parser.add_argument("--artifact-dir", default=DEFAULT_ARTIFACT_DIR)
+    train_parser.add_argument("--n-jobs", type=int, default=None, help="Threads (default: all cores)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_features(args.output, args.source, args.db_path)
+
+    elif args.command == "train":
+        frame = pd.read_parquet(args.features)
+        model, metadata = train(frame, args.n_jobs)
+        model_dir = save_artifact(model, metadata, args.artifact_dir, MODEL_NAME)
+        print(f"Trained on {metadata['training_rows']:,} rows in {metadata['training_seconds']}s "
+              f"({metadata['n_iter']} iterations)")
+        print(f"TEST ({metadata['test_rows']:,} rows): {json.dumps(metadata['metrics'])}")
+        print(f"Saved {model_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,556 @@
+"""
+fare_service.py
+In-process fare prediction with a TTL + LRU cache
+
+A request (pickup / dropoff lat-lng, time, weather) is reduced to the cache key
+(pickup_h3, dropoff_h3, hour, weekday, weather bucket); every model feature is derived from that key,
+so equal keys always give the same fare. With a ZoneSnapper the clicked points become the h3_id of
+their taxi zone (the only cells the model, the demand lookup and the OD matrix were built on);
+without one they are the raw res-8 cells. Distance / duration come from the OD matrix of ml/od_matrix.py
+when one is given (haversine between cell centres at a flat 10 mph otherwise). Backends:
+- LocalFareBackend: artefact of ml/fare_model.py loaded in memory, trees walked in pure Python
+- BQMLFareBackend: ML.PREDICT on fare_estimation_model (remote, one BigQuery job per cache miss)
+
+Batch scoring (origin-destination matrices for driver guidance) skips the cache: features are built
+as NumPy arrays and the whole batch is scored in one model call (local predict, or one ML.PREDICT over UNNEST).
+
+Usage:
+    service = FareService(LocalFareBackend("artifacts/fare_model"), demand_lookup=zone_demand.get,
+                          zone_snapper=ZoneSnapper.from_bigquery(client))
+    fare = service.predict((40.758, -73.985), (40.706, -74.009), weather={"temperature_celsius": 12.0})
+    fares = service.predict_matrix(cells, datetime(2025, 12, 3, 8))      # float32 [len(cells), len(cells)]
+
+    python ml/fare_service.py matrix --model artifacts/fare_model --when 2025-12-03T08:00 --output od_fares.npz
+"""
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from math import asin, cos, radians, sin, sqrt
+
+import h3
+import numpy as np
+
+from demand_model import DEFAULT_ARTIFACT_DIR
+from registry import HotModel
+
+H3_RESOLUTION = 8                 # như lúc train (fct_trips.pickup_h3_id)
+AVG_SPEED_MPH = 10                # tốc độ trung bình trong thành phố -> ước lượng thời gian chuyến
+DEFAULT_HISTORICAL_DEMAND = 10.0
+TEMP_BUCKET_CELSIUS = 5
+
+
+class TTLCache:
+    """LRU cache whose entries also expire `ttl_seconds` after they were written (thread-safe)."""
+
+    def __init__(self, maxsize=10000, ttl_seconds=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, self.clock() + self.ttl_seconds)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def cell_distance_miles(pickup_h3, dropoff_h3):
+    """Haversine distance between the centres of two H3 cells."""
+    lat1, lon1 = (radians(v) for v in h3.cell_to_latlng(pickup_h3))
+    lat2, lon2 = (radians(v) for v in h3.cell_to_latlng(dropoff_h3))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * 3959 * asin(sqrt(a))  # Earth radius in miles
+
+
+def weather_bucket(weather):
+    """(temperature rounded to TEMP_BUCKET_CELSIUS, precipitation_mm, is_rainy, is_snowy) from a weather dict."""
+    weather = weather or {}
+    temp = weather.get("temperature_celsius")
+    if temp is None or temp != temp:     # thiếu / NaN từ JSON_VALUE
+        temp = 20.0
+    return (
+        int(round(temp / TEMP_BUCKET_CELSIUS) * TEMP_BUCKET_CELSIUS),
+        round(float(weather.get("precipitation_mm", 0.0)), 1),
+        bool(weather.get("is_rainy", False)),
+        bool(weather.get("is_snowy", False)),
+    )
+
+
+def fare_features(pickup_h3, dropoff_h3, hour, weekday, bucket, historical_demand, travel=None):
+    """
+    Feature dict of fare_estimation_model (bqml_scripts/train_fare_model.sql) for one cache key.
+    `travel` = (median distance, median duration) from the OD matrix; haversine + flat speed without it.
+    """
+    temp, precipitation, is_rainy, is_snowy = bucket
+    if travel is None:
+        distance_miles = cell_distance_miles(pickup_h3, dropoff_h3)
+        travel = (distance_miles, distance_miles / AVG_SPEED_MPH * 3600)
+    distance_miles, duration_seconds = travel
+    return {
+        "passenger_count": 1,
+        "trip_distance": round(distance_miles, 2),
+        "trip_duration_seconds": int(duration_seconds),
+        "hour_of_day": hour,
+        "day_of_week": weekday,
+        "is_holiday": False,
+        "is_weekend": weekday in (1, 7),
+        "pickup_h3_id": pickup_h3,
+        "dropoff_h3_id": dropoff_h3,
+        "avg_temp_celsius": float(temp),
+        "total_precipitation_mm": precipitation,
+        "had_rain": is_rainy,
+        "had_snow": is_snowy,
+        "historical_demand": int(round(historical_demand)),
+    }
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Vectorised haversine (radians in, miles out); same formula as cell_distance_miles."""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 3959 * np.arcsin(np.sqrt(a))
+
+
+def fare_feature_arrays(pickup_cells, dropoff_cells, times, bucket, demand_lookup, travel_matrix=None):
+    """
+    Column arrays of fare_features() for a batch of OD pairs.
+    `times` is one datetime or one per pair; `demand_lookup(cell)` is called once per distinct pickup cell.
+    """
+    pickup_cells = np.asarray(pickup_cells, dtype=object)
+    dropoff_cells = np.asarray(dropoff_cells, dtype=object)
+    n = len(pickup_cells)
+
+    # Tâm cell: tính một lần cho mỗi cell khác nhau rồi gather theo index
+    cells, inverse = np.unique(np.concatenate([pickup_cells, dropoff_cells]).astype(str), return_inverse=True)
+    centres = np.radians(np.array([h3.cell_to_latlng(cell) for cell in cells], dtype="float64").reshape(-1, 2))
+    pickup, dropoff = centres[inverse[:n]], centres[inverse[n:]]
+    distance_miles = haversine_miles(pickup[:, 0], pickup[:, 1], dropoff[:, 0], dropoff[:, 1])
+    duration_seconds = distance_miles / AVG_SPEED_MPH * 3600
+
+    times = np.broadcast_to(np.asarray(times, dtype="datetime64[s]"), (n,))
+    days = times.astype("datetime64[D]")
+    hours = ((times - days) // np.timedelta64(1, "h")).astype("int64")
+    if travel_matrix is not None:
+        od_distance, od_duration = travel_matrix.lookup_arrays(pickup_cells, dropoff_cells, hours)
+        known = ~np.isnan(od_distance)
+        distance_miles = np.where(known, od_distance, distance_miles)
+        duration_seconds = np.where(known, od_duration, duration_seconds)
+    weekdays = (days.astype("int64") + 4) % 7 + 1       # 1970-01-01 là thứ Năm; 1 = Sunday như dim_datetime
+
+    pickup_unique, pickup_inverse = np.unique(pickup_cells.astype(str), return_inverse=True)
+    demand = np.array([
+        DEFAULT_HISTORICAL_DEMAND if (value := demand_lookup(cell)) is None else value for cell in pickup_unique
+    ], dtype="float64")[pickup_inverse]
+
+    temp, precipitation, is_rainy, is_snowy = bucket
+    return {
+        "passenger_count": np.ones(n, dtype="int64"),
+        "trip_distance": np.round(distance_miles, 2),
+        "trip_duration_seconds": duration_seconds.astype("int64"),
+        "hour_of_day": hours,
+        "day_of_week": weekdays,
+        "is_holiday": np.zeros(n, dtype=bool),
+        "is_weekend": np.isin(weekdays, (1, 7)),
+        "pickup_h3_id": pickup_cells,
+        "dropoff_h3_id": dropoff_cells,
+        "avg_temp_celsius": np.full(n, float(temp)),
+        "total_precipitation_mm": np.full(n, precipitation, dtype="float64"),
+        "had_rain": np.full(n, is_rainy),
+        "had_snow": np.full(n, is_snowy),
+        "historical_demand": np.rint(demand).astype("int64"),
+    }
+
+
+# =====================
+# Backends
+# =====================
+def compile_trees(model):
+    """
+    Flattens a fitted HistGradientBoostingRegressor into plain Python tuples.
+    model.predict() on a single row costs milliseconds (input validation + an OpenMP pool per tree);
+    walking ~100 shallow trees in Python takes tens of microseconds and gives the same result.
+    Splits are rewritten against the original input columns (sklearn moves categorical columns first
+    and re-encodes them with an OrdinalEncoder before binning).
+    """
+    column_of = list(range(model.n_features_in_))
+    raw_categories = {}
+    if model._preprocessor is not None:
+        column_of, encoder = [], None
+        for name, transformer, mask in model._preprocessor.transformers_:
+            if name == "remainder":
+                continue
+            column_of.extend(int(i) for i in np.flatnonzero(mask))
+            if name == "encoder":
+                encoder = transformer
+        for position, categories in enumerate(encoder.categories_):
+            raw_categories[position] = [float(value) for value in categories]
+
+    trees = []
+    for (predictor,) in model._predictors:
+        bitsets = predictor.raw_left_cat_bitsets
+        nodes = []
+        for node in predictor.nodes:
+            feature = int(node["feature_idx"])
+            split_categories = None
+            if node["is_categorical"]:
+                words = bitsets[node["bitset_idx"]]
+                left = [i * 32 + bit for i, word in enumerate(words) for bit in range(32) if int(word) >> bit & 1]
+                categories = raw_categories.get(feature)
+                if categories is None:
+                    split_categories = (frozenset(float(c) for c in left), None)
+                else:
+                    # (giá trị gốc đi trái, giá trị gốc đã gặp lúc train)
+                    split_categories = (frozenset(categories[c] for c in left if c < len(categories)),
+                                        frozenset(categories))
+            nodes.append((
+                bool(node["is_leaf"]), float(node["value"]), column_of[feature],
+                float(node["num_threshold"]), bool(node["missing_go_to_left"]),
+                int(node["left"]), int(node["right"]), split_categories,
+            ))
+        trees.append(nodes)
+    return float(np.ravel(model._baseline_prediction)[0]), trees
+
+
+def predict_row(compiled, row):
+    baseline, trees = compiled
+    total = baseline
+    for nodes in trees:
+        node = nodes[0]
+        while not node[0]:
+            _, _, feature, threshold, missing_left, left, right, split_categories = node
+            value = row[feature]
+            if value != value:                      # NaN: thiếu giá trị / H3 cell chưa gặp lúc train
+                go_left = missing_left
+            elif split_categories is not None:
+                left_categories, known = split_categories
+                go_left = missing_left if known is not None and value not in known else value in left_categories
+            else:
+                go_left = value <= threshold
+            node = nodes[left if go_left else right]
+        total += node[1]
+    return total
+
+
+def check_rows(compiled, n_features, n_rows=64, seed=0):
+    """
+    Rows that exercise both sides of the compiled splits: each feature takes one of its thresholds
+    (or the next float up), a category seen / not seen at training time, or NaN.
+    """
+    candidates = [{0.0} for _ in range(n_features)]
+    for nodes in compiled[1]:
+        for is_leaf, _, feature, threshold, _, _, _, split_categories in nodes:
+            if is_leaf:
+                continue
+            if split_categories is None:
+                candidates[feature] |= {threshold, float(np.nextafter(threshold, np.inf))}
+            else:
+                left, known = split_categories
+                values = set(known if known is not None else left)
+                candidates[feature] |= values | {max(values, default=0.0) + 1.0}
+    rng = np.random.default_rng(seed)
+    rows = np.array([rng.choice(sorted(values), n_rows) for values in candidates], dtype="float64").T
+    rows[rng.random(rows.shape) < 0.05] = np.nan
+    return rows
+
+
+class LocalFareBackend:
+    """
+    fare_model artefact in memory; predicts from a float row without pandas.
+    The pure-Python trees rely on private HistGradientBoostingRegressor attributes, so at load time they are
+    checked against model.predict(); if compiling fails or the outputs differ, single rows go through
+    model.predict() instead (`fallback_reason` says why).
+    """
+
+    name = "local"
+
+    def __init__(self, artifact_path):
+        from demand_model import load_artifact
+        from fare_model import CATEGORICAL_FEATURES
+
+        self.model, self.metadata = load_artifact(artifact_path)
+        self.version = self.metadata["version"]
+        self.features = self.metadata["features"]
+        self.codes = {
+            column: {cell: code for code, cell in enumerate(self.metadata["categories"][column])}
+            for column in CATEGORICAL_FEATURES
+        }
+        self.compiled, self.fallback_reason = None, None
+        try:
+            compiled = compile_trees(self.model)
+            rows = check_rows(compiled, len(self.features))
+            expected = self.model.predict(rows)
+            actual = np.array([predict_row(compiled, row) for row in rows.tolist()])
+            if np.allclose(actual, expected, rtol=1e-9, atol=1e-6):
+                self.compiled = compiled
+            else:
+                self.fallback_reason = f"compiled trees differ from model.predict (max |diff| {np.abs(actual - expected).max():.3g})"
+        except Exception as e:             # thuộc tính private của sklearn đổi theo phiên bản
+            self.fallback_reason = f"could not compile trees: {e!r}"
+
+    def encode(self, features):
+        return [
+            self.codes[name].get(features[name], np.nan) if name in self.codes else float(features[name])
+            for name in self.features
+        ]
+
+    def predict(self, features):
+        if self.compiled is None:
+            return float(self.model.predict(np.array([self.encode(features)], dtype="float64"))[0])
+        return predict_row(self.compiled, self.encode(features))
+
+    def predict_batch(self, feature_arrays):
+        """One model.predict() call over the whole batch (vectorised, all cores)."""
+        n = len(feature_arrays[self.features[0]])
+        matrix = np.empty((n, len(self.features)), dtype="float64")
+        for i, name in enumerate(self.features):
+            values = feature_arrays[name]
+            if name in self.codes:
+                unique, inverse = np.unique(values.astype(str), return_inverse=True)
+                matrix[:, i] = np.array([self.codes[name].get(cell, np.nan) for cell in unique], dtype="float64")[inverse]
+            else:
+                matrix[:, i] = values
+        return self.model.predict(matrix)
+
+
+class BQMLFareBackend:
+    """Remote backend: ML.PREDICT on the BQML fare model with query parameters."""
+
+    name = "BQML"
+    NUMERIC_COLUMNS = ("trip_distance", "avg_temp_celsius", "total_precipitation_mm")
+
+    def __init__(self, client, model_id):
+        self.client = client
+        self.model_id = model_id
+        self.version = model_id
+
+    def predict(self, features):
+        from google.cloud import bigquery
+
+        bq_types = {bool: "BOOL", int: "INT64", float: "FLOAT64", str: "STRING"}
+        params = [bigquery.ScalarQueryParameter(name, bq_types[type(value)], value) for name, value in features.items()]
+        # Kiểu NUMERIC như lúc train (dashboard cũ cũng CAST các cột này)
+        columns = [
+            f"CAST(@{name} AS NUMERIC) AS {name}" if name in self.NUMERIC_COLUMNS else f"@{name} AS {name}"
+            for name in features
+        ]
+        query = f"""
+            SELECT predicted_fare_amount
+            FROM ML.PREDICT(MODEL `{self.model_id}`, (SELECT {', '.join(columns)}))
+        """
+        rows = list(self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params)).result())
+        return float(rows[0].predicted_fare_amount)
+
+    def predict_batch(self, feature_arrays):
+        """
+        One ML.PREDICT over UNNEST(GENERATE_ARRAY(...)) for the whole batch.
+        Constant columns go as scalar parameters, H3 columns as (distinct cells, int index) to keep
+        the request small; the rest as ARRAY parameters read with [OFFSET(i)].
+        """
+        from google.cloud import bigquery
+
+        n = len(feature_arrays["pickup_h3_id"])
+        params = [bigquery.ScalarQueryParameter("n", "INT64", n)]
+        columns = []
+        for name, values in feature_arrays.items():
+            if values.dtype == object:
+                cells, index = np.unique(values.astype(str), return_inverse=True)
+                params += [bigquery.ArrayQueryParameter(f"{name}_cells", "STRING", cells.tolist()),
+                           bigquery.ArrayQueryParameter(f"{name}_idx", "INT64", index.tolist())]
+                expression = f"@{name}_cells[OFFSET(@{name}_idx[OFFSET(i)])]"
+            else:
+                bq_type = "BOOL" if values.dtype == bool else "INT64" if values.dtype.kind == "i" else "FLOAT64"
+                if n and (values == values[0]).all():
+                    params.append(bigquery.ScalarQueryParameter(name, bq_type, values[0].item()))
+                    expression = f"@{name}"
+                else:
+                    params.append(bigquery.ArrayQueryParameter(name, bq_type, values.tolist()))
+                    expression = f"@{name}[OFFSET(i)]"
+            if name in self.NUMERIC_COLUMNS:
+                expression = f"CAST({expression} AS NUMERIC)"
+            columns.append(f"{expression} AS {name}")
+
+        query = f"""
+            SELECT row_id, predicted_fare_amount
+            FROM ML.PREDICT(MODEL `{self.model_id}`, (
+                SELECT i AS row_id, {', '.join(columns)}
+                FROM UNNEST(GENERATE_ARRAY(0, @n - 1)) AS i
+            ))
+        """
+        result = np.full(n, np.nan)
+        for row in self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params)).result():
+            result[row.row_id] = row.predicted_fare_amount
+        return result
+
+
+class ZoneSnapper:
+    """
+    lat/lng -> h3_id of the taxi zone containing it (dim_location.h3_id, one cell per zone).
+    The res-8 cell of the point goes to the zone with the largest area in it (zone_h3_mapping coverage);
+    points outside every zone (water, outside NYC) go to the zone with the nearest centroid.
+    """
+
+    QUERY = """
+        SELECT
+            location.h3_id,
+            mapping.h3_cell,
+            mapping.area_weight,
+            location.h3_centroid_latitude AS centroid_latitude,
+            location.h3_centroid_longitude AS centroid_longitude
+        FROM `{project}.dimensions.dim_location` AS location
+        INNER JOIN `{project}.dimensions.zone_h3_mapping` AS mapping
+            ON location.zone_id = mapping.zone_id
+    """
+
+    def __init__(self, frame):
+        covered = frame[frame["area_weight"] > 0].sort_values(["area_weight", "h3_id"], ascending=[True, False])
+        self.cell_zone = dict(zip(covered["h3_cell"], covered["h3_id"]))    # ghi sau cùng = area_weight lớn nhất
+        zones = frame.drop_duplicates("h3_id").sort_values("h3_id")
+        self.zone_ids = zones["h3_id"].to_numpy()
+        self.centroids = np.radians(zones[["centroid_latitude", "centroid_longitude"]].to_numpy(dtype="float64"))
+
+    @classmethod
+    def from_bigquery(cls, client, project=None):
+        return cls(client.query(cls.QUERY.format(project=project or client.project)).to_dataframe())
+
+    def snap(self, lat, lng):
+        zone = self.cell_zone.get(h3.latlng_to_cell(lat, lng, H3_RESOLUTION))
+        if zone is None:
+            distance = haversine_miles(radians(lat), radians(lng), self.centroids[:, 0], self.centroids[:, 1])
+            zone = self.zone_ids[int(np.argmin(distance))]
+        return zone
+
+
+class FareService:
+    """Fare prediction memoised by (pickup_h3, dropoff_h3, hour, weekday, weather bucket)."""
+
+    def __init__(self, backend, demand_lookup=None, ttl_seconds=300, maxsize=10000, travel_matrix=None,
+                 zone_snapper=None):
+        self.backend = backend                  # backend, hoặc registry.HotModel trả về backend
+        self.demand_lookup = demand_lookup or (lambda cell: None)
+        self.travel_matrix = travel_matrix      # od_matrix.ODMatrix (tùy chọn)
+        self.zone_snapper = zone_snapper        # ZoneSnapper (tùy chọn): điểm click -> h3_id của zone
+        self.cache = TTLCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+        self.version = None
+
+    def active_backend(self):
+        """Backend serving now; the cache is dropped when a hot-reloaded model changes version."""
+        backend = self.backend.get() if isinstance(self.backend, HotModel) else self.backend
+        if backend.version != self.version:
+            self.cache.clear()
+            self.version = backend.version
+        return backend
+
+    def cell(self, latlng):
+        """Zone h3_id of a clicked point (its raw res-8 cell without a zone snapper)."""
+        if self.zone_snapper is None:
+            return h3.latlng_to_cell(latlng[0], latlng[1], H3_RESOLUTION)
+        return self.zone_snapper.snap(latlng[0], latlng[1])
+
+    def cache_key(self, pickup_latlng, dropoff_latlng, when=None, weather=None):
+        when = when or datetime.now()
+        return (
+            self.cell(pickup_latlng),
+            self.cell(dropoff_latlng),
+            when.hour,
+            when.isoweekday() % 7 + 1,   # 1 = Sunday ... 7 = Saturday, như dim_datetime
+            weather_bucket(weather),
+        )
+
+    def predict_key(self, key):
+        backend = self.active_backend()
+        fare = self.cache.get(key)
+        if fare is None:
+            pickup_h3, dropoff_h3, hour, weekday, bucket = key
+            demand = self.demand_lookup(pickup_h3)
+            travel = self.travel_matrix.lookup(pickup_h3, dropoff_h3, hour) if self.travel_matrix else None
+            features = fare_features(pickup_h3, dropoff_h3, hour, weekday, bucket,
+                                     DEFAULT_HISTORICAL_DEMAND if demand is None else demand, travel)
+            fare = round(max(backend.predict(features), 0.0), 2)
+            self.cache.set(key, fare)
+        return fare
+
+    def predict(self, pickup_latlng, dropoff_latlng, when=None, weather=None):
+        return self.predict_key(self.cache_key(pickup_latlng, dropoff_latlng, when, weather))
+
+    def stats(self):
+        """Cache counters, plus the OD matrix lookup counters when there is a matrix."""
+        stats = {"cache": self.cache.stats()}
+        if self.travel_matrix is not None:
+            stats["od_matrix"] = self.travel_matrix.lookup_stats()
+        return stats
+
+    def predict_batch(self, pickup_cells, dropoff_cells, times=None, weather=None):
+        """float32 fares for arrays of OD cell pairs (one time for all, or one per pair); bypasses the cache."""
+        times = datetime.now() if times is None else times
+        features = fare_feature_arrays(pickup_cells, dropoff_cells, times, weather_bucket(weather),
+                                       self.demand_lookup, self.travel_matrix)
+        return np.round(np.clip(self.active_backend().predict_batch(features), 0.0, None), 2).astype("float32")
+
+    def predict_matrix(self, cells, when=None, weather=None):
+        """float32 [len(cells), len(cells)] matrix; fares[i, j] = trip from cells[i] to cells[j]."""
+        cells = np.asarray(cells, dtype=object)
+        n = len(cells)
+        return self.predict_batch(np.repeat(cells, n), np.tile(cells, n), when, weather).reshape(n, n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fare matrix between every pair of cells for one hour")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    matrix_parser = subparsers.add_parser("matrix", help="OD fare matrix -> .npz (cells, fares)")
+    matrix_parser.add_argument("--model", default=os.path.join(DEFAULT_ARTIFACT_DIR, "fare_model"))
+    matrix_parser.add_argument("--when", default=None, help="ISO datetime (default: now)")
+    matrix_parser.add_argument("--cells-file", help="One H3 cell per line (default: the model's pickup cells)")
+    matrix_parser.add_argument("--temperature", type=float, default=20.0)
+    matrix_parser.add_argument("--od-matrix", help="ml/od_matrix.py artefact for distance / duration")
+    matrix_parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    backend = LocalFareBackend(args.model)
+    if args.cells_file:
+        with open(args.cells_file, "r", encoding="utf-8") as f:
+            cells = [line.strip() for line in f if line.strip()]
+    else:
+        cells = backend.metadata["categories"]["pickup_h3_id"]
+    when = datetime.fromisoformat(args.when) if args.when else datetime.now()
+
+    start = time.perf_counter()
+    travel_matrix = None
+    if args.od_matrix:
+        from od_matrix import ODMatrix
+
+        travel_matrix = ODMatrix(args.od_matrix)
+    fares = FareService(backend, travel_matrix=travel_matrix).predict_matrix(cells, when, {"temperature_celsius": args.temperature})
+    elapsed = time.perf_counter() - start
+    np.savez_compressed(args.output, cells=np.array(cells), fares=fares)
+    print(f"Priced {fares.size:,} OD pairs ({len(cells)} cells) in {elapsed:.2f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+feature_store.py
+Online feature store: lag / rolling demand features per H3 cell without recomputing fct_hourly_features
+
+Every cell owns one row of a single contiguous int64 array `counts[cell, slot]`; the slot of an hour is
+(hours since epoch) % SLOTS, so writing an hour and reading a lag are O(1) index operations.
+SLOTS = 169: the current hour plus 168 hours of history (pickups_1week_ago = LAG(total_pickups, 168)).
+Running 7h / 24h sums are updated on every write, so the rolling averages are O(1) too.
+
+Semantics match models/marts/facts/fct_hourly_features.sql:
+- the series is dense: hours / cells without trips count 0, every known cell starts at the first hour
+- lags are NULL (NaN) until the series has more than k hours, rolling averages use the rows available
+
+Usage:
+    store = OnlineFeatureStore()
+    store.update(datetime(2025, 12, 3, 8), {"882a100d25fffff": 42, ...})   # hourly counts (late updates ok)
+    store.lookup("882a100d25fffff")         # features of the latest hour
+    store.snapshot("artifacts/feature_store.npz"); OnlineFeatureStore.restore("artifacts/feature_store.npz")
+
+    python ml/feature_store.py verify --source duckdb --db-path nyc_taxi_pipeline/nyc_taxi_local.duckdb
+    python ml/feature_store.py bootstrap --source bigquery --output artifacts/feature_store.npz
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from demand_model import GCP_PROJECT_ID
+
+SLOTS = 169
+LAGS = {"pickups_1h_ago": 1, "pickups_24h_ago": 24, "pickups_1week_ago": 168}
+WINDOWS = {"avg_pickups_7h": 7, "avg_pickups_24h": 24}
+FEATURE_COLUMNS = ["total_pickups"] + list(LAGS) + list(WINDOWS)
+
+
+def to_hour(value):
+    """Hours since epoch (int) for a datetime / Timestamp / numpy datetime64."""
+    return int(np.datetime64(pd.Timestamp(value).to_datetime64(), "h").astype("int64"))
+
+
+class OnlineFeatureStore:
+    """Per-cell ring buffers of hourly pickups in one [cells, SLOTS] array."""
+
+    def __init__(self, capacity=512):
+        self.cells = []
+        self.index = {}
+        self.counts = np.zeros((capacity, SLOTS), dtype="int64")
+        self.sums = {name: np.zeros(capacity, dtype="int64") for name in WINDOWS}
+        self.current_hour = None      # hours since epoch của giờ mới nhất
+        self.hours_seen = 0           # số giờ của chuỗi tính đến current_hour (kể cả giờ hiện tại)
+
+    # ---------------------
+    # Ghi
+    # ---------------------
+    def cell_rows(self, cells):
+        """Row of every cell, registering new cells (all-zero history, like the zones CROSS JOIN in SQL)."""
+        rows = []
+        for cell in cells:
+            row = self.index.get(cell)
+            if row is None:
+                row = len(self.cells)
+                if row == len(self.counts):
+                    self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+                    self.sums = {name: np.concatenate([s, np.zeros_like(s)]) for name, s in self.sums.items()}
+                self.cells.append(cell)
+                self.index[cell] = row
+            rows.append(row)
+        return np.array(rows, dtype="int64")
+
+    def advance(self, hour):
+        """Moves the series forward to `hour`; skipped hours count 0 for every cell."""
+        if self.current_hour is None:
+            self.current_hour, self.hours_seen = hour, 1
+            return
+        steps = hour - self.current_hour
+        if steps > SLOTS:
+            # Khoảng trống dài hơn cửa sổ: toàn bộ lịch sử trong buffer là 0
+            self.counts[:] = 0
+            for s in self.sums.values():
+                s[:] = 0
+            self.current_hour, self.hours_seen = hour, self.hours_seen + steps
+            return
+        for h in range(self.current_hour + 1, hour + 1):
+            for name, window in WINDOWS.items():
+                self.sums[name] -= self.counts[:, (h - window) % SLOTS]
+            self.counts[:, h % SLOTS] = 0     # slot này đang giữ giờ h - SLOTS
+        self.current_hour, self.hours_seen = hour, self.hours_seen + steps
+
+    def update(self, timestamp_hour, counts):
+        """
+        Sets the pickup count of `timestamp_hour` for the given cells ({cell: count}).
+        Newer hours advance the series; the current or a recent hour (within SLOTS) is corrected in place.
+        """
+        hour = to_hour(timestamp_hour)
+        if self.current_hour is None or hour > self.current_hour:
+            self.advance(hour)
+        age = self.current_hour - hour
+        if age >= SLOTS:
+            raise ValueError(f"{timestamp_hour} is older than the {SLOTS}-hour window of the store")
+        if not counts:
+            return
+
+        rows = self.cell_rows(counts.keys())
+        values = np.fromiter(counts.values(), dtype="int64", count=len(rows))
+        slot = hour % SLOTS
+        delta = values - self.counts[rows, slot]
+        self.counts[rows, slot] = values
+        for name, window in WINDOWS.items():
+            if age < window:
+                self.sums[name][rows] += delta
+
+    # ---------------------
+    # Đọc
+    # ---------------------
+    def features(self, cells=None):
+        """DataFrame of FEATURE_COLUMNS at the latest hour for `cells` (default: every known cell)."""
+        cells = self.cells if cells is None else list(cells)
+        rows = np.array([self.index.get(cell, -1) for cell in cells], dtype="int64")
+        known = rows >= 0            # cell chưa từng thấy: chuỗi toàn 0 như trong SQL
+        rows = np.where(known, rows, 0)
+        t = self.current_hour
+
+        def at(hour):
+            return np.where(known, self.counts[rows, hour % SLOTS], 0).astype("float64")
+
+        columns = {"total_pickups": at(t)}
+        for name, lag in LAGS.items():
+            columns[name] = at(t - lag) if self.hours_seen > lag else np.full(len(rows), np.nan)
+        for name, window in WINDOWS.items():
+            columns[name] = np.where(known, self.sums[name][rows], 0) / min(self.hours_seen, window)
+
+        frame = pd.DataFrame({"pickup_h3_id": cells, **columns})
+        frame["timestamp_hour"] = pd.Timestamp(np.datetime64(t, "h"))
+        return frame
+
+    def lookup(self, cell):
+        """Features of one cell at the latest hour as a dict (O(1))."""
+        row = self.index.get(cell)
+        t = self.current_hour
+        value = (lambda slot: 0 if row is None else int(self.counts[row, slot % SLOTS]))
+        result = {"total_pickups": value(t)}
+        for name, lag in LAGS.items():
+            result[name] = value(t - lag) if self.hours_seen > lag else None
+        for name, window in WINDOWS.items():
+            result[name] = (0 if row is None else int(self.sums[name][row])) / min(self.hours_seen, window)
+        return result
+
+    # ---------------------
+    # Snapshot
+    # ---------------------
+    def snapshot(self, path):
+        """Writes the store to an .npz file atomically (tmp file + rename)."""
+        n = len(self.cells)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                cells=np.array(self.cells, dtype=str),
+                counts=self.counts[:n],
+                current_hour=np.int64(-1 if self.current_hour is None else self.current_hour),
+                hours_seen=np.int64(self.hours_seen),
+                **{f"sum_{name}": s[:n] for name, s in self.sums.items()},
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def restore(cls, path):
+        data = np.load(path)
+        cells = data["cells"].tolist()
+        store = cls(capacity=max(len(cells), 1))
+        store.cells = cells
+        store.index = {cell: i for i, cell in enumerate(cells)}
+        store.counts[:len(cells)] = data["counts"]
+        for name in WINDOWS:
+            store.sums[name][:len(cells)] = data[f"sum_{name}"]
+        store.current_hour = None if int(data["current_hour"]) < 0 else int(data["current_hour"])
+        store.hours_seen = int(data["hours_seen"])
+        return store
+
+
+# =====================
+# Nạp từ warehouse / kiểm tra với SQL
+# =====================
+def query_frame(sql, source="bigquery", db_path=None):
+    if source == "duckdb":
+        import duckdb
+
+        con = duckdb.connect(db_path, read_only=True)
+        frame = con.execute(sql).df()
+        con.close()
+        return frame
+
+    from google.cloud import bigquery
+
+    return bigquery.Client(project=GCP_PROJECT_ID).query(sql).to_dataframe()
+
+
+def table_name(source, table):
+    return f"`{GCP_PROJECT_ID}.facts.{table}`" if source == "bigquery" else f"facts.{table}"
+
+
+def replay(store, demand, series_start):
+    """Feeds an (pickup_h3_id, timestamp_hour, total_pickups) frame hour by hour, starting at `series_start`."""
+    store.update(series_start, {})
+    for timestamp_hour, group in demand.groupby("timestamp_hour", sort=True):
+        store.update(timestamp_hour, dict(zip(group["pickup_h3_id"], group["total_pickups"].astype("int64"))))
+
+
+def bootstrap(source="bigquery", db_path=None):
+    """Store at the latest hour of agg_hourly_demand_h3, loading only the last SLOTS hours of counts."""
+    table = table_name(source, "agg_hourly_demand_h3")
+    bounds = query_frame(
+        f"SELECT MIN(timestamp_hour) AS first_hour, MAX(timestamp_hour) AS last_hour FROM {table}", source, db_path
+    ).iloc[0]
+    # Chuỗi trong fct_hourly_features bắt đầu lúc 00:00 của ngày đầu tiên
+    series_start = to_hour(pd.Timestamp(bounds["first_hour"]).floor("D"))
+    last_hour = to_hour(bounds["last_hour"])
+    window_start = max(series_start, last_hour - SLOTS + 1)
+    window_start_ts = pd.Timestamp(np.datetime64(window_start, "h"))
+
+    demand = query_frame(
+        f"SELECT pickup_h3_id, timestamp_hour, total_pickups FROM {table} "
+        f"WHERE timestamp_hour >= TIMESTAMP '{window_start_ts:%Y-%m-%d %H:%M:%S}'", source, db_path
+    )
+    cells = query_frame(f"SELECT DISTINCT pickup_h3_id FROM {table}", source, db_path)["pickup_h3_id"]
+
+    store = OnlineFeatureStore(capacity=max(len(cells), 1))
+    store.cell_rows(sorted(cells))
+    replay(store, demand, window_start_ts)
+    store.hours_seen += window_start - series_start
+    return store
+
+
+def verify(source="bigquery", db_path=None, limit_hours=None):
+    """Replays agg_hourly_demand_h3 and compares every hour with fct_hourly_features; returns mismatches."""
+    demand = query_frame(
+        f"SELECT pickup_h3_id, timestamp_hour, total_pickups FROM {table_name(source, 'agg_hourly_demand_h3')}",
+        source, db_path,
+    )
+    expected = query_frame(
+        f"SELECT pickup_h3_id, timestamp_hour, {', '.join(FEATURE_COLUMNS)} "
+        f"FROM {table_name(source, 'fct_hourly_features')}", source, db_path,
+    )
+    series_start = pd.Timestamp(demand["timestamp_hour"].min()).floor("D")
+    if limit_hours:
+        demand = demand[demand["timestamp_hour"] < series_start + pd.Timedelta(hours=limit_hours)]
+    expected = expected.set_index(["timestamp_hour", "pickup_h3_id"]).sort_index()
+
+    store = OnlineFeatureStore()
+    store.cell_rows(sorted(expected.index.get_level_values("pickup_h3_id").unique()))
+    mismatches = []
+
+    def compare(timestamp_hour):
+        if timestamp_hour not in expected.index:
+            return
+        want = expected.loc[timestamp_hour]
+        got = store.features(want.index).set_index("pickup_h3_id")[FEATURE_COLUMNS]
+        a, b = got.to_numpy("float64"), want[FEATURE_COLUMNS].to_numpy("float64")
+        bad = ~(np.isclose(a, b, rtol=0, atol=1e-9) | (np.isnan(a) & np.isnan(b)))
+        if bad.any():
+            mismatches.append((timestamp_hour, int(bad.any(axis=1).sum())))
+
+    # fct_hourly_features có cả những giờ 0 chuyến (không có trong agg): so sánh từng giờ của chuỗi
+    last_hour = demand["timestamp_hour"].max()
+    hours = pd.date_range(series_start, last_hour, freq="h")
+    grouped = dict(tuple(demand.groupby("timestamp_hour")))
+    store.update(series_start, {})
+    for timestamp_hour in hours:
+        group = grouped.get(timestamp_hour)
+        counts = {} if group is None else dict(zip(group["pickup_h3_id"], group["total_pickups"].astype("int64")))
+        store.update(timestamp_hour, counts)
+        compare(timestamp_hour)
+    return len(hours), mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online lag / rolling feature store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in [("verify", "Replay agg_hourly_demand_h3 and compare with fct_hourly_features"),
+                            ("bootstrap", "Build the store at the latest hour and snapshot it")]:
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--source", choices=["bigquery", "duckdb"], default="bigquery")
+        sub.add_argument("--db-path", help="DuckDB file (--source duckdb)")
+        if name == "verify":
+            sub.add_argument("--limit-hours", type=int, default=None, help="Only the first N hours of the series")
+        else:
+            sub.add_argument("--output", required=True, help=".npz snapshot path")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "verify":
+        hours, mismatches = verify(args.source, args.db_path, args.limit_hours)
+        print(f"Replayed {hours:,} hours in {time.perf_counter() - start:.1f}s")
+        if mismatches:
+            for timestamp_hour, cells in mismatches[:20]:
+                print(f"MISMATCH {timestamp_hour}: {cells} cells")
+            raise SystemExit(1)
+        print("All online features match fct_hourly_features")
+
+    elif args.command == "bootstrap":
+        store = bootstrap(args.source, args.db_path)
+        store.snapshot(args.output)
+        latest = pd.Timestamp(np.datetime64(store.current_hour, "h"))
+        print(f"{len(store.cells)} cells at {latest} ({store.hours_seen:,} hours of series) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
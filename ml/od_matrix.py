@@ -0,0 +1,237 @@
+"""
+od_matrix.py
+Zone-to-zone travel distance / duration matrix built from fct_trips
+
+fct_trips.pickup_h3_id / dropoff_h3_id are the H3 cells of the ~265 taxi zones (dim_location),
+so every zone pair fits in a dense array:
+    stats[pickup, dropoff, hour_band, stat]   float32, stat = STATS (median / p90 distance and duration)
+    trip_counts[pickup, dropoff, hour_band]   int32
+Pairs with fewer than MIN_TRIPS trips are NaN; callers fall back to haversine + a flat speed.
+The arrays are saved as .npy and memory-mapped on load, so the service only pages in what it reads.
+Lookups must use zone cells (fare_service.ZoneSnapper for clicked points); ODMatrix.lookup_stats() counts
+hits, unknown cells and sparse pairs so a matrix that never matches is visible.
+
+Usage:
+    python ml/od_matrix.py build --source duckdb --db-path nyc_taxi_pipeline/nyc_taxi_local.duckdb
+    python ml/od_matrix.py build --source bigquery --days 90
+    python ml/od_matrix.py lookup --matrix artifacts/od_matrix --pickup 882a100d25fffff --dropoff 882a1072c1fffff --hour 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from demand_model import DEFAULT_ARTIFACT_DIR, GCP_PROJECT_ID, resolve_artifact_path
+
+MATRIX_NAME = "od_matrix"
+STATS = ["distance_p50", "distance_p90", "duration_p50", "duration_p90"]
+MIN_TRIPS = 5
+
+# Khung giờ: đêm, cao điểm sáng, trưa, cao điểm chiều, tối
+HOUR_BANDS = [(0, 6), (6, 10), (10, 16), (16, 20), (20, 24)]
+BAND_OF_HOUR = np.array([i for i, (start, end) in enumerate(HOUR_BANDS) for _ in range(start, end)], dtype="int64")
+
+BAND_SQL = "CASE " + " ".join(
+    f"WHEN EXTRACT(HOUR FROM picked_up_at) < {end} THEN {i}" for i, (_, end) in enumerate(HOUR_BANDS)
+) + " END"
+
+# Percentile: APPROX_QUANTILES trên BigQuery, quantile_cont trên DuckDB
+QUANTILES = {
+    "bigquery": "APPROX_QUANTILES({column}, 100)[OFFSET({pct})]",
+    "duckdb": "quantile_cont({column}, {pct} / 100)",
+}
+
+AGG_QUERY = """
+    SELECT
+        pickup_h3_id,
+        dropoff_h3_id,
+        {band} AS hour_band,
+        COUNT(*) AS trip_count,
+        {distance_p50} AS distance_p50,
+        {distance_p90} AS distance_p90,
+        {duration_p50} AS duration_p50,
+        {duration_p90} AS duration_p90
+    FROM {table}
+    WHERE trip_distance > 0
+      AND trip_duration_seconds > 0
+      AND trip_duration_seconds < 4 * 3600
+      {date_filter}
+    GROUP BY 1, 2, 3
+"""
+
+
+def aggregate_query(source, table, days=None):
+    quantile = QUANTILES[source]
+    if days and source == "bigquery":
+        date_filter = f"AND picked_up_at >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {int(days)} DAY)"
+    elif days:
+        date_filter = f"AND picked_up_at >= (SELECT MAX(picked_up_at) FROM {table}) - INTERVAL {int(days)} DAY"
+    else:
+        date_filter = ""
+    return AGG_QUERY.format(
+        band=BAND_SQL,
+        table=table,
+        date_filter=date_filter,
+        distance_p50=quantile.format(column="trip_distance", pct=50),
+        distance_p90=quantile.format(column="trip_distance", pct=90),
+        duration_p50=quantile.format(column="trip_duration_seconds", pct=50),
+        duration_p90=quantile.format(column="trip_duration_seconds", pct=90),
+    )
+
+
+def fetch_aggregates(source="bigquery", db_path=None, days=None):
+    """One row per (pickup_h3_id, dropoff_h3_id, hour_band) as a DataFrame."""
+    if source == "duckdb":
+        import duckdb
+
+        con = duckdb.connect(db_path, read_only=True)
+        frame = con.execute(aggregate_query("duckdb", "facts.fct_trips", days)).df()
+        con.close()
+        return frame
+
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=GCP_PROJECT_ID)
+    return client.query(aggregate_query("bigquery", f"`{GCP_PROJECT_ID}.facts.fct_trips`", days)).to_dataframe()
+
+
+def build_arrays(frame, min_trips=MIN_TRIPS):
+    """(cells, stats, trip_counts) dense arrays from the aggregated rows."""
+    cells = sorted(set(frame["pickup_h3_id"]) | set(frame["dropoff_h3_id"]))
+    index = {cell: i for i, cell in enumerate(cells)}
+    n, bands = len(cells), len(HOUR_BANDS)
+
+    stats = np.full((n, n, bands, len(STATS)), np.nan, dtype="float32")
+    trip_counts = np.zeros((n, n, bands), dtype="int32")
+    pickup = frame["pickup_h3_id"].map(index).to_numpy()
+    dropoff = frame["dropoff_h3_id"].map(index).to_numpy()
+    band = frame["hour_band"].astype("int64").to_numpy()
+    trip_counts[pickup, dropoff, band] = frame["trip_count"].to_numpy()
+
+    enough = frame["trip_count"].to_numpy() >= min_trips
+    stats[pickup[enough], dropoff[enough], band[enough]] = frame.loc[enough, STATS].astype("float32").to_numpy()
+    return cells, stats, trip_counts
+
+
+def save_matrix(cells, stats, trip_counts, metadata, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """Saves <artifact_dir>/od_matrix/<version>/{stats.npy, trip_counts.npy, metadata.json} and registers it."""
+    from registry import register
+
+    fingerprint = hashlib.sha256(trip_counts.tobytes() + "".join(cells).encode()).hexdigest()[:8]
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + "-" + fingerprint
+    matrix_dir = os.path.join(artifact_dir, MATRIX_NAME, version)
+    os.makedirs(matrix_dir, exist_ok=True)
+    np.save(os.path.join(matrix_dir, "stats.npy"), stats)
+    np.save(os.path.join(matrix_dir, "trip_counts.npy"), trip_counts)
+    with open(os.path.join(matrix_dir, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump({**metadata, "version": version, "cells": cells, "stats": STATS, "hour_bands": HOUR_BANDS}, f)
+
+    register(MATRIX_NAME, version, {**metadata, "data_fingerprint": fingerprint, "features": STATS}, artifact_dir)
+    return matrix_dir
+
+
+class ODMatrix:
+    """Memory-mapped OD travel matrix; O(1) lookups by (pickup cell, dropoff cell, hour)."""
+
+    def __init__(self, path):
+        path = resolve_artifact_path(path)
+        with open(os.path.join(path, "metadata.json"), "r", encoding="utf-8") as f:
+            self.metadata = json.load(f)
+        self.version = self.metadata["version"]
+        self.index = {cell: i for i, cell in enumerate(self.metadata["cells"])}
+        self.stats = np.load(os.path.join(path, "stats.npy"), mmap_mode="r")
+        self.trip_counts = np.load(os.path.join(path, "trip_counts.npy"), mmap_mode="r")
+        self.lock = threading.Lock()
+        self.counts = {"hits": 0, "unknown_cell": 0, "sparse_pair": 0}
+
+    def count(self, hits=0, unknown_cell=0, sparse_pair=0):
+        with self.lock:
+            self.counts["hits"] += hits
+            self.counts["unknown_cell"] += unknown_cell
+            self.counts["sparse_pair"] += sparse_pair
+
+    def lookup_stats(self):
+        """Lookup counters; a high unknown_cell share means callers pass cells that are not zone cells."""
+        with self.lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        return {**counts, "lookups": total, "hit_rate": counts["hits"] / total if total else None}
+
+    def lookup(self, pickup_h3, dropoff_h3, hour):
+        """(median distance miles, median duration seconds), or None for unseen / sparse pairs."""
+        i, j = self.index.get(pickup_h3), self.index.get(dropoff_h3)
+        if i is None or j is None:
+            self.count(unknown_cell=1)
+            return None
+        distance, _, duration, _ = self.stats[i, j, BAND_OF_HOUR[hour]]
+        if distance != distance:
+            self.count(sparse_pair=1)
+            return None
+        self.count(hits=1)
+        return float(distance), float(duration)
+
+    def lookup_arrays(self, pickup_cells, dropoff_cells, hours):
+        """Vectorised lookup: (distance, duration) float64 arrays, NaN where the pair is unknown."""
+        missing = len(self.index)
+        i = np.array([self.index.get(cell, missing) for cell in pickup_cells], dtype="int64")
+        j = np.array([self.index.get(cell, missing) for cell in dropoff_cells], dtype="int64")
+        known = (i < missing) & (j < missing)
+        distance = np.full(len(i), np.nan)
+        duration = np.full(len(i), np.nan)
+        rows = self.stats[i[known], j[known], BAND_OF_HOUR[np.asarray(hours)[known]]]
+        distance[known], duration[known] = rows[:, 0], rows[:, 2]
+        hits = int(np.isfinite(distance).sum())
+        self.count(hits=hits, unknown_cell=int((~known).sum()), sparse_pair=int(known.sum()) - hits)
+        return distance, duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zone-to-zone travel distance / duration matrix")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Aggregate fct_trips and save the matrix artefact")
+    build_parser.add_argument("--source", choices=["bigquery", "duckdb"], default="bigquery")
+    build_parser.add_argument("--db-path", help="DuckDB file (--source duckdb)")
+    build_parser.add_argument("--days", type=int, default=None, help="Only the last N days of trips")
+    build_parser.add_argument("--min-trips", type=int, default=MIN_TRIPS)
+    build_parser.add_argument("--artifact-dir", default=DEFAULT_ARTIFACT_DIR)
+
+    lookup_parser = subparsers.add_parser("lookup", help="Print the stats of one zone pair")
+    lookup_parser.add_argument("--matrix", default=os.path.join(DEFAULT_ARTIFACT_DIR, MATRIX_NAME))
+    lookup_parser.add_argument("--pickup", required=True)
+    lookup_parser.add_argument("--dropoff", required=True)
+    lookup_parser.add_argument("--hour", type=int, required=True)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        frame = fetch_aggregates(args.source, args.db_path, args.days)
+        cells, stats, trip_counts = build_arrays(frame, args.min_trips)
+        metadata = {
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "source": args.source,
+            "days": args.days,
+            "min_trips": args.min_trips,
+            "trips": int(trip_counts.sum()),
+        }
+        matrix_dir = save_matrix(cells, stats, trip_counts, metadata, args.artifact_dir)
+        filled = np.isfinite(stats[..., 0]).mean()
+        print(f"{len(cells)} cells x {len(HOUR_BANDS)} hour bands, {filled:.1%} of pairs with >= {args.min_trips} trips")
+        print(f"Saved {matrix_dir}")
+
+    elif args.command == "lookup":
+        matrix = ODMatrix(args.matrix)
+        i, j = matrix.index.get(args.pickup), matrix.index.get(args.dropoff)
+        if i is None or j is None:
+            print("Unknown cell")
+            return
+        band = BAND_OF_HOUR[args.hour]
+        values = dict(zip(STATS, matrix.stats[i, j, band].tolist()))
+        print(json.dumps({**values, "trip_count": int(matrix.trip_counts[i, j, band])}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+registry.py
+Lightweight model registry: versioned artefacts + a manifest per model, hot reload for serving code
+
+Layout (local directory, default artifacts/):
+    <root>/<model_name>/<version>/...           artefact files written by demand_model / fare_model / od_matrix / baseline
+    <root>/<model_name>/manifest.json           every version with its data fingerprint, metrics and feature schema,
+                                                plus the `current` and `previous` pointers
+    <root>/<model_name>/LATEST                  = current (kept for demand_model.resolve_artifact_path)
+A version can also be a pointer only: a BQML model (`bqml_model`, registered from model_training_log /
+fare_training_runs, since CREATE OR REPLACE MODEL overwrites it in place) or a copy on GCS (`gcs_uri`).
+
+Serving code wraps a loader in HotModel: it re-reads the manifest at most every `check_interval` seconds
+and swaps to the new current version without a restart. The previous version stays loaded, so a
+rollback (`python ml/registry.py rollback ...`) is picked up without loading anything. HotModel only
+serves local artefacts: a pointer-only current version keeps the loaded one (or, at start-up, the newest
+local version) and is reported in `last_error`.
+
+register / promote / rollback hold <root>/<model_name>/manifest.lock (created with O_EXCL, so it also
+works on Windows) around their read-modify-write, so concurrent trainers never drop each other's version.
+
+Usage:
+    python ml/registry.py list --model fare_model
+    python ml/registry.py promote --model fare_model --version 20251203T080000-1a2b3c4d
+    python ml/registry.py rollback --model fare_model
+    python ml/registry.py register-bqml --model fare_estimation_model
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from demand_model import DEFAULT_ARTIFACT_DIR, GCP_PROJECT_ID
+
+MANIFEST = "manifest.json"
+MANIFEST_LOCK = "manifest.lock"
+
+
+# =====================
+# Manifest
+# =====================
+def manifest_path(model_name, root=DEFAULT_ARTIFACT_DIR):
+    return os.path.join(root, model_name, MANIFEST)
+
+
+def load_manifest(model_name, root=DEFAULT_ARTIFACT_DIR):
+    path = manifest_path(model_name, root)
+    if not os.path.exists(path):
+        return {"model_name": model_name, "current": None, "previous": None, "versions": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@contextmanager
+def manifest_lock(model_name, root=DEFAULT_ARTIFACT_DIR, timeout=30, stale_seconds=120):
+    """Exclusive lock file around a read-modify-write of the manifest."""
+    model_dir = os.path.join(root, model_name)
+    os.makedirs(model_dir, exist_ok=True)
+    path = os.path.join(model_dir, MANIFEST_LOCK)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                # Tiến trình giữ lock đã chết (lock quá cũ) -> xóa rồi thử lại
+                if time.time() - os.stat(path).st_mtime > stale_seconds:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Could not lock {path} within {timeout}s")
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(path)
+
+
+def write_manifest(manifest, root=DEFAULT_ARTIFACT_DIR):
+    """Atomic write (tmp file + rename) so readers never see a partial manifest; also updates LATEST."""
+    model_dir = os.path.join(root, manifest["model_name"])
+    os.makedirs(model_dir, exist_ok=True)
+    tmp_path = manifest_path(manifest["model_name"], root) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path(manifest["model_name"], root))
+
+    current = manifest["versions"].get(manifest["current"] or "", {})
+    if current.get("path"):
+        # File text thay cho symlink (Windows)
+        with open(os.path.join(model_dir, "LATEST"), "w", encoding="utf-8") as f:
+            f.write(current["path"])
+
+
+def feature_schema(metadata):
+    """Ordered feature names, with the categorical ones (those with a category list) marked."""
+    categorical = set(metadata.get("categories") or {}) if isinstance(metadata.get("categories"), dict) else set()
+    if isinstance(metadata.get("categories"), list):
+        categorical = {metadata["features"][0]}      # demand_model: list of pickup_h3_id categories
+    return [
+        {"name": name, "type": "categorical" if name in categorical else "numeric"}
+        for name in metadata.get("features", [])
+    ]
+
+
+def register(model_name, version, metadata, root=DEFAULT_ARTIFACT_DIR, promote=True,
+             local=True, gcs_uri=None, bqml_model=None):
+    """Adds `version` (artefact in <root>/<model_name>/<version>/ when `local`) to the manifest."""
+    with manifest_lock(model_name, root):
+        manifest = load_manifest(model_name, root)
+        manifest["versions"][version] = {
+            "registered_at": datetime.now(timezone.utc).isoformat(),
+            "path": version if local else None,
+            "data_fingerprint": metadata.get("data_fingerprint"),
+            "metrics": metadata.get("metrics", {}),
+            "features": feature_schema(metadata),
+            "training_rows": metadata.get("training_rows"),
+            "gcs_uri": gcs_uri,
+            "bqml_model": bqml_model,
+        }
+        if promote or manifest["current"] is None:
+            manifest["previous"], manifest["current"] = manifest["current"], version
+        write_manifest(manifest, root)
+    return manifest
+
+
+def promote(model_name, version, root=DEFAULT_ARTIFACT_DIR):
+    with manifest_lock(model_name, root):
+        manifest = load_manifest(model_name, root)
+        if version not in manifest["versions"]:
+            raise ValueError(f"{model_name} has no version {version}")
+        if version != manifest["current"]:
+            manifest["previous"], manifest["current"] = manifest["current"], version
+            write_manifest(manifest, root)
+    return manifest
+
+
+def rollback(model_name, root=DEFAULT_ARTIFACT_DIR):
+    """Swaps current and previous (running it twice rolls forward again)."""
+    with manifest_lock(model_name, root):
+        manifest = load_manifest(model_name, root)
+        if not manifest["previous"]:
+            raise ValueError(f"{model_name} has no previous version to roll back to")
+        manifest["previous"], manifest["current"] = manifest["current"], manifest["previous"]
+        write_manifest(manifest, root)
+    return manifest
+
+
+def current_path(model_name, root=DEFAULT_ARTIFACT_DIR):
+    """(version, local artefact directory) of the current version; the directory is None for a pointer-only version."""
+    manifest = load_manifest(model_name, root)
+    version = manifest["current"]
+    if version is None:
+        raise FileNotFoundError(f"No registered version of {model_name} in {root}")
+    path = manifest["versions"][version]["path"]
+    return version, os.path.join(root, model_name, path) if path else None
+
+
+def latest_local_version(manifest):
+    """Most recently registered version with a local artefact (None when every version is a pointer)."""
+    local = [(entry["registered_at"], version) for version, entry in manifest["versions"].items() if entry["path"]]
+    return max(local)[1] if local else None
+
+
+# =====================
+# Hot reload
+# =====================
+class HotModel:
+    """
+    loader(artefact_dir) -> served object, swapped when the manifest's current version changes.
+    Keeps the previous object for instant rollback; a failed load keeps serving the loaded version.
+    """
+
+    def __init__(self, model_name, loader, root=DEFAULT_ARTIFACT_DIR, check_interval=30, clock=time.monotonic):
+        self.model_name = model_name
+        self.loader = loader
+        self.root = root
+        self.check_interval = check_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.loaded = {}              # version -> object (current và previous)
+        self.version = None
+        self.manifest_mtime = None
+        self.last_check = None
+        self.last_error = None
+        self.reload()
+
+    def reload(self):
+        with self.lock:
+            self.manifest_mtime = os.stat(manifest_path(self.model_name, self.root)).st_mtime_ns
+            version, path = current_path(self.model_name, self.root)
+            if path is None:
+                manifest = load_manifest(self.model_name, self.root)
+                entry = manifest["versions"][version]
+                error = ValueError(
+                    f"{self.model_name}: current version {version} has no local artefact "
+                    f"({entry['bqml_model'] or entry['gcs_uri']}); HotModel only serves local versions"
+                )
+                if self.version is not None:
+                    raise error                     # get(): giữ phiên bản đang chạy, lỗi ở last_error
+                # Khởi động: phục vụ bản local mới nhất thay vì không có model nào
+                version = latest_local_version(manifest)
+                if version is None:
+                    raise error
+                path = os.path.join(self.root, self.model_name, manifest["versions"][version]["path"])
+                self.last_error = error
+            if version != self.version:
+                if version not in self.loaded:
+                    self.loaded[version] = self.loader(path)
+                # Chỉ giữ phiên bản mới và phiên bản đang chạy (để rollback tức thì)
+                self.loaded = {v: obj for v, obj in self.loaded.items() if v in (version, self.version)}
+                self.version = version
+            self.last_check = self.clock()
+
+    def get(self):
+        now = self.clock()
+        if now - self.last_check >= self.check_interval:
+            self.last_check = now
+            try:
+                if os.stat(manifest_path(self.model_name, self.root)).st_mtime_ns != self.manifest_mtime:
+                    self.reload()
+                    self.last_error = None
+            except Exception as e:          # manifest đang ghi dở / artefact hỏng: giữ phiên bản cũ
+                self.last_error = e
+        return self.loaded[self.version]
+
+
+# =====================
+# BQML pointers
+# =====================
+def register_bqml(model_name, model_id=None, root=DEFAULT_ARTIFACT_DIR, promote=True):
+    """
+    Registers the BQML model as it is now: version = <model_name>@<last trained run_at> (same format as
+    run_forecast.sql's model_version), fingerprint from model_training_log.input_partitions,
+    metrics from fare_training_runs when there are any, features from ML.FEATURE_INFO.
+    """
+    import hashlib
+
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=GCP_PROJECT_ID)
+    model_id = model_id or f"{GCP_PROJECT_ID}.ml_models.{model_name}"
+    params = [bigquery.ScalarQueryParameter("model_name", "STRING", model_name)]
+    config = bigquery.QueryJobConfig(query_parameters=params)
+
+    log_rows = list(client.query(f"""
+        SELECT run_at, TO_JSON_STRING(input_partitions) AS input_partitions, total_rows
+        FROM `{GCP_PROJECT_ID}.ml_models.model_training_log`
+        WHERE model_name = @model_name AND status = 'trained'
+        ORDER BY run_at DESC
+        LIMIT 1
+    """, job_config=config).result())
+    run_rows = list(client.query(f"""
+        SELECT trained_at, training_rows, mean_absolute_error, root_mean_squared_error, r2_score
+        FROM `{GCP_PROJECT_ID}.ml_models.fare_training_runs`
+        WHERE model_name = @model_name
+        ORDER BY trained_at DESC
+        LIMIT 1
+    """, job_config=config).result())
+    features = [row.input for row in client.query(f"SELECT input FROM ML.FEATURE_INFO(MODEL `{model_id}`)").result()]
+
+    trained_at = log_rows[0].run_at if log_rows else run_rows[0].trained_at if run_rows else None
+    if trained_at is None:
+        raise ValueError(f"No training run of {model_name} in model_training_log / fare_training_runs")
+    metadata = {
+        "features": features,
+        "data_fingerprint": hashlib.sha256(log_rows[0].input_partitions.encode()).hexdigest()[:16] if log_rows else None,
+        "training_rows": run_rows[0].training_rows if run_rows else (log_rows[0].total_rows if log_rows else None),
+        "metrics": {
+            key: getattr(run_rows[0], key) for key in ("mean_absolute_error", "root_mean_squared_error", "r2_score")
+        } if run_rows else {},
+    }
+    version = f"{model_name}@{trained_at:%Y%m%dT%H%M%S}"
+    return register(model_name, version, metadata, root, promote=promote, local=False, bqml_model=model_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model registry (versions, promote / rollback)")
+    parser.add_argument("--root", default=DEFAULT_ARTIFACT_DIR, help="Registry directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="Versions of a model")
+    list_parser.add_argument("--model", required=True)
+    promote_parser = subparsers.add_parser("promote", help="Make a version current")
+    promote_parser.add_argument("--model", required=True)
+    promote_parser.add_argument("--version", required=True)
+    rollback_parser = subparsers.add_parser("rollback", help="Swap current and previous")
+    rollback_parser.add_argument("--model", required=True)
+    bqml_parser = subparsers.add_parser("register-bqml", help="Record the current BQML model as a version")
+    bqml_parser.add_argument("--model", required=True, help="e.g. fare_estimation_model")
+    bqml_parser.add_argument("--model-id", default=None, help="Default: <project>.ml_models.<model>")
+    bqml_parser.add_argument("--no-promote", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        manifest = load_manifest(args.model, args.root)
+        for version, entry in sorted(manifest["versions"].items(), key=lambda item: item[1]["registered_at"]):
+            marker = "*" if version == manifest["current"] else "-" if version == manifest["previous"] else " "
+            location = entry["path"] or entry["bqml_model"] or entry["gcs_uri"]
+            print(f"{marker} {version}  fingerprint={entry['data_fingerprint']}  "
+                  f"metrics={json.dumps(entry['metrics'])}  {location}")
+        return
+
+    if args.command == "promote":
+        manifest = promote(args.model, args.version, args.root)
+    elif args.command == "rollback":
+        manifest = rollback(args.model, args.root)
+    else:
+        manifest = register_bqml(args.model, args.model_id, args.root, promote=not args.no_promote)
+    print(f"{args.model}: current={manifest['current']} previous={manifest['previous']}")
+
+
+if __name__ == "__main__":
+    main()
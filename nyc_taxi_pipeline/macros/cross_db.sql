@@ -0,0 +1,248 @@
+-- macros/cross_db.sql
+-- Cross-database macros: cùng một model chạy được trên BigQuery (prod) và DuckDB (local)
+-- default__ sinh đúng SQL BigQuery như trước, duckdb__ là bản tương đương cho target `duckdb`
+
+{#
+    TIMESTAMP_ADD(ts, INTERVAL amount datepart)
+#}
+{% macro timestamp_add_interval(ts_expr, amount, datepart) -%}
+    {{ return(adapter.dispatch('timestamp_add_interval')(ts_expr, amount, datepart)) }}
+{%- endmacro %}
+
+{% macro default__timestamp_add_interval(ts_expr, amount, datepart) -%}
+    TIMESTAMP_ADD({{ ts_expr }}, INTERVAL {{ amount }} {{ datepart }})
+{%- endmacro %}
+
+{% macro duckdb__timestamp_add_interval(ts_expr, amount, datepart) -%}
+    ({{ ts_expr }} + INTERVAL ({{ amount }}) {{ datepart }})
+{%- endmacro %}
+
+
+{#
+    TIMESTAMP_TRUNC(ts, datepart)
+#}
+{% macro timestamp_trunc_to(ts_expr, datepart) -%}
+    {{ return(adapter.dispatch('timestamp_trunc_to')(ts_expr, datepart)) }}
+{%- endmacro %}
+
+{% macro default__timestamp_trunc_to(ts_expr, datepart) -%}
+    timestamp_trunc({{ ts_expr }}, {{ datepart }})
+{%- endmacro %}
+
+{% macro duckdb__timestamp_trunc_to(ts_expr, datepart) -%}
+    date_trunc('{{ datepart | lower }}', {{ ts_expr }})
+{%- endmacro %}
+
+
+{#
+    TIMESTAMP_DIFF(end_ts, start_ts, datepart)
+#}
+{% macro timestamp_diff_in(end_expr, start_expr, datepart) -%}
+    {{ return(adapter.dispatch('timestamp_diff_in')(end_expr, start_expr, datepart)) }}
+{%- endmacro %}
+
+{% macro default__timestamp_diff_in(end_expr, start_expr, datepart) -%}
+    timestamp_diff({{ end_expr }}, {{ start_expr }}, {{ datepart }})
+{%- endmacro %}
+
+{% macro duckdb__timestamp_diff_in(end_expr, start_expr, datepart) -%}
+    date_diff('{{ datepart | lower }}', {{ start_expr }}, {{ end_expr }})
+{%- endmacro %}
+
+
+{#
+    DATE_DIFF(end_date, start_date, DAY)
+#}
+{% macro date_diff_days(end_expr, start_expr) -%}
+    {{ return(adapter.dispatch('date_diff_days')(end_expr, start_expr)) }}
+{%- endmacro %}
+
+{% macro default__date_diff_days(end_expr, start_expr) -%}
+    DATE_DIFF({{ end_expr }}, {{ start_expr }}, DAY)
+{%- endmacro %}
+
+{% macro duckdb__date_diff_days(end_expr, start_expr) -%}
+    date_diff('day', {{ start_expr }}, {{ end_expr }})
+{%- endmacro %}
+
+
+{#
+    Thứ trong tuần theo quy ước BigQuery: 1(Sun) - 7(Sat)
+    DuckDB trả về 0(Sun) - 6(Sat) nên phải cộng 1
+#}
+{% macro day_of_week(expr) -%}
+    {{ return(adapter.dispatch('day_of_week')(expr)) }}
+{%- endmacro %}
+
+{% macro default__day_of_week(expr) -%}
+    extract(dayofweek from {{ expr }})
+{%- endmacro %}
+
+{% macro duckdb__day_of_week(expr) -%}
+    (extract(dow from {{ expr }}) + 1)
+{%- endmacro %}
+
+
+{#
+    FORMAT_DATE(format, date)
+#}
+{% macro format_date_as(format_string, date_expr) -%}
+    {{ return(adapter.dispatch('format_date_as')(format_string, date_expr)) }}
+{%- endmacro %}
+
+{% macro default__format_date_as(format_string, date_expr) -%}
+    format_date('{{ format_string }}', {{ date_expr }})
+{%- endmacro %}
+
+{% macro duckdb__format_date_as(format_string, date_expr) -%}
+    strftime({{ date_expr }}, '{{ format_string }}')
+{%- endmacro %}
+
+
+{#
+    Bảng lịch một cột `date_day` từ start_date đến end_date (mỗi ngày một dòng)
+    start_date / end_date là biểu thức SQL kiểu DATE: literal ("'2025-01-01'") hoặc scalar subquery
+    Dùng như một subquery: select date_day from {{ date_spine("'2025-01-01'", "'2025-12-31'") }}
+#}
+{% macro date_spine(start_date, end_date) -%}
+    {{ return(adapter.dispatch('date_spine')(start_date, end_date)) }}
+{%- endmacro %}
+
+{% macro default__date_spine(start_date, end_date) -%}
+    (select date_day from unnest(generate_date_array({{ start_date }}, {{ end_date }}, interval 1 day)) as date_day)
+{%- endmacro %}
+
+{% macro duckdb__date_spine(start_date, end_date) -%}
+    (select cast(unnest(generate_series(cast({{ start_date }} as date), cast({{ end_date }} as date), interval 1 day)) as date) as date_day)
+{%- endmacro %}
+
+
+{#
+    Dãy số nguyên một cột `n` từ start_value đến end_value (gồm cả hai đầu)
+    Dùng như một subquery: select n from {{ integer_series(0, 23) }}
+#}
+{% macro integer_series(start_value, end_value) -%}
+    {{ return(adapter.dispatch('integer_series')(start_value, end_value)) }}
+{%- endmacro %}
+
+{% macro default__integer_series(start_value, end_value) -%}
+    (select n from unnest(generate_array({{ start_value }}, {{ end_value }})) as n)
+{%- endmacro %}
+
+{% macro duckdb__integer_series(start_value, end_value) -%}
+    (select cast(unnest(generate_series({{ start_value }}, {{ end_value }})) as bigint) as n)
+{%- endmacro %}
+
+
+{#
+    TIMESTAMP_SECONDS(unix_seconds)
+#}
+{% macro timestamp_from_unix_seconds(expr) -%}
+    {{ return(adapter.dispatch('timestamp_from_unix_seconds')(expr)) }}
+{%- endmacro %}
+
+{% macro default__timestamp_from_unix_seconds(expr) -%}
+    timestamp_seconds({{ expr }})
+{%- endmacro %}
+
+{% macro duckdb__timestamp_from_unix_seconds(expr) -%}
+    to_timestamp({{ expr }})
+{%- endmacro %}
+
+
+{#
+    JSON_VALUE(json_string, path) -> STRING scalar
+#}
+{% macro json_value_string(json_expr, json_path) -%}
+    {{ return(adapter.dispatch('json_value_string')(json_expr, json_path)) }}
+{%- endmacro %}
+
+{% macro default__json_value_string(json_expr, json_path) -%}
+    json_value({{ json_expr }}, '{{ json_path }}')
+{%- endmacro %}
+
+{% macro duckdb__json_value_string(json_expr, json_path) -%}
+    json_extract_string({{ json_expr }}, '{{ json_path }}')
+{%- endmacro %}
+
+
+{#
+    ST_CENTROID(geography)
+    DuckDB dùng extension `spatial` (GEOMETRY phẳng, đủ chính xác ở quy mô một taxi zone)
+#}
+{% macro geog_centroid(geog_expr) -%}
+    {{ return(adapter.dispatch('geog_centroid')(geog_expr)) }}
+{%- endmacro %}
+
+{% macro default__geog_centroid(geog_expr) -%}
+    ST_CENTROID({{ geog_expr }})
+{%- endmacro %}
+
+{% macro duckdb__geog_centroid(geog_expr) -%}
+    ST_Centroid({{ geog_expr }})
+{%- endmacro %}
+
+
+{#
+    LOGICAL_OR(bool) aggregate
+#}
+{% macro bool_or_agg(expr) -%}
+    {{ return(adapter.dispatch('bool_or_agg')(expr)) }}
+{%- endmacro %}
+
+{% macro default__bool_or_agg(expr) -%}
+    logical_or({{ expr }})
+{%- endmacro %}
+
+{% macro duckdb__bool_or_agg(expr) -%}
+    bool_or({{ expr }})
+{%- endmacro %}
+
+
+{#
+    SAFE_DIVIDE(numerator, denominator): NULL khi mẫu số bằng 0
+#}
+{% macro safe_divide(numerator, denominator) -%}
+    {{ return(adapter.dispatch('safe_divide')(numerator, denominator)) }}
+{%- endmacro %}
+
+{% macro default__safe_divide(numerator, denominator) -%}
+    SAFE_DIVIDE({{ numerator }}, {{ denominator }})
+{%- endmacro %}
+
+{% macro duckdb__safe_divide(numerator, denominator) -%}
+    ({{ numerator }}) / nullif({{ denominator }}, 0)
+{%- endmacro %}
+
+
+{#
+    RAND(): số ngẫu nhiên đều trong [0, 1)
+#}
+{% macro random_uniform() -%}
+    {{ return(adapter.dispatch('random_uniform')()) }}
+{%- endmacro %}
+
+{% macro default__random_uniform() -%}
+    RAND()
+{%- endmacro %}
+
+{% macro duckdb__random_uniform() -%}
+    random()
+{%- endmacro %}
+
+
+{#
+    CROSS JOIN UNNEST(array) AS alias: mỗi phần tử của mảng thành một dòng (cột `alias`)
+    Dùng sau một bảng trong FROM: from zones cross join {{ unnest_as('zones.cells', 'cell') }}
+#}
+{% macro unnest_as(array_expr, alias) -%}
+    {{ return(adapter.dispatch('unnest_as')(array_expr, alias)) }}
+{%- endmacro %}
+
+{% macro default__unnest_as(array_expr, alias) -%}
+    unnest({{ array_expr }}) as {{ alias }}
+{%- endmacro %}
+
+{% macro duckdb__unnest_as(array_expr, alias) -%}
+    unnest({{ array_expr }}) as _{{ alias }}({{ alias }})
+{%- endmacro %}
@@ -0,0 +1,111 @@
+-- macros/h3.sql
+-- Helper macros cho chỉ mục H3 (Uber H3 hexagonal grid)
+
+{#
+    Trả về ô H3 (dạng chuỗi hex, ví dụ '882a100d67fffff') chứa một điểm GEOGRAPHY.
+    - BigQuery: thư viện UDF công khai của CARTO (carto-os, multi-region US)
+    - DuckDB: community extension `h3` (khai báo trong profiles.yml)
+#}
+{% macro h3_from_geog_point(geog_expr, resolution) -%}
+    {{ return(adapter.dispatch('h3_from_geog_point')(geog_expr, resolution)) }}
+{%- endmacro %}
+
+{% macro default__h3_from_geog_point(geog_expr, resolution) -%}
+    `carto-os`.carto.H3_FROMGEOGPOINT({{ geog_expr }}, {{ resolution }})
+{%- endmacro %}
+
+{% macro duckdb__h3_from_geog_point(geog_expr, resolution) -%}
+    h3_latlng_to_cell_string(ST_Y({{ geog_expr }}), ST_X({{ geog_expr }}), {{ resolution }})
+{%- endmacro %}
+
+
+{#
+    Mảng các ô H3 (chuỗi hex) có tâm nằm trong một polygon / multipolygon (polyfill)
+    - BigQuery: H3_POLYFILL của CARTO
+    - DuckDB: extension `h3` chỉ nhận POLYGON dạng WKT -> tách multipolygon bằng ST_Dump rồi gộp lại
+#}
+{% macro h3_polyfill(geog_expr, resolution) -%}
+    {{ return(adapter.dispatch('h3_polyfill')(geog_expr, resolution)) }}
+{%- endmacro %}
+
+{% macro default__h3_polyfill(geog_expr, resolution) -%}
+    `carto-os`.carto.H3_POLYFILL({{ geog_expr }}, {{ resolution }})
+{%- endmacro %}
+
+{% macro duckdb__h3_polyfill(geog_expr, resolution) -%}
+    flatten(list_transform(
+        ST_Dump({{ geog_expr }}),
+        part -> h3_polygon_wkt_to_cells_string(ST_AsText(part.geom), {{ resolution }})
+    ))
+{%- endmacro %}
+
+
+{#
+    Mảng các ô H3 cách ô `cell_expr` không quá `k` bước (gồm cả chính nó)
+    - BigQuery: H3_KRING của CARTO
+    - DuckDB: extension `h3`
+#}
+{% macro h3_grid_disk(cell_expr, k) -%}
+    {{ return(adapter.dispatch('h3_grid_disk')(cell_expr, k)) }}
+{%- endmacro %}
+
+{% macro default__h3_grid_disk(cell_expr, k) -%}
+    `carto-os`.carto.H3_KRING({{ cell_expr }}, {{ k }})
+{%- endmacro %}
+
+{% macro duckdb__h3_grid_disk(cell_expr, k) -%}
+    h3_grid_disk({{ cell_expr }}, {{ k }})
+{%- endmacro %}
+
+
+{#
+    Tâm (vĩ độ / kinh độ) của một ô H3 dạng chuỗi hex.
+    - BigQuery: H3_CENTER của CARTO trả về GEOGRAPHY point
+    - DuckDB: extension `h3`
+#}
+{% macro h3_cell_latitude(cell_expr) -%}
+    {{ return(adapter.dispatch('h3_cell_latitude')(cell_expr)) }}
+{%- endmacro %}
+
+{% macro default__h3_cell_latitude(cell_expr) -%}
+    ST_Y(`carto-os`.carto.H3_CENTER({{ cell_expr }}))
+{%- endmacro %}
+
+{% macro duckdb__h3_cell_latitude(cell_expr) -%}
+    h3_cell_to_lat({{ cell_expr }})
+{%- endmacro %}
+
+{% macro h3_cell_longitude(cell_expr) -%}
+    {{ return(adapter.dispatch('h3_cell_longitude')(cell_expr)) }}
+{%- endmacro %}
+
+{% macro default__h3_cell_longitude(cell_expr) -%}
+    ST_X(`carto-os`.carto.H3_CENTER({{ cell_expr }}))
+{%- endmacro %}
+
+{% macro duckdb__h3_cell_longitude(cell_expr) -%}
+    h3_cell_to_lng({{ cell_expr }})
+{%- endmacro %}
+
+
+{#
+    Trả về ô cha ở độ phân giải `resolution` của một ô H3 (dạng chuỗi hex).
+
+    Không cần UDF: ô cha chỉ là phép thao tác bit trên chỉ mục 64-bit
+    - bits 52-55 chứa độ phân giải -> ghi đè bằng `resolution`
+    - mỗi độ phân giải con chiếm 3 bit -> các digit mịn hơn `resolution` được đặt thành 7 (111)
+    Các hằng số được tính sẵn trong Jinja nên SQL sinh ra chỉ gồm AND/OR với literal.
+#}
+{% macro h3_to_parent(cell_expr, resolution) -%}
+    {%- set keep_mask = (2 ** 63 - 1) - (15 * 2 ** 52) -%}
+    {%- set parent_bits = resolution * 2 ** 52 + (2 ** (3 * (15 - resolution)) - 1) -%}
+    {{ return(adapter.dispatch('h3_to_parent')(cell_expr, keep_mask, parent_bits)) }}
+{%- endmacro %}
+
+{% macro default__h3_to_parent(cell_expr, keep_mask, parent_bits) -%}
+    format('%x', (cast(concat('0x', {{ cell_expr }}) as int64) & {{ keep_mask }}) | {{ parent_bits }})
+{%- endmacro %}
+
+{% macro duckdb__h3_to_parent(cell_expr, keep_mask, parent_bits) -%}
+    printf('%x', (cast('0x' || {{ cell_expr }} as bigint) & {{ keep_mask }}) | {{ parent_bits }})
+{%- endmacro %}
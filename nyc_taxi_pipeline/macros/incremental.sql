@@ -0,0 +1,66 @@
+-- macros/incremental.sql
+-- Helpers cho các model incremental partition theo ngày
+-- (insert_overwrite trên BigQuery, delete+insert theo cột ngày trên DuckDB)
+
+{#
+    Mốc bắt đầu của một lần chạy incremental, kiểu TIMESTAMP:
+    ngày lớn nhất đã có trong bảng ({{ this }}) lùi lại `lookback_days` ngày.
+    Các partition từ mốc này trở đi được tính lại (dữ liệu đến trễ).
+    Cột TIMESTAMP được cắt về đầu ngày để không ghi đè một partition bằng nửa ngày dữ liệu.
+    So sánh với cột DATE thì bọc bằng date(...).
+#}
+{% macro incremental_lookback_start(date_column, lookback_days) -%}
+    {{ timestamp_add_interval(
+        "(select cast(cast(max(" ~ date_column ~ ") as date) as timestamp) from " ~ this ~ ")",
+        -lookback_days, 'DAY') }}
+{%- endmacro %}
+
+
+{#
+    incremental_strategy: ghi đè nguyên partition trên BigQuery,
+    xóa rồi chèn lại các ngày đó trên DuckDB (unique_key = cột partition)
+#}
+{% macro partition_overwrite_strategy() -%}
+    {{ return('insert_overwrite' if target.type == 'bigquery' else 'delete+insert') }}
+{%- endmacro %}
+
+{% macro partition_overwrite_key(date_column) -%}
+    {{ return(none if target.type == 'bigquery' else date_column) }}
+{%- endmacro %}
+
+
+{#
+    Backfill theo lô ngày (tools/backfill.py): --vars '{backfill_start: "2025-01-01", backfill_end: "2025-01-08"}'
+    Model chỉ tính [backfill_start, backfill_end) và chỉ ghi đè các partition đó, kể cả khi bảng chưa tồn tại
+    hoặc chạy với --full-refresh (lô đầu tiên tạo lại bảng, các lô sau điền tiếp).
+#}
+{% macro is_backfill() -%}
+    {{ return(var('backfill_start', none) is not none) }}
+{%- endmacro %}
+
+{# Mốc đầu lô (TIMESTAMP), lùi `context_days` ngày cho các model cần lịch sử trước lô (LAG, rolling avg) #}
+{% macro backfill_start(context_days=0) -%}
+    {{ timestamp_add_interval("cast('" ~ var('backfill_start') ~ "' as timestamp)", -context_days, 'DAY') }}
+{%- endmacro %}
+
+{% macro backfill_end() -%}
+    cast('{{ var('backfill_end') }}' as timestamp)
+{%- endmacro %}
+
+{#
+    Config `partitions` cho insert_overwrite tĩnh trên BigQuery: danh sách partition ngày của lô.
+    Với partitions tĩnh dbt-bigquery MERGE thẳng vào bảng đích, không tạo bảng <model>__dbt_tmp,
+    nên nhiều lô của cùng một model chạy song song được. Ngoài backfill (hoặc DuckDB) trả về none.
+#}
+{% macro backfill_partitions(data_type='timestamp') -%}
+    {% if target.type != 'bigquery' or not is_backfill() %}
+        {{ return(none) }}
+    {% endif %}
+    {% set start = modules.datetime.date.fromisoformat(var('backfill_start') | string) %}
+    {% set end = modules.datetime.date.fromisoformat(var('backfill_end') | string) %}
+    {% set partitions = [] %}
+    {% for offset in range((end - start).days) %}
+        {% do partitions.append(data_type ~ "('" ~ (start + modules.datetime.timedelta(days=offset)).isoformat() ~ "')") %}
+    {% endfor %}
+    {{ return(partitions) }}
+{%- endmacro %}
@@ -0,0 +1,41 @@
+-- macros/test_window.sql
+-- Giới hạn dbt test vào các partition gần đây để thời gian test không tăng theo lịch sử dữ liệu
+--
+-- Mặc định: chỉ test dữ liệu từ (ngày chạy - var test_window_days) trở đi
+-- --vars '{test_window_start: "2025-11-01"}'  : tự chọn mốc bắt đầu
+-- --vars '{test_full_history: true}'          : quét toàn bộ lịch sử (Airflow chạy mỗi Chủ nhật)
+
+{#
+    Mốc bắt đầu cửa sổ test, dạng literal DATE (BigQuery prune được partition)
+#}
+{% macro test_window_start() -%}
+    {%- if var('test_full_history') | string | lower == 'true' -%}
+        date '1970-01-01'
+    {%- else -%}
+        {%- set start = var('test_window_start', none)
+            or (run_started_at.date() - modules.datetime.timedelta(days=var('test_window_days') | int)).isoformat() -%}
+        date '{{ start }}'
+    {%- endif -%}
+{%- endmacro %}
+
+
+{#
+    Override get_where_subquery của dbt: trong `where` của generic test,
+    placeholder __test_window_start__ được thay bằng test_window_start()
+        config:
+          where: "date(timestamp_hour) >= __test_window_start__"
+#}
+{% macro get_where_subquery(relation) -%}
+    {% set where = config.get('where') %}
+    {% if where %}
+        {% if "__test_window_start__" in where %}
+            {% set where = where | replace("__test_window_start__", test_window_start()) %}
+        {% endif %}
+        {%- set filtered -%}
+            (select * from {{ relation }} where {{ where }}) dbt_subquery
+        {%- endset -%}
+        {% do return(filtered) %}
+    {%- else -%}
+        {% do return(relation) %}
+    {%- endif -%}
+{%- endmacro %}
@@ -0,0 +1,54 @@
+-- macros/trip_id.sql
+-- Khóa chuyến đi dạng INT64 (thay cho MD5 surrogate key 32 ký tự)
+
+{#
+    Chuỗi chuẩn hóa của một chuyến: 'YYYY-MM-DD HH:MM:SS|vendor_id|total_amount (2 số lẻ)'
+    Phải giống hệt streaming/main.py::compute_trip_id để Cloud Function tính ra cùng trip_id.
+#}
+{% macro trip_key_string(picked_up_at, vendor_id, total_amount) -%}
+    {{ return(adapter.dispatch('trip_key_string')(picked_up_at, vendor_id, total_amount)) }}
+{%- endmacro %}
+
+{% macro default__trip_key_string(picked_up_at, vendor_id, total_amount) -%}
+    concat(
+        format_timestamp('%Y-%m-%d %H:%M:%S', {{ picked_up_at }}), '|',
+        cast({{ vendor_id }} as string), '|',
+        format('%.2f', cast({{ total_amount }} as float64))
+    )
+{%- endmacro %}
+
+{% macro duckdb__trip_key_string(picked_up_at, vendor_id, total_amount) -%}
+    (strftime({{ picked_up_at }}, '%Y-%m-%d %H:%M:%S') || '|'
+        || cast({{ vendor_id }} as varchar) || '|'
+        || printf('%.2f', cast({{ total_amount }} as double)))
+{%- endmacro %}
+
+
+{#
+    trip_id INT64 = FARM_FINGERPRINT(trip_key_string)
+    8 byte thay vì chuỗi hex 32 ký tự -> bảng nhỏ hơn, join / lookup nhanh hơn
+    DuckDB (target local) lấy 63 bit cao của md5: giá trị khác BigQuery nhưng cùng kiểu INT64
+    (không dùng hash() của DuckDB: hay trùng với các chuỗi chỉ khác vài ký tự)
+#}
+{% macro trip_fingerprint(picked_up_at, vendor_id, total_amount) -%}
+    {{ return(adapter.dispatch('trip_fingerprint')(picked_up_at, vendor_id, total_amount)) }}
+{%- endmacro %}
+
+{% macro default__trip_fingerprint(picked_up_at, vendor_id, total_amount) -%}
+    farm_fingerprint({{ trip_key_string(picked_up_at, vendor_id, total_amount) }})
+{%- endmacro %}
+
+{% macro duckdb__trip_fingerprint(picked_up_at, vendor_id, total_amount) -%}
+    cast(md5_number({{ trip_key_string(picked_up_at, vendor_id, total_amount) }}) >> 65 as bigint)
+{%- endmacro %}
+
+
+{#
+    Số ngẫu nhiên "cố định" trong [0, 1) lấy từ 20 bit của trip_id, bắt đầu từ bit `offset`
+    Cùng một chuyến luôn ra cùng giá trị -> noise / train-test split / sample lặp lại được giữa các lần chạy
+    Dùng các `offset` khác nhau (0, 20, 40) cho các mục đích khác nhau để chúng độc lập với nhau
+    (>> của BigQuery không giữ bit dấu, của DuckDB thì có; mask & 0xFFFFF cho cùng kết quả ở cả hai)
+#}
+{% macro trip_id_uniform(trip_id, offset=0) -%}
+    ((({{ trip_id }} >> {{ offset }}) & 1048575) / 1048576.0)
+{%- endmacro %}
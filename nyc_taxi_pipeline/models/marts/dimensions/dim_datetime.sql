@@ -5,7 +5,7 @@ with calendar as (
     select
         date_day
     from
-        unnest(generate_date_array('2025-01-01', '2025-12-31', interval 1 day)) as date_day
+        {{ date_spine("'2025-01-01'", "'2025-12-31'") }}
 ),
 
 -- 2. Join với các sự kiện
@@ -16,18 +16,18 @@ events as (
 -- 3. Tạo các thuộc tính thời gian
 select
     -- Khóa chính (ví dụ: 20250101)
-    format_date('%Y%m%d', date_day) as date_id,
+    {{ format_date_as('%Y%m%d', 'date_day') }} as date_id,
     date_day as full_date,
     extract(year from date_day) as year,
     extract(month from date_day) as month,
     extract(day from date_day) as day,
-    extract(dayofweek from date_day) as day_of_week, -- 1(Sun) - 7(Sat)
+    {{ day_of_week('date_day') }} as day_of_week, -- 1(Sun) - 7(Sat)
     extract(dayofyear from date_day) as day_of_year,
     extract(quarter from date_day) as quarter,
     
     -- Cờ (flags)
     case
-        when extract(dayofweek from date_day) in (1, 7) then true
+        when {{ day_of_week('date_day') }} in (1, 7) then true
         else false
     end as is_weekend,
     
@@ -11,6 +11,34 @@ with taxi_zones as (
         zone_geom
     from {{ source('public_data', 'taxi_zone_lookup') }}
     where borough != 'Unknown'
+),
+
+-- Ô H3 đại diện của mỗi zone (model zone_h3_mapping): ô chứa centroid,
+-- hoặc ô phủ lớn nhất của zone khi ô centroid đã thuộc về zone khác
+zone_mapping as (
+    select
+        zone_id,
+        h3_cell,
+        cell_latitude,
+        cell_longitude
+    from {{ ref('zone_h3_mapping') }}
+    where is_zone_cell
+),
+
+zone_cells as (
+    select
+        taxi_zones.*,
+        -- Zone không chọn được ô riêng (mọi ô phủ đều đã thuộc zone khác) -> ô centroid,
+        -- test unique trên h3_id sẽ báo lỗi
+        coalesce(
+            zone_mapping.h3_cell,
+            {{ h3_from_geog_point(geog_centroid('taxi_zones.zone_geom'), h3_resolution) }}
+        ) as h3_res8_cell,
+        zone_mapping.cell_latitude as h3_cell_latitude,
+        zone_mapping.cell_longitude as h3_cell_longitude
+    from taxi_zones
+    left join zone_mapping
+        on taxi_zones.zone_id = zone_mapping.zone_id
 )
 
 select
@@ -19,21 +47,26 @@ select
     borough,
 
     -- Tính centroid point từ zone geometry
-    ST_CENTROID(zone_geom) as zone_centroid,
-    
+    {{ geog_centroid('zone_geom') }} as zone_centroid,
+
     -- Extract longitude và latitude riêng biệt
-    ST_X(ST_CENTROID(zone_geom)) as h3_centroid_longitude,
-    ST_Y(ST_CENTROID(zone_geom)) as h3_centroid_latitude,
-
-    -- Sử dụng hàm H3 built-in của BigQuery
-    -- 1. ST_CENTROID: Tìm điểm trung tâm của vùng địa lý (zone)
-    -- 2. Tính H3 manually hoặc dùng alternative approach
-    CONCAT(
-        'h3_res', CAST({{ h3_resolution }} AS STRING), '_',
-        CAST(ROUND(ST_X(ST_CENTROID(zone_geom)) * 1000) AS STRING), '_',
-        CAST(ROUND(ST_Y(ST_CENTROID(zone_geom)) * 1000) AS STRING)
-    ) as h3_id
-
-from taxi_zones
+    ST_X({{ geog_centroid('zone_geom') }}) as h3_centroid_longitude,
+    ST_Y({{ geog_centroid('zone_geom') }}) as h3_centroid_latitude,
+
+    -- H3 ID thật: ô res 8 đại diện của zone (ví dụ '882a100d67fffff'), duy nhất giữa các zone
+    -- Dashboard dùng trực tiếp với h3.cell_to_boundary / cell_to_latlng, không cần parse chuỗi
+    h3_res8_cell as h3_id,
+
+    -- Tâm của ô H3 (tính sẵn trong zone_h3_mapping, dashboard vẽ bản đồ không cần gọi h3)
+    coalesce(h3_cell_latitude, {{ h3_cell_latitude('h3_res8_cell') }}) as h3_cell_latitude,
+    coalesce(h3_cell_longitude, {{ h3_cell_longitude('h3_res8_cell') }}) as h3_cell_longitude,
+
+    -- Ô H3 thật theo nhiều độ phân giải (phục vụ rollup cube 6/7/8)
+    -- Ô thô hơn là cha của ô res 8 để đảm bảo cùng một cây phân cấp
+    h3_res8_cell,
+    {{ h3_to_parent('h3_res8_cell', 7) }} as h3_res7_cell,
+    {{ h3_to_parent('h3_res8_cell', 6) }} as h3_res6_cell
+
+from zone_cells
 
 -- dbt run --select dim_location
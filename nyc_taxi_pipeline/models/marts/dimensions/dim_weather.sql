@@ -1,5 +1,17 @@
 -- models/marts/dimensions/dim_weather.sql
 -- Aggregates weather data into daily summary (using NOAA GSOD 2021 faked as 2025)
+-- Incremental: chỉ gộp lại các ngày trong khoảng lookback thay vì toàn bộ lịch sử
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy=partition_overwrite_strategy(),
+    unique_key=partition_overwrite_key('weather_date'),
+    partition_by={
+      "field": "weather_date",
+      "data_type": "date",
+      "granularity": "day"
+    }
+) }}
 
 select
     -- Primary key: weather date
@@ -14,16 +26,17 @@ select
     sum(precipitation_mm) as total_precipitation_mm,
     
     -- Weather condition flags (any station reports = true for the day)
-    logical_or(is_rainy) as had_rain,
-    logical_or(is_snowy) as had_snow,
-    logical_or(is_foggy) as had_fog
+    {{ bool_or_agg('is_rainy') }} as had_rain,
+    {{ bool_or_agg('is_snowy') }} as had_snow,
+    {{ bool_or_agg('is_foggy') }} as had_fog
 
 from {{ ref('stg_weather_unified') }} -- Union of NOAA (fake 2025) + Streaming API
 
-group by
-    observation_date
+{% if is_incremental() %}
+where observation_date >= date({{ incremental_lookback_start('weather_date', var('weather_lookback_days')) }})
+{% endif %}
 
-order by
+group by
     observation_date
 
 -- dbt run --select dim_weather
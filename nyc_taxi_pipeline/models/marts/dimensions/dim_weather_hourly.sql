@@ -0,0 +1,73 @@
+-- models/marts/dimensions/dim_weather_hourly.sql
+-- Thời tiết theo giờ: 24 dòng mỗi ngày có trong dim_weather
+-- Giờ có quan sát streaming (OpenWeather) thì dùng số liệu của giờ đó,
+-- giờ không có thì lấy giá trị trong ngày (lượng mưa chia đều 24 giờ).
+-- Feature theo giờ join trực tiếp bảng này, không phải parse lại raw JSON.
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy=partition_overwrite_strategy(),
+    unique_key=partition_overwrite_key('weather_date'),
+    partition_by={
+      "field": "weather_date",
+      "data_type": "date",
+      "granularity": "day"
+    },
+    cluster_by=['weather_hour']
+) }}
+
+with daily as (
+    select *
+    from {{ ref('dim_weather') }}
+    {% if is_incremental() %}
+    where weather_date >= date({{ incremental_lookback_start('weather_date', var('weather_lookback_days')) }})
+    {% endif %}
+),
+
+hourly_observations as (
+    select
+        observation_hour,
+        avg(avg_temp_celsius) as temp_celsius,
+        sum(precipitation_mm) as precipitation_mm,
+        {{ bool_or_agg('is_rainy') }} as is_rainy,
+        {{ bool_or_agg('is_snowy') }} as is_snowy,
+        {{ bool_or_agg('is_foggy') }} as is_foggy
+    from {{ ref('stg_weather_unified') }}
+    where observation_hour is not null
+    {% if is_incremental() %}
+      and observation_date >= date({{ incremental_lookback_start('weather_date', var('weather_lookback_days')) }})
+    {% endif %}
+    group by observation_hour
+),
+
+hour_spine as (
+    select
+        daily.weather_date,
+        {{ timestamp_add_interval('cast(daily.weather_date as timestamp)', 'hours.n', 'HOUR') }} as weather_hour,
+        daily.avg_temp_celsius,
+        daily.total_precipitation_mm,
+        daily.had_rain,
+        daily.had_snow,
+        daily.had_fog
+    from daily
+    cross join {{ integer_series(0, 23) }} as hours
+)
+
+select
+    spine.weather_hour,
+    spine.weather_date,
+
+    coalesce(obs.temp_celsius, spine.avg_temp_celsius) as temp_celsius,
+    coalesce(obs.precipitation_mm, spine.total_precipitation_mm / 24) as precipitation_mm,
+    coalesce(obs.is_rainy, spine.had_rain) as is_rainy,
+    coalesce(obs.is_snowy, spine.had_snow) as is_snowy,
+    coalesce(obs.is_foggy, spine.had_fog) as is_foggy,
+
+    -- TRUE = số liệu quan sát trong giờ, FALSE = suy ra từ số liệu cả ngày
+    obs.observation_hour is not null as has_hourly_observation
+
+from hour_spine spine
+left join hourly_observations obs
+    on spine.weather_hour = obs.observation_hour
+
+-- dbt run --select dim_weather_hourly
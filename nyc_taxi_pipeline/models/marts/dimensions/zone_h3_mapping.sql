@@ -0,0 +1,193 @@
+-- models/marts/dimensions/zone_h3_mapping.sql
+-- Mapping taxi zone -> ô H3 res 8, tính trực tiếp từ polygon của zone (không cần bước nạp bảng thủ công)
+-- - Vùng phủ + area_weight: polyfill zone ở res 10 (~0.015 km²/ô) rồi đếm số ô mịn dưới mỗi ô cha res 8
+-- - is_centroid_cell: ô chứa centroid của zone
+-- - is_zone_cell: ô đại diện của zone (dim_location.h3_id), duy nhất giữa các zone
+-- dim_location đọc ô đại diện; agg_hourly_demand_h3_cube chia nhu cầu của zone theo area_weight
+
+{% set h3_resolution = 8 %}
+{% set weight_resolution = 10 %}
+{% set assignment_rounds = 4 %}
+
+with taxi_zones as (
+    select
+        cast(zone_id as string) as zone_id,
+        zone_geom
+    from {{ source('public_data', 'taxi_zone_lookup') }}
+    where borough != 'Unknown'
+),
+
+fine_cells as (
+    select
+        taxi_zones.zone_id,
+        {{ h3_to_parent('fine_cell', h3_resolution) }} as h3_cell
+    from taxi_zones
+    cross join {{ unnest_as(h3_polyfill('taxi_zones.zone_geom', weight_resolution), 'fine_cell') }}
+),
+
+coverage as (
+    select
+        zone_id,
+        h3_cell,
+        count(*) as fine_cell_count,
+        count(*) / sum(count(*)) over (partition by zone_id) as area_weight
+    from fine_cells
+    group by 1, 2
+),
+
+centroids as (
+    select
+        zone_id,
+        {{ h3_from_geog_point(geog_centroid('zone_geom'), h3_resolution) }} as h3_cell
+    from taxi_zones
+),
+
+covered_zones as (
+    select distinct zone_id
+    from coverage
+),
+
+-- Ô centroid luôn có trong mapping:
+-- - zone nhỏ hơn một ô res 10 (không có ô mịn nào) -> ô centroid mang toàn bộ zone
+-- - zone lõm có centroid nằm ngoài vùng phủ -> ô centroid với area_weight = 0
+cells as (
+    select
+        coverage.zone_id,
+        coverage.h3_cell,
+        coverage.fine_cell_count,
+        coverage.area_weight,
+        coverage.h3_cell = centroids.h3_cell as is_centroid_cell
+    from coverage
+    inner join centroids
+        on coverage.zone_id = centroids.zone_id
+
+    union all
+
+    select
+        centroids.zone_id,
+        centroids.h3_cell,
+        0 as fine_cell_count,
+        case when covered_zones.zone_id is null then 1.0 else 0.0 end as area_weight,
+        true as is_centroid_cell
+    from centroids
+    left join coverage
+        on centroids.zone_id = coverage.zone_id
+        and centroids.h3_cell = coverage.h3_cell
+    left join covered_zones
+        on centroids.zone_id = covered_zones.zone_id
+    where coverage.zone_id is null
+),
+
+-- Ô đại diện phải duy nhất: fct_trips / agg_hourly_demand_h3 gom chuyến theo h3_id, trùng ô là gộp nhu cầu của hai zone
+-- Ô ứng viên của mỗi zone theo thứ tự ưu tiên: ô centroid, các ô phủ (diện tích giảm dần),
+-- rồi các ô lân cận của ô centroid (k = 1, 2) cho zone nhỏ nằm gọn trong ô của zone khác
+candidates as (
+    select
+        zone_id,
+        h3_cell,
+        fine_cell_count,
+        case
+            when is_centroid_cell then 0
+            else row_number() over (partition by zone_id, is_centroid_cell order by fine_cell_count desc, h3_cell)
+        end as priority
+    from cells
+
+    union all
+
+    select
+        centroids.zone_id,
+        ring_cell as h3_cell,
+        0 as fine_cell_count,
+        1000 * ring.n as priority
+    from centroids
+    cross join {{ integer_series(1, 2) }} as ring
+    cross join {{ unnest_as(h3_grid_disk('centroids.h3_cell', 'ring.n'), 'ring_cell') }}
+),
+
+-- Gán theo vòng: mỗi zone chưa có ô đề xuất ứng viên tốt nhất còn trống;
+-- nhiều zone cùng đề xuất một ô -> ưu tiên thấp hơn, rồi zone chiếm nhiều diện tích trong ô hơn giữ ô
+-- Zone vẫn chưa có ô sau {{ assignment_rounds }} vòng -> dim_location dùng ô centroid, test unique trên h3_id báo lỗi
+assigned_0 as (
+    select
+        zone_id,
+        h3_cell
+    from centroids
+    where false
+),
+{% for round in range(1, assignment_rounds + 1) %}
+proposals_{{ round }} as (
+    select
+        zone_id,
+        h3_cell,
+        fine_cell_count,
+        priority,
+        row_number() over (partition by zone_id order by priority, h3_cell) as zone_rank
+    from candidates
+    where zone_id not in (select zone_id from assigned_{{ round - 1 }})
+      and h3_cell not in (select h3_cell from assigned_{{ round - 1 }})
+),
+
+assigned_{{ round }} as (
+    select zone_id, h3_cell from assigned_{{ round - 1 }}
+
+    union all
+
+    select
+        zone_id,
+        h3_cell
+    from (
+        select
+            zone_id,
+            h3_cell,
+            row_number() over (partition by h3_cell order by priority, fine_cell_count desc, zone_id) as cell_rank
+        from proposals_{{ round }}
+        where zone_rank = 1
+    ) as winners
+    where cell_rank = 1
+),
+{% endfor %}
+
+zone_cells as (
+    select
+        zone_id,
+        h3_cell
+    from assigned_{{ assignment_rounds }}
+),
+
+-- Ô đại diện lấy từ vòng lân cận không nằm trong vùng phủ -> thêm dòng với area_weight = 0
+mapped_cells as (
+    select
+        zone_id,
+        h3_cell,
+        area_weight,
+        is_centroid_cell
+    from cells
+
+    union all
+
+    select
+        zone_cells.zone_id,
+        zone_cells.h3_cell,
+        0.0 as area_weight,
+        false as is_centroid_cell
+    from zone_cells
+    left join cells
+        on zone_cells.zone_id = cells.zone_id
+        and zone_cells.h3_cell = cells.h3_cell
+    where cells.zone_id is null
+)
+
+select
+    mapped_cells.zone_id,
+    mapped_cells.h3_cell,
+    mapped_cells.area_weight,
+    mapped_cells.is_centroid_cell,
+    zone_cells.zone_id is not null as is_zone_cell,
+    {{ h3_cell_latitude('mapped_cells.h3_cell') }} as cell_latitude,
+    {{ h3_cell_longitude('mapped_cells.h3_cell') }} as cell_longitude
+from mapped_cells
+left join zone_cells
+    on mapped_cells.zone_id = zone_cells.zone_id
+    and mapped_cells.h3_cell = zone_cells.h3_cell
+
+-- dbt run --select zone_h3_mapping
@@ -1,5 +1,19 @@
 -- models/marts/facts/agg_hourly_demand_h3.sql
 -- (NEW: Bảng đặc trưng cho ML)
+-- Incremental theo ngày như fct_trips (var fact_lookback_days, backfill bằng tools/backfill.py)
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy=partition_overwrite_strategy(),
+    unique_key=partition_overwrite_key('timestamp_hour'),
+    partition_by={
+      "field": "timestamp_hour",
+      "data_type": "timestamp",
+      "granularity": "day"
+    },
+    partitions=backfill_partitions(),
+    cluster_by=['pickup_h3_id']
+) }}
 
 with trips as (
     select
@@ -8,6 +22,12 @@ with trips as (
         datetime_id,
         weather_date
     from {{ ref('fct_trips') }}
+    {% if is_backfill() %}
+    where picked_up_at >= {{ backfill_start() }}
+      and picked_up_at < {{ backfill_end() }}
+    {% elif is_incremental() %}
+    where picked_up_at >= {{ incremental_lookback_start('timestamp_hour', var('fact_lookback_days')) }}
+    {% endif %}
 ),
 
 dim_datetime as (
@@ -32,7 +52,7 @@ dim_weather as (
 select
     -- Khóa chính của bảng (Time Series ID)
     trips.pickup_h3_id,
-    timestamp_trunc(trips.picked_up_at, hour) as timestamp_hour,
+    {{ timestamp_trunc_to('trips.picked_up_at', 'hour') }} as timestamp_hour,
     
     -- Target variable (biến mục tiêu)
     count(*) as total_pickups,
@@ -41,7 +61,7 @@ select
     -- Chúng ta dùng min() vì tất cả các hàng trong giờ đó đều có cùng 1 giá trị feature
     min(dim_datetime.is_weekend) as is_weekend,
     min(dim_datetime.is_holiday) as is_holiday,
-    min(extract(dayofweek from trips.picked_up_at)) as day_of_week, -- 1(Sun) - 7(Sat)
+    min({{ day_of_week('trips.picked_up_at') }}) as day_of_week, -- 1(Sun) - 7(Sat)
     min(extract(hour from trips.picked_up_at)) as hour_of_day,
     
     min(dim_weather.avg_temp_celsius) as avg_temp_celsius,
@@ -0,0 +1,71 @@
+-- models/marts/facts/agg_hourly_demand_h3_cube.sql
+-- Multi-resolution H3 rollup cube: nhu cầu theo giờ tại các độ phân giải 8 / 7 / 6
+-- Nhu cầu của zone được chia cho các ô res 8 mà zone phủ lên theo tỷ lệ diện tích (model zone_h3_mapping).
+-- Mỗi cấp thô hơn được cộng dồn từ cấp mịn hơn ngay dưới nó (8 -> 7 -> 6), không đọc lại trips.
+-- Dashboard (bản đồ theo zoom) và PCA clustering đọc thẳng các ô đã tổng hợp sẵn.
+
+{{ config(
+    materialized='table',
+    partition_by={
+      "field": "timestamp_hour",
+      "data_type": "timestamp",
+      "granularity": "day"
+    },
+    cluster_by=['h3_resolution', 'h3_cell']
+) }}
+
+-- Ô res 8 mà mỗi zone phủ lên, kèm tỷ lệ diện tích (tổng = 1 cho mỗi zone)
+-- dim_location.h3_id là duy nhất (test unique) nên mỗi dòng agg_hourly_demand_h3 là nhu cầu của đúng một zone
+with zone_cells as (
+    select
+        zones.h3_id,
+        coverage.h3_cell,
+        coverage.area_weight
+    from {{ ref('dim_location') }} zones
+    inner join {{ ref('zone_h3_mapping') }} coverage
+        on zones.zone_id = coverage.zone_id
+    where coverage.area_weight > 0
+),
+
+-- Cấp 8: chia nhu cầu của mỗi zone (agg_hourly_demand_h3) cho các ô res 8 theo area_weight
+res8 as (
+    select
+        zone_cells.h3_cell,
+        agg.timestamp_hour,
+        sum(agg.total_pickups * zone_cells.area_weight) as total_pickups,
+        count(*) as child_count -- Số zone phủ lên ô
+    from {{ ref('agg_hourly_demand_h3') }} agg
+    inner join zone_cells
+        on agg.pickup_h3_id = zone_cells.h3_id
+    group by 1, 2
+),
+
+-- Cấp 7: cộng dồn từ cấp 8
+res7 as (
+    select
+        {{ h3_to_parent('h3_cell', 7) }} as h3_cell,
+        timestamp_hour,
+        sum(total_pickups) as total_pickups,
+        count(*) as child_count -- Số ô res 8 gộp vào ô
+    from res8
+    group by 1, 2
+),
+
+-- Cấp 6: cộng dồn từ cấp 7
+res6 as (
+    select
+        {{ h3_to_parent('h3_cell', 6) }} as h3_cell,
+        timestamp_hour,
+        sum(total_pickups) as total_pickups,
+        count(*) as child_count -- Số ô res 7 gộp vào ô
+    from res7
+    group by 1, 2
+)
+
+select 8 as h3_resolution, h3_cell, timestamp_hour, total_pickups, child_count from res8
+union all
+select 7 as h3_resolution, h3_cell, timestamp_hour, total_pickups, child_count from res7
+union all
+select 6 as h3_resolution, h3_cell, timestamp_hour, total_pickups, child_count from res6
+
+-- dbt run --select agg_hourly_demand_h3_cube
@@ -1,8 +1,27 @@
 -- models/marts/facts/fct_fare_prediction_training.sql
 -- This model prepares the training data for the fare prediction BQML model.
+-- Incremental theo ngày: mỗi lần chạy chỉ xử lý lại vài ngày gần nhất (var fare_training_lookback_days)
+-- Noise / split / sample lấy từ bit của trip_id (macros/trip_id.sql) nên không đổi giữa các lần chạy,
+-- thay cho RAND() trước đây (mỗi lần train lại quét toàn bộ lịch sử và random lại nhãn).
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy=partition_overwrite_strategy(),
+    unique_key=partition_overwrite_key('pickup_date'),
+    partition_by={
+      "field": "pickup_date",
+      "data_type": "date",
+      "granularity": "day"
+    },
+    cluster_by=['data_split', 'pickup_h3_id']
+) }}
 
 WITH fct_trips AS (
     SELECT * FROM {{ ref('fct_trips') }}
+    {% if is_incremental() %}
+    -- Chỉ lấy các ngày mới + vài ngày gần nhất (chuyến đến trễ từ streaming)
+    WHERE picked_up_at >= {{ incremental_lookback_start('pickup_date', var('fare_training_lookback_days')) }}
+    {% endif %}
 ),
 dim_datetime AS (
     SELECT * FROM {{ ref('dim_datetime') }}
@@ -18,8 +37,12 @@ agg_hourly_demand AS (
     FROM {{ ref('agg_hourly_demand_h3') }}
 )
 SELECT
-    -- Target variable
-    trips.fare_amount * (1 + (RAND() - 0.5) * 2 * 0.1) AS fare_amount,
+    -- Keys / partition
+    trips.trip_id,
+    DATE(trips.picked_up_at) AS pickup_date,
+
+    -- Target variable (noise ±10%, cố định theo trip_id)
+    trips.fare_amount * (1 + ({{ trip_id_uniform('trips.trip_id', 0) }} - 0.5) * 2 * 0.1) AS fare_amount,
 
     -- Trip features
     trips.passenger_count,
@@ -44,7 +67,26 @@ SELECT
 
     -- Demand feature (joined by h3_id and hour)
     -- Use COALESCE to handle cases where there might not be demand data for a specific hour
-    COALESCE(demand.historical_demand, 0) AS historical_demand
+    COALESCE(demand.historical_demand, 0) AS historical_demand,
+
+    -- Split cố định: 80% TRAIN / 10% EVAL (early stopping của BQML) / 10% TEST (báo cáo accuracy)
+    CASE
+        WHEN {{ trip_id_uniform('trips.trip_id', 20) }} < 0.8 THEN 'TRAIN'
+        WHEN {{ trip_id_uniform('trips.trip_id', 20) }} < 0.9 THEN 'EVAL'
+        ELSE 'TEST'
+    END AS data_split,
+
+    -- Cột phục vụ stratified sampling (fct_fare_training_sample)
+    ({{ day_of_week('trips.picked_up_at') }} - 1) * 24 + EXTRACT(HOUR FROM trips.picked_up_at) AS hour_of_week,
+    CASE
+        WHEN trips.trip_distance < 1 THEN '0-1'
+        WHEN trips.trip_distance < 2 THEN '1-2'
+        WHEN trips.trip_distance < 5 THEN '2-5'
+        WHEN trips.trip_distance < 10 THEN '5-10'
+        WHEN trips.trip_distance < 20 THEN '10-20'
+        ELSE '20+'
+    END AS distance_band,
+    {{ trip_id_uniform('trips.trip_id', 40) }} AS sample_key
 
 FROM
     fct_trips trips
@@ -54,7 +96,7 @@ LEFT JOIN
     dim_weather weather ON trips.weather_date = weather.weather_date
 LEFT JOIN
     agg_hourly_demand demand ON trips.pickup_h3_id = demand.pickup_h3_id
-    AND TIMESTAMP_TRUNC(trips.picked_up_at, HOUR) = demand.timestamp_hour
+    AND {{ timestamp_trunc_to('trips.picked_up_at', 'HOUR') }} = demand.timestamp_hour
 
 WHERE
     -- Filter out trips with no fare or negative fare, and trips that are too short/long
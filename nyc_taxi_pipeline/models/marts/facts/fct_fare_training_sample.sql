@@ -0,0 +1,34 @@
+-- models/marts/facts/fct_fare_training_sample.sql
+-- Stratified sample của fct_fare_prediction_training để train model giá cước trên một phần dữ liệu
+-- Strata: pickup zone (pickup_h3_id) × giờ trong tuần × khoảng cách
+--
+-- Mỗi stratum giữ tỉ lệ var('fare_training_sample_fraction'), nhưng tối thiểu
+-- var('fare_training_min_rows_per_stratum') dòng (stratum nhỏ hơn thì lấy hết)
+-- -> zone / giờ vắng khách vẫn có mặt trong tập train khi sample nhỏ.
+-- Chọn dòng bằng sample_key (bit của trip_id) nên cùng tham số luôn ra cùng sample.
+--   dbt run --select fct_fare_training_sample --vars '{fare_training_sample_fraction: 0.1}'
+
+WITH training AS (
+    SELECT * FROM {{ ref('fct_fare_prediction_training') }}
+),
+strata AS (
+    SELECT
+        *,
+        COUNT(*) OVER (PARTITION BY pickup_h3_id, hour_of_week, distance_band) AS stratum_rows
+    FROM training
+),
+rates AS (
+    SELECT
+        *,
+        LEAST(
+            1.0,
+            GREATEST(
+                {{ var('fare_training_sample_fraction') }},
+                {{ var('fare_training_min_rows_per_stratum') }} / stratum_rows
+            )
+        ) AS sampling_rate
+    FROM strata
+)
+SELECT *
+FROM rates
+WHERE sample_key < sampling_rate
@@ -1,15 +1,91 @@
 -- models/marts/facts/fct_hourly_features.sql
 -- CHỨA TOÀN BỘ LOGIC FEATURE ENGINEERING (LAGS, AVGS) BẠN ĐÃ VIẾT
 
-WITH enriched_data AS (
+-- Incremental theo ngày: tính lại var fact_lookback_days ngày gần nhất (hoặc một lô của tools/backfill.py),
+-- đọc thêm FEATURE_CONTEXT_DAYS ngày trước đó để LAG 168 giờ / rolling avg đúng ở đầu khoảng
+
+{% set FEATURE_CONTEXT_DAYS = 7 %}
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy=partition_overwrite_strategy(),
+    unique_key=partition_overwrite_key('timestamp_hour'),
+    partition_by={
+      "field": "timestamp_hour",
+      "data_type": "timestamp",
+      "granularity": "day"
+    },
+    partitions=backfill_partitions(),
+    cluster_by=['pickup_h3_id']
+) }}
+
+WITH demand AS (
+  SELECT *
+  FROM {{ ref('agg_hourly_demand_h3') }}
+  {% if is_backfill() %}
+  WHERE timestamp_hour >= {{ backfill_start(FEATURE_CONTEXT_DAYS) }}
+    AND timestamp_hour < {{ backfill_end() }}
+  {% elif is_incremental() %}
+  WHERE timestamp_hour >= {{ timestamp_add_interval(
+      incremental_lookback_start('timestamp_hour', var('fact_lookback_days')), -FEATURE_CONTEXT_DAYS, 'DAY') }}
+  {% endif %}
+),
+
+-- Chuỗi giờ liên tục: agg_hourly_demand_h3 chỉ có những giờ có chuyến,
+-- nên LAG(x, 24) theo ROWS sẽ lệch nếu không bù các giờ 0 chuyến
+-- Mọi ngày từ ngày đầu tới ngày cuối của khoảng đọc, kể cả ngày không có chuyến nào ở mọi zone
+hour_spine AS (
+  SELECT
+    {{ timestamp_add_interval('CAST(days.date_day AS TIMESTAMP)', 'hours.n', 'HOUR') }} AS timestamp_hour
+  FROM {{ date_spine('(SELECT DATE(MIN(timestamp_hour)) FROM demand)', '(SELECT DATE(MAX(timestamp_hour)) FROM demand)') }} AS days
+  CROSS JOIN {{ integer_series(0, 23) }} AS hours
+),
+
+-- Zone / giờ cuối lấy trên toàn bảng để mỗi lô cho đúng kết quả như build toàn bộ lịch sử
+zones AS (
+  SELECT DISTINCT pickup_h3_id FROM {{ ref('agg_hourly_demand_h3') }}
+),
+
+dense_demand AS (
+  SELECT
+    zones.pickup_h3_id,
+    spine.timestamp_hour,
+    COALESCE(demand.total_pickups, 0) AS total_pickups
+  FROM zones
+  CROSS JOIN hour_spine spine
+  LEFT JOIN demand
+    ON demand.pickup_h3_id = zones.pickup_h3_id
+    AND demand.timestamp_hour = spine.timestamp_hour
+  WHERE spine.timestamp_hour <= (SELECT MAX(timestamp_hour) FROM {{ ref('agg_hourly_demand_h3') }})
+),
+
+enriched_data AS (
   SELECT 
-    agg.*,
+    dense.*,
+    -- Feature thời gian / thời tiết tính lại từ giờ (giờ 0 chuyến không có trong agg)
+    EXTRACT(HOUR FROM dense.timestamp_hour) AS hour_of_day,
+    {{ day_of_week('dense.timestamp_hour') }} AS day_of_week,
+    dim_dt.is_weekend,
+    dim_dt.is_holiday,
     dim_dt.month,
     dim_dt.quarter,
-    dim_dt.day_of_year
-  FROM {{ ref('agg_hourly_demand_h3') }} agg
+    dim_dt.day_of_year,
+    weather.avg_temp_celsius,
+    weather.total_precipitation_mm,
+    weather.had_rain,
+    weather.had_snow,
+    weather_hourly.temp_celsius AS hourly_temp_celsius,
+    weather_hourly.precipitation_mm AS hourly_precipitation_mm,
+    weather_hourly.is_rainy AS is_raining_this_hour
+  FROM dense_demand dense
   LEFT JOIN {{ ref('dim_datetime') }} dim_dt
-    ON DATE(agg.timestamp_hour) = dim_dt.full_date
+    ON DATE(dense.timestamp_hour) = dim_dt.full_date
+  LEFT JOIN {{ ref('dim_weather') }} weather
+    ON DATE(dense.timestamp_hour) = weather.weather_date
+  -- Thời tiết theo giờ (điều kiện theo ngày để BigQuery prune partition)
+  LEFT JOIN {{ ref('dim_weather_hourly') }} weather_hourly
+    ON DATE(dense.timestamp_hour) = weather_hourly.weather_date
+    AND dense.timestamp_hour = weather_hourly.weather_hour
 ),
 
 lag_features AS (
@@ -68,6 +144,9 @@ SELECT
     l.total_precipitation_mm,
     l.had_rain, -- (FIXED: Sửa tên cột)
     l.had_snow,
+    l.hourly_temp_celsius,
+    l.hourly_precipitation_mm,
+    l.is_raining_this_hour,
     
     -- Calendar features
     l.is_weekend,
@@ -94,6 +173,13 @@ SELECT
     
 FROM lag_features l
 
+-- Bỏ các ngày context, chỉ ghi các partition của khoảng đang tính
+{% if is_backfill() %}
+WHERE l.timestamp_hour >= {{ backfill_start() }}
+{% elif is_incremental() %}
+WHERE l.timestamp_hour >= {{ incremental_lookback_start('timestamp_hour', var('fact_lookback_days')) }}
+{% endif %}
+
 -- Chỉ lấy data có đủ lag features (bỏ 168 giờ = 1 tuần đầu)
 -- Tạm comment để có đủ data train
 -- WHERE l.timestamp_hour >= TIMESTAMP_ADD(
@@ -42,10 +42,10 @@ zone_weekend_pattern AS (
         pickup_h3_id,
         AVG(CASE WHEN is_weekend THEN total_pickups ELSE NULL END) AS weekend_avg_demand,
         AVG(CASE WHEN NOT is_weekend THEN total_pickups ELSE NULL END) AS weekday_avg_demand,
-        SAFE_DIVIDE(
-            AVG(CASE WHEN is_weekend THEN total_pickups ELSE NULL END),
-            AVG(CASE WHEN NOT is_weekend THEN total_pickups ELSE NULL END)
-        ) AS weekend_ratio,
+        {{ safe_divide(
+            'AVG(CASE WHEN is_weekend THEN total_pickups ELSE NULL END)',
+            'AVG(CASE WHEN NOT is_weekend THEN total_pickups ELSE NULL END)'
+        ) }} AS weekend_ratio,
         -- Additional temporal patterns
         COUNT(DISTINCT CASE WHEN is_weekend THEN DATE(timestamp_hour) END) AS weekend_days_active,
         COUNT(DISTINCT CASE WHEN NOT is_weekend THEN DATE(timestamp_hour) END) AS weekday_days_active
@@ -121,15 +121,15 @@ SELECT
     COALESCE(ztp.night_demand, 0.0) AS night_demand,
     
     -- Rush hour ratio
-    SAFE_DIVIDE(
-        COALESCE(ztp.morning_rush_demand, 0) + COALESCE(ztp.evening_rush_demand, 0),
-        COALESCE(zhd.avg_hourly_demand, 1)
-    ) AS rush_hour_ratio,
+    {{ safe_divide(
+        'COALESCE(ztp.morning_rush_demand, 0) + COALESCE(ztp.evening_rush_demand, 0)',
+        'COALESCE(zhd.avg_hourly_demand, 1)'
+    ) }} AS rush_hour_ratio,
     
     -- Data quality metrics
     zt.first_trip_date,
     zt.last_trip_date,
-    DATE_DIFF(zt.last_trip_date, zt.first_trip_date, DAY) AS days_active,
+    {{ date_diff_days('zt.last_trip_date', 'zt.first_trip_date') }} AS days_active,
     
     -- Timestamp
     CURRENT_DATE() AS created_at
@@ -1,7 +1,29 @@
 -- models/marts/facts/fct_trips.sql
+-- Incremental theo ngày pickup: mỗi lần chạy xử lý lại var fact_lookback_days ngày gần nhất,
+-- backfill lịch sử theo lô ngày bằng tools/backfill.py (macros/incremental.sql)
+-- unique_key trên DuckDB: weather_date = date(picked_up_at) (inner join theo ngày pickup bên dưới)
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy=partition_overwrite_strategy(),
+    unique_key=partition_overwrite_key('weather_date'),
+    partition_by={
+      "field": "picked_up_at",
+      "data_type": "timestamp",
+      "granularity": "day"
+    },
+    partitions=backfill_partitions(),
+    cluster_by=['pickup_h3_id']
+) }}
 
 with trips_data as (
     select * from {{ ref('stg_taxi_trips') }}
+    {% if is_backfill() %}
+    where picked_up_at >= {{ backfill_start() }}
+      and picked_up_at < {{ backfill_end() }}
+    {% elif is_incremental() %}
+    where picked_up_at >= {{ incremental_lookback_start('picked_up_at', var('fact_lookback_days')) }}
+    {% endif %}
 ),
 
 dim_datetime as (
@@ -18,7 +40,8 @@ dim_weather as (
 
 select
     -- Khóa (Keys)
-    {{ dbt_utils.generate_surrogate_key(['trips_data.picked_up_at', 'trips_data.vendor_id', 'trips_data.total_amount']) }} as trip_id,
+    -- INT64 fingerprint của (picked_up_at, vendor_id, total_amount), xem macros/trip_id.sql
+    {{ trip_fingerprint('trips_data.picked_up_at', 'trips_data.vendor_id', 'trips_data.total_amount') }} as trip_id,
     
     trips_data.vendor_id,
     trips_data.payment_type_id,
@@ -40,7 +63,7 @@ select
     -- Số đo (Measures)
     trips_data.passenger_count,
     trips_data.trip_distance,
-    timestamp_diff(trips_data.dropped_off_at, trips_data.picked_up_at, second) as trip_duration_seconds,
+    {{ timestamp_diff_in('trips_data.dropped_off_at', 'trips_data.picked_up_at', 'second') }} as trip_duration_seconds,
     
     trips_data.fare_amount,
     trips_data.extra_amount,
@@ -1,5 +1,18 @@
 -- models/staging/stg_streaming_weather.sql
 -- Этот модельный файл преобразует сырые данные о погоде из формата JSON в структурированную промежуточную таблицу.
+-- Incremental: JSON chỉ được parse một lần; mỗi lần chạy chỉ đọc các partition raw (theo inserted_at)
+-- của vài ngày gần nhất và ghi đè các partition observation_date tương ứng.
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy=partition_overwrite_strategy(),
+    unique_key=partition_overwrite_key('observation_date'),
+    partition_by={
+      "field": "observation_date",
+      "data_type": "date",
+      "granularity": "day"
+    }
+) }}
 
 with source_data as (
     -- Источник данных - таблица с сырыми JSON-данными о погоде
@@ -7,32 +20,51 @@ with source_data as (
         raw_json,
         inserted_at
     from {{ source('raw_data', 'weather_api_data') }}
+    {% if is_incremental() %}
+    -- Raw partition theo DATE(inserted_at) -> chỉ quét các ngày gần nhất
+    where inserted_at >= {{ incremental_lookback_start('observation_date', var('weather_lookback_days')) }}
+    {% endif %}
+),
+
+parsed as (
+    select
+        -- Извлекаем временную метку наблюдения
+        {{ timestamp_from_unix_seconds('cast(' ~ json_value_string('raw_json', '$.dt') ~ ' as int64)') }} as observed_at,
+        raw_json,
+        inserted_at
+    from source_data
 )
 
 select
-    -- Извлекаем и преобразуем временную метку в дату наблюдения
-    cast(timestamp_seconds(cast(json_value(raw_json, '$.dt') as int64)) as date) as observation_date,
+    -- Дата и час наблюдения
+    cast(observed_at as date) as observation_date,
+    {{ timestamp_trunc_to('observed_at', 'HOUR') }} as observation_hour,
 
     -- Температура уже в градусах Цельсия, так как в API был указан параметр 'units=metric'
-    cast(json_value(raw_json, '$.main.temp') as numeric) as avg_temp_celsius,
-    cast(json_value(raw_json, '$.main.temp_max') as numeric) as max_temp_celsius,
-    cast(json_value(raw_json, '$.main.temp_min') as numeric) as min_temp_celsius,
+    cast({{ json_value_string('raw_json', '$.main.temp') }} as numeric) as avg_temp_celsius,
+    cast({{ json_value_string('raw_json', '$.main.temp_max') }} as numeric) as max_temp_celsius,
+    cast({{ json_value_string('raw_json', '$.main.temp_min') }} as numeric) as min_temp_celsius,
 
     -- Осадки в мм (дождь за последний час). Если данных нет, считаем 0.
-    coalesce(cast(json_value(raw_json, '$.rain."1h"') as numeric), 0) as precipitation_mm,
+    coalesce(cast({{ json_value_string('raw_json', '$.rain."1h"') }} as numeric), 0) as precipitation_mm,
 
     -- Флаги погоды, основанные на описании
     -- Проверяем, содержит ли главное описание погоды соответствующие ключевые слова
-    case when lower(json_value(raw_json, '$.weather[0].main')) like '%rain%' then true else false end as is_rainy,
-    case when lower(json_value(raw_json, '$.weather[0].main')) like '%snow%' then true else false end as is_snowy,
+    case when lower({{ json_value_string('raw_json', '$.weather[0].main') }}) like '%rain%' then true else false end as is_rainy,
+    case when lower({{ json_value_string('raw_json', '$.weather[0].main') }}) like '%snow%' then true else false end as is_snowy,
     case 
-        when lower(json_value(raw_json, '$.weather[0].main')) in ('mist', 'smoke', 'haze', 'dust', 'fog', 'sand', 'ash', 'squall', 'tornado') then true 
+        when lower({{ json_value_string('raw_json', '$.weather[0].main') }}) in ('mist', 'smoke', 'haze', 'dust', 'fog', 'sand', 'ash', 'squall', 'tornado') then true 
         else false 
     end as is_foggy,
     
     -- Временная метка вставки для возможной отладки
     inserted_at
 
-from source_data
+from parsed
+
+{% if is_incremental() %}
+-- Không ghi đè partition cũ hơn mốc lookback bằng vài dòng đến trễ
+where cast(observed_at as date) >= date({{ incremental_lookback_start('observation_date', var('weather_lookback_days')) }})
+{% endif %}
 
 -- dbt run --select stg_streaming_weather
@@ -7,8 +7,8 @@ WITH historical_trips AS (
         cast(vendor_id as string) as vendor_id,
         
         -- Timestamps - Shift to 2025 full year (1462 days from 2021)
-        TIMESTAMP_ADD(CAST(pickup_datetime AS TIMESTAMP), INTERVAL 1462 DAY) as picked_up_at,
-        TIMESTAMP_ADD(CAST(dropoff_datetime AS TIMESTAMP), INTERVAL 1462 DAY) as dropped_off_at,
+        {{ timestamp_add_interval('CAST(pickup_datetime AS TIMESTAMP)', 1462, 'DAY') }} as picked_up_at,
+        {{ timestamp_add_interval('CAST(dropoff_datetime AS TIMESTAMP)', 1462, 'DAY') }} as dropped_off_at,
         
         -- Trip info
         cast(passenger_count as int64) as passenger_count,
@@ -72,7 +72,7 @@ streaming_trips AS (
         trip_distance > 0
         AND passenger_count > 0
         AND total_amount > 0
-        AND pickup_datetime >= TIMESTAMP('2025-11-24')  -- Only streaming data after historical cutoff
+        AND pickup_datetime >= CAST('2025-11-24' AS TIMESTAMP)  -- Only streaming data after historical cutoff
         AND pickup_location_id IS NOT NULL
         AND dropoff_location_id IS NOT NULL
 )
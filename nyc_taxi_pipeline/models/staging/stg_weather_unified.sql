@@ -1,10 +1,25 @@
 -- models/staging/stg_weather_unified.sql
--- Union dữ liệu thời tiết từ 3 nguồn: NOAA public, fake_weather_2025, và Streaming API
+-- Union dữ liệu thời tiết từ 2 nguồn: fake_weather_2025 (NOAA dịch năm) và Streaming API
+-- Incremental theo observation_date: chỉ tính lại vài ngày gần nhất (var weather_lookback_days)
+-- fake_weather_2025 được tạo lại (test/populate_weather_data.sql) thì chạy với --full-refresh
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy=partition_overwrite_strategy(),
+    unique_key=partition_overwrite_key('observation_date'),
+    partition_by={
+      "field": "observation_date",
+      "data_type": "date",
+      "granularity": "day"
+    }
+) }}
 
 with fake_weather as (
     -- Nguồn 1: Fake weather data cho Sept-Nov 2025 (từ script populate_weather_data.sql)
+    -- Dữ liệu theo ngày: không có giờ quan sát
     select
         observation_date,
+        cast(null as timestamp) as observation_hour,
         avg_temp_celsius,
         max_temp_celsius,
         min_temp_celsius,
@@ -12,13 +27,17 @@ with fake_weather as (
         is_rainy,
         is_snowy,
         is_foggy
-    from `nyc-taxi-project-477115.staging.fake_weather_2025`
+    from {{ source('staging_data', 'fake_weather_2025') }}
+    {% if is_incremental() %}
+    where observation_date >= date({{ incremental_lookback_start('observation_date', var('weather_lookback_days')) }})
+    {% endif %}
 ),
 
 streaming_weather as (
-    -- Nguồn 2: OpenWeather API streaming (nếu có data)
+    -- Nguồn 2: OpenWeather API streaming (nếu có data), mỗi dòng là một quan sát trong giờ
     select
         observation_date,
+        observation_hour,
         avg_temp_celsius,
         max_temp_celsius,
         min_temp_celsius,
@@ -27,6 +46,9 @@ streaming_weather as (
         is_snowy,
         is_foggy
     from {{ ref('stg_streaming_weather') }}
+    {% if is_incremental() %}
+    where observation_date >= date({{ incremental_lookback_start('observation_date', var('weather_lookback_days')) }})
+    {% endif %}
 )
 
 -- UNION cả 2 nguồn
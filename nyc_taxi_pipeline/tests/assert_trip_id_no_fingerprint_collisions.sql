@@ -0,0 +1,20 @@
+-- tests/assert_trip_id_no_fingerprint_collisions.sql
+-- trip_id là fingerprint 64-bit: hai chuyến KHÁC khóa (picked_up_at, vendor_id, total_amount)
+-- không được có cùng trip_id. Trùng khóa (cùng giây, cùng vendor, cùng tiền) không tính là collision.
+-- Chỉ kiểm tra các ngày trong cửa sổ test (macros/test_window.sql).
+-- Test fail nếu trả về bất kỳ dòng nào.
+
+with trip_keys as (
+    select
+        trip_id,
+        {{ trip_key_string('picked_up_at', 'vendor_id', 'total_amount') }} as trip_key
+    from {{ ref('fct_trips') }}
+    where date(picked_up_at) >= {{ test_window_start() }}
+)
+
+select
+    trip_id,
+    count(distinct trip_key) as distinct_keys
+from trip_keys
+group by trip_id
+having count(distinct trip_key) > 1
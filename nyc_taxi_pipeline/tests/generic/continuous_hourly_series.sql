@@ -0,0 +1,24 @@
+-- tests/generic/continuous_hourly_series.sql
+-- Chuỗi theo giờ phải liên tục: trong mỗi nhóm (vd. pickup_h3_id), hai dòng liên tiếp cách nhau đúng 1 giờ.
+-- Lag / rolling features dùng ROWS (LAG(x, 24) = 24 dòng trước) nên một giờ bị thiếu làm lệch toàn bộ feature.
+-- Trả về các dòng bị hở hoặc trùng giờ.
+
+{% test continuous_hourly_series(model, column_name, group_by_columns=[]) %}
+
+with ordered as (
+    select
+        {% for column in group_by_columns %}{{ column }}, {% endfor %}
+        {{ column_name }} as series_hour,
+        lag({{ column_name }}) over (
+            {% if group_by_columns %}partition by {{ group_by_columns | join(', ') }}{% endif %}
+            order by {{ column_name }}
+        ) as previous_hour
+    from {{ model }}
+)
+
+select *
+from ordered
+where previous_hour is not null
+  and {{ timestamp_diff_in('series_hour', 'previous_hour', 'hour') }} != 1
+
+{% endtest %}
@@ -29,8 +29,8 @@ RUN pip install --no-cache-dir dbt-core==1.8.7 dbt-bigquery==1.8.2
 # Copy dbt project
 COPY . .
 
-# Run dbt when container starts
-CMD ["dbt", "run", "--profiles-dir", ".", "--full-refresh"]
+# Run dbt when container starts (incremental; dbt-refresh function ghi đè args bằng `dbt build --select source:<x>+`)
+CMD ["dbt", "build", "--profiles-dir", "."]
 "@ | Out-File -FilePath "$BUILD_DIR\Dockerfile" -Encoding UTF8
 
 Write-Host "`nBuilding and deploying Cloud Run Job..." -ForegroundColor Yellow
@@ -46,28 +46,16 @@ gcloud run jobs create $JOB_NAME `
     --task-timeout=10m `
     --execute-now=false
 
-# Get job URL
-$JOB_URL = "https://$REGION-run.googleapis.com/apis/run.googleapis.com/v1/namespaces/$PROJECT_ID/jobs/${JOB_NAME}:run"
-
-Write-Host "`nDeleting old scheduler..." -ForegroundColor Yellow
-gcloud scheduler jobs delete dbt-pipeline-daily --location=$REGION --project=$PROJECT_ID --quiet 2>$null
-gcloud scheduler jobs delete dbt-pipeline-hourly --location=$REGION --project=$PROJECT_ID --quiet 2>$null
-
-Write-Host "`nCreating new hourly scheduler..." -ForegroundColor Yellow
-gcloud scheduler jobs create http dbt-refresh-hourly `
-    --location=$REGION `
-    --schedule="0 * * * *" `
-    --time-zone="America/New_York" `
-    --uri=$JOB_URL `
-    --http-method=POST `
-    --oauth-service-account-email="868896275886-compute@developer.gserviceaccount.com" `
-    --project=$PROJECT_ID
+# Không tạo scheduler riêng cho job: function dbt-refresh (deploy_simple.ps1) gọi job mỗi giờ,
+# chỉ khi source có dữ liệu mới
+Write-Host "`nDeleting old direct scheduler..." -ForegroundColor Yellow
+gcloud scheduler jobs delete dbt-refresh-hourly --location=$REGION --project=$PROJECT_ID --quiet 2>$null
 
 # Clean up
 Set-Location $PSScriptRoot
 Remove-Item -Path $BUILD_DIR -Recurse -Force
 
 Write-Host "`n✅ Cloud Run Job setup complete!" -ForegroundColor Green
-Write-Host "`nSchedule: Every hour" -ForegroundColor Cyan
+Write-Host "`nTriggered hourly by the dbt-refresh function (deploy_simple.ps1)" -ForegroundColor Cyan
 Write-Host "`nTo trigger manually:" -ForegroundColor Cyan
 Write-Host "  gcloud run jobs execute $JOB_NAME --region=$REGION --project=$PROJECT_ID" -ForegroundColor White
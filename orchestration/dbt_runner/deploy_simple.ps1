@@ -1,5 +1,5 @@
-# Simple dbt automation via Cloud Scheduler calling BigQuery directly
-# No Cloud Build, no Cloud Function - just periodic view refresh
+# dbt refresh service: Cloud Scheduler -> Cloud Function dbt-refresh -> Cloud Run Job dbt (deploy_run_job.ps1)
+# Function chỉ chạy `dbt build` cho các source có dữ liệu mới (freshness từ metadata của bảng)
 
 $PROJECT_ID = "nyc-taxi-project-477115"
 $REGION = "us-central1"
@@ -10,8 +10,8 @@ Write-Host "`n=== Setting up simple dbt automation ===" -ForegroundColor Cyan
 Write-Host "`nDeleting old scheduler job..." -ForegroundColor Yellow
 gcloud scheduler jobs delete dbt-pipeline-daily --location=$REGION --project=$PROJECT_ID --quiet 2>$null
 
-# Create new scheduler that triggers view refresh via HTTP endpoint
-# We'll create a simple Cloud Function that runs bq queries to refresh views
+# Create new scheduler that triggers the refresh service via HTTP endpoint
+# Cần chạy deploy_run_job.ps1 trước (Cloud Run Job dbt-hourly-refresh)
 
 Write-Host "`nDeploying dbt refresh function..." -ForegroundColor Yellow
 Set-Location "$PSScriptRoot\..\dbt_runner"
@@ -26,6 +26,23 @@ gcloud functions deploy dbt-refresh `
     --allow-unauthenticated `
     --timeout=540s `
     --memory=512MB `
+    --set-env-vars="GCP_PROJECT=$PROJECT_ID,REGION=$REGION,DBT_RUN_JOB=dbt-hourly-refresh" `
+    --project=$PROJECT_ID
+
+# Function không chờ job dbt (job được tới 10 phút x retry, vượt timeout 540s của function):
+# trạng thái và thời gian / bytes từng model lấy qua dbt-refresh-status?execution=<tên execution>
+Write-Host "`nDeploying dbt refresh status function..." -ForegroundColor Yellow
+gcloud functions deploy dbt-refresh-status `
+    --gen2 `
+    --runtime=python311 `
+    --region=$REGION `
+    --source=. `
+    --entry-point=refresh_status `
+    --trigger-http `
+    --allow-unauthenticated `
+    --timeout=120s `
+    --memory=256MB `
+    --set-env-vars="GCP_PROJECT=$PROJECT_ID,REGION=$REGION,DBT_RUN_JOB=dbt-hourly-refresh" `
     --project=$PROJECT_ID
 
 # Get function URL
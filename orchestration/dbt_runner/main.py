@@ -1,38 +1,209 @@
-# Cloud Function to refresh BigQuery views (dbt models)
+# Cloud Function: refresh incremental các model dbt khi source của chúng có dữ liệu mới
+#
+# 1. Freshness từ metadata (tables.get: last modified), không quét bảng:
+#    model materialized cũ hơn source của nó -> stale. View luôn mới, không cần refresh.
+# 2. Mọi source thay đổi -> MỘT execution của Cloud Run Job dbt (deploy_run_job.ps1)
+#    với `dbt build --select source:<a>+ source:<b>+`. Mọi source đều dẫn tới fct_trips nên không có
+#    nhóm độc lập; các model không phụ thuộc nhau chạy song song nhờ `threads` của dbt (profiles.yml).
+#    Function không chờ job (job được tới 10 phút x retry, function chỉ 540s): trả về tên execution ngay.
+# 3. refresh_status(execution): trạng thái execution và thời gian / bytes của từng model
+#    lấy từ INFORMATION_SCHEMA.JOBS_BY_PROJECT trong khoảng thời gian execution chạy.
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import functions_framework
 from google.cloud import bigquery
+from google.cloud import run_v2
+
+PROJECT_ID = os.environ.get("GCP_PROJECT", "nyc-taxi-project-477115")
+REGION = os.environ.get("REGION", "us-central1")
+DBT_RUN_JOB = os.environ.get("DBT_RUN_JOB", "dbt-hourly-refresh")
+
+# Source dbt (sources.yml) -> bảng BigQuery và các model materialized (table / incremental) phía sau nó
+# Giữ khớp với ref() trong nyc_taxi_pipeline (model view không cần liệt kê)
+FACT_TABLES = [
+    "facts.fct_trips",
+    "facts.agg_hourly_demand_h3",
+    "facts.fct_hourly_features",
+    "facts.fct_fare_prediction_training",
+    "facts.agg_hourly_demand_h3_cube",
+    "facts.fct_pca_features",
+]
+WEATHER_TABLES = [
+    "staging_layer.stg_streaming_weather",
+    "staging_layer.stg_weather_unified",
+    "dimensions.dim_weather",
+    "dimensions.dim_weather_hourly",
+]
+SOURCES = {
+    # Bảng public (tên đầy đủ): zone đổi hiếm khi, nhưng ở môi trường mới zone_h3_mapping / dim_location
+    # chưa tồn tại -> stale -> được build trước các fact
+    "public_data.taxi_zone_lookup": {
+        "table": "bigquery-public-data.new_york_taxi_trips.taxi_zone_geom",
+        "models": ["dimensions.zone_h3_mapping", "dimensions.dim_location"] + FACT_TABLES,
+    },
+    "streaming_data.processed_trips": {
+        "table": "streaming.processed_trips",
+        "models": FACT_TABLES,
+    },
+    "raw_data.weather_api_data": {
+        "table": "raw_data.weather_api_data",
+        "models": WEATHER_TABLES + FACT_TABLES,
+    },
+    "staging_data.fake_weather_2025": {
+        "table": "staging.fake_weather_2025",
+        "models": WEATHER_TABLES[1:] + FACT_TABLES,
+    },
+}
+
+
+def get_last_modified(client, tables):
+    """Last-modified time of each table from table metadata (None when the table does not exist)."""
+    def modified(table):
+        try:
+            table_id = table if table.count(".") == 2 else f"{PROJECT_ID}.{table}"
+            return table, client.get_table(table_id).modified
+        except Exception:
+            return table, None
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        return dict(pool.map(modified, tables))
+
+
+def find_stale_sources(last_modified):
+    """Sources modified after the oldest materialized model built from them."""
+    stale = {}
+    for source, spec in SOURCES.items():
+        source_modified = last_modified[spec["table"]]
+        model_modified = [last_modified[model] for model in spec["models"]]
+        if source_modified is None:
+            continue
+        if None in model_modified or source_modified > min(model_modified):
+            stale[source] = spec["models"]
+    return stale
+
+
+def job_name():
+    return f"projects/{PROJECT_ID}/locations/{REGION}/jobs/{DBT_RUN_JOB}"
+
+
+def running_execution():
+    """Name of an execution of the dbt job that has not completed yet (None when idle)."""
+    for execution in run_v2.ExecutionsClient().list_executions(parent=job_name()):
+        if "completion_time" not in execution:
+            return execution.name
+    return None
+
+
+def start_dbt_build(sources):
+    """Starts the dbt Cloud Run Job with `dbt build --select source:<s>+ ...`; does not wait for it."""
+    selector = " ".join(f"source:{source}+" for source in sorted(sources))
+    request = run_v2.RunJobRequest(
+        name=job_name(),
+        overrides=run_v2.RunJobRequest.Overrides(
+            container_overrides=[run_v2.RunJobRequest.Overrides.ContainerOverride(
+                args=["dbt", "build", "--select", selector, "--profiles-dir", "."]
+            )]
+        ),
+    )
+    operation = run_v2.JobsClient().run_job(request=request)
+    return {"selector": selector, "execution": operation.metadata.name}
+
+
+def get_model_job_stats(client, models, started_at, ended_at):
+    """Duration and bytes of the BigQuery jobs that wrote each model between `started_at` and `ended_at`."""
+    query = f"""
+        SELECT
+            CONCAT(destination_table.dataset_id, '.',
+                   REGEXP_REPLACE(destination_table.table_id, r'__dbt_tmp$', '')) AS model,
+            COUNT(*) AS jobs,
+            SUM(TIMESTAMP_DIFF(end_time, start_time, MILLISECOND)) / 1000 AS duration_s,
+            SUM(total_bytes_processed) AS bytes_processed,
+            SUM(total_bytes_billed) AS bytes_billed
+        FROM `{PROJECT_ID}.region-us.INFORMATION_SCHEMA.JOBS_BY_PROJECT`
+        WHERE creation_time BETWEEN @started_at AND @ended_at
+          AND job_type = 'QUERY'
+          AND destination_table.table_id IS NOT NULL
+        GROUP BY model
+        HAVING model IN UNNEST(@models)
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("started_at", "TIMESTAMP", started_at),
+        bigquery.ScalarQueryParameter("ended_at", "TIMESTAMP", ended_at),
+        bigquery.ArrayQueryParameter("models", "STRING", sorted(models)),
+    ])
+    return {row.model: dict(row.items()) for row in client.query(query, job_config=job_config).result()}
+
 
 @functions_framework.http
 def run_dbt(request):
-    """HTTP Cloud Function to refresh dbt view models"""
-    
+    """HTTP Cloud Function: start a dbt build of the models whose sources changed since they were last built"""
     try:
-        client = bigquery.Client(project="nyc-taxi-project-477115")
-        
-        # Simply query the views to trigger refresh
-        # BigQuery will re-execute the view definitions
-        views_to_refresh = [
-            "staging_layer.stg_taxi_trips",
-            "facts.fct_trips", 
-            "facts.agg_hourly_demand_h3",
-            "facts.fct_hourly_features"
-        ]
-        
-        results = []
-        for view in views_to_refresh:
-            query = f"SELECT COUNT(*) as cnt FROM `nyc-taxi-project-477115.{view}`"
-            query_job = client.query(query)
-            result = list(query_job.result())[0]
-            results.append(f"{view}: {result.cnt} rows")
-        
+        client = bigquery.Client(project=PROJECT_ID)
+
+        # Execution trước còn chạy: model vẫn "stale" cho tới khi nó xong, không chạy chồng
+        running = running_execution()
+        if running:
+            return {
+                "status": "success",
+                "message": "A dbt build is still running, nothing started",
+                "execution": running,
+            }, 200
+
+        tables = {spec["table"] for spec in SOURCES.values()}
+        tables |= {model for spec in SOURCES.values() for model in spec["models"]}
+        last_modified = get_last_modified(client, tables)
+
+        stale = find_stale_sources(last_modified)
+        if not stale:
+            return {
+                "status": "success",
+                "message": "All models are fresh, nothing to refresh",
+                "execution": None,
+            }, 200
+
+        run = start_dbt_build(stale)
         return {
-            "status": "success",
-            "message": "Views refreshed successfully",
-            "results": results
-        }, 200
-        
+            "status": "started",
+            "message": f"Started a dbt build for {len(stale)} changed source(s); "
+                       f"per-model stats: refresh_status?execution=<execution>",
+            **run,
+            "sources": sorted(stale),
+            "models": sorted(set().union(*stale.values())),
+        }, 202
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }, 500
+
+
+@functions_framework.http
+def refresh_status(request):
+    """HTTP Cloud Function: state of a dbt-refresh execution and, once it is done, per-model duration / bytes"""
+    try:
+        name = request.args.get("execution")
+        if not name:
+            return {"status": "error", "message": "Missing ?execution=<execution name>"}, 400
+
+        execution = run_v2.ExecutionsClient().get_execution(name=name)
+        if "completion_time" not in execution:
+            return {"status": "running", "execution": name, "models": []}, 200
+
+        client = bigquery.Client(project=PROJECT_ID)
+        models = {model for spec in SOURCES.values() for model in spec["models"]}
+        stats = get_model_job_stats(client, models, execution.create_time, execution.completion_time)
+        status = "success" if execution.succeeded_count and not execution.failed_count else "failed"
+        return {
+            "status": status,
+            "execution": name,
+            "duration_s": round((execution.completion_time - execution.create_time).total_seconds(), 1),
+            "models": [{"model": model, **stats[model]} for model in sorted(stats)],
+        }, 200 if status == "success" else 500
+
     except Exception as e:
         return {
-            "status": "error", 
+            "status": "error",
             "message": str(e)
         }, 500
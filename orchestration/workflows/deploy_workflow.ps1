@@ -5,6 +5,10 @@ $PROJECT_ID = "nyc-taxi-project-477115"
 $REGION = "us-central1"
 $WORKFLOW_NAME = "daily-ml-pipeline"
 
+# Stored procedures dùng để bỏ qua train lại khi dữ liệu không đổi (gọi từ các bước train của workflow)
+Write-Host "Creating BQML training procedures..." -ForegroundColor Cyan
+Get-Content -Raw ..\..\bqml_scripts\training_procedures.sql | bq query --use_legacy_sql=false --project_id=$PROJECT_ID
+
 Write-Host "Deploying Cloud Workflow..." -ForegroundColor Cyan
 
 # Deploy workflow
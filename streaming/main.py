@@ -8,6 +8,7 @@ from google.cloud import bigquery
 import pytz
 from datetime import datetime, timedelta
 import random
+import farmhash
 
 # --- Cấu hình chung ---
 GCP_PROJECT_ID = os.environ.get("GCP_PROJECT_ID")
@@ -45,6 +46,23 @@ TRIPS_PER_BATCH = int(os.environ.get("TRIPS_PER_BATCH", "1000"))  # Số trips m
 bq_client = bigquery.Client()
 
 
+def compute_trip_id(pickup_datetime, vendor_id, total_amount):
+    """
+    trip_id INT64 giống hệt fct_trips: FARM_FINGERPRINT('YYYY-MM-DD HH:MM:SS|vendor_id|total_amount')
+    (chuỗi chuẩn hóa định nghĩa trong nyc_taxi_pipeline/macros/trip_id.sql).
+    Dùng làm insertId khi stream vào BigQuery để Pub/Sub gửi lại message không tạo dòng trùng.
+    """
+    if isinstance(pickup_datetime, str):
+        pickup_datetime = datetime.fromisoformat(pickup_datetime)
+    if pickup_datetime.tzinfo is not None:
+        pickup_datetime = pickup_datetime.astimezone(pytz.utc)  # FORMAT_TIMESTAMP mặc định theo UTC
+    trip_key = f"{pickup_datetime.strftime('%Y-%m-%d %H:%M:%S')}|{vendor_id}|{float(total_amount):.2f}"
+
+    # farmhash trả về uint64, FARM_FINGERPRINT của BigQuery là INT64 có dấu
+    fingerprint = farmhash.fingerprint64(trip_key)
+    return fingerprint - 2 ** 64 if fingerprint >= 2 ** 63 else fingerprint
+
+
 @functions_framework.http
 def fetch_weather_and_publish(request):
     """
@@ -213,6 +231,7 @@ def fetch_taxi_trips_and_publish(request):
             
             # Create trip message with ALL fields
             trip_data = {
+                "trip_id": compute_trip_id(pickup_2025, row.vendor_id, row.total_amount),
                 "vendor_id": str(row.vendor_id),
                 "pickup_datetime": pickup_2025.isoformat(),
                 "dropoff_datetime": dropoff_2025.isoformat(),
@@ -265,6 +284,8 @@ def insert_taxi_trips_to_bq(cloud_event):
         message_data_base64 = cloud_event.data["message"]["data"]
         json_string = base64.b64decode(message_data_base64).decode("utf-8")
         trip_data = json.loads(json_string)
+        # ID của message Pub/Sub (id của CloudEvent là chính ID này): giữ nguyên khi message bị gửi lại
+        message_id = cloud_event.data["message"].get("messageId") or cloud_event["id"]
         print(f"Received trip data: pickup at {trip_data['pickup_datetime']}")
         
     except (KeyError, TypeError, base64.binascii.Error, json.JSONDecodeError) as e:
@@ -279,7 +300,13 @@ def insert_taxi_trips_to_bq(cloud_event):
         # Add processing timestamp
         current_time_utc = datetime.now(pytz.utc)
         
+        # Message cũ (chưa có trip_id) -> tính lại từ chính các trường của chuyến
+        trip_id = trip_data.get("trip_id") or compute_trip_id(
+            trip_data["pickup_datetime"], trip_data["vendor_id"], trip_data["total_amount"]
+        )
+
         row_to_insert = {
+            "trip_id": trip_id,
             "vendor_id": trip_data["vendor_id"],
             "pickup_datetime": trip_data["pickup_datetime"],
             "dropoff_datetime": trip_data["dropoff_datetime"],
@@ -300,7 +327,10 @@ def insert_taxi_trips_to_bq(cloud_event):
             "processing_timestamp": current_time_utc.isoformat()
         }
         
-        errors = bq_client.insert_rows_json(table_id, [row_to_insert])
+        # row_ids = insertId: BigQuery bỏ qua (best-effort) dòng trùng message ID khi message bị gửi lại.
+        # Không dùng trip_id: fingerprint của (giây, vendor, số tiền) không duy nhất, hai chuyến khác nhau
+        # trùng trip_id sẽ bị bỏ mất một chuyến
+        errors = bq_client.insert_rows_json(table_id, [row_to_insert], row_ids=[message_id])
         
         if not errors:
             print(f"Successfully inserted trip to {table_id}")
@@ -1,5 +1,6 @@
 -- Create streaming table with ALL fields from TLC dataset
 CREATE TABLE IF NOT EXISTS `nyc-taxi-project-477115.streaming.processed_trips` (
+    trip_id INT64,  -- FARM_FINGERPRINT của (pickup, vendor, total), cùng giá trị với fct_trips.trip_id
     vendor_id STRING,
     pickup_datetime TIMESTAMP,
     dropoff_datetime TIMESTAMP,
@@ -20,7 +21,12 @@ CREATE TABLE IF NOT EXISTS `nyc-taxi-project-477115.streaming.processed_trips` (
     processing_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
 )
 PARTITION BY DATE(pickup_datetime)
+CLUSTER BY trip_id
 OPTIONS(
   description='Streaming taxi trips with full TLC fields (2021 data shifted to 2025)',
   partition_expiration_days=90
 );
+
+-- Bảng đã tồn tại từ trước: thêm cột trip_id (dòng cũ để NULL, fct_trips tự tính lại)
+ALTER TABLE `nyc-taxi-project-477115.streaming.processed_trips`
+ADD COLUMN IF NOT EXISTS trip_id INT64;
@@ -0,0 +1,158 @@
+"""
+backfill.py
+Rebuilds a date range of the daily-partitioned fact models in parallel batches
+
+Instead of one serial `dbt run --full-refresh`, the range [--start, --end] is split into batches of
+--batch-days days. Each batch is one `dbt run --select <model> --vars '{backfill_start, backfill_end}'`
+that computes and overwrites only those partitions (macros/incremental.sql). Batches of a model run
+concurrently (at most --parallelism at a time); models run one after another in dependency order
+because fct_hourly_features reads 7 days of agg_hourly_demand_h3 before each batch.
+
+Completed batches are checkpointed to a JSON file after each success, so re-running the same command
+after a failure only runs the missing batches (--restart ignores the checkpoint).
+
+Usage:
+    python tools/backfill.py --start 2025-01-01 --end 2025-12-31
+    python tools/backfill.py --start 2025-06-01 --end 2025-06-30 --models fct_hourly_features --parallelism 8
+    python tools/backfill.py --start 2025-01-01 --end 2025-12-31 --recreate   # after adding / changing columns
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nyc_taxi_pipeline")
+
+# Thứ tự phụ thuộc: fct_trips -> agg_hourly_demand_h3 -> fct_hourly_features
+BACKFILL_MODELS = ["fct_trips", "agg_hourly_demand_h3", "fct_hourly_features"]
+
+
+def split_batches(start, end, batch_days):
+    """[(batch_start, batch_end_exclusive), ...] covering start..end (inclusive)."""
+    batches = []
+    batch_start = start
+    while batch_start <= end:
+        batch_end = min(batch_start + timedelta(days=batch_days), end + timedelta(days=1))
+        batches.append((batch_start, batch_end))
+        batch_start = batch_end
+    return batches
+
+
+class Checkpoint:
+    """Completed batches per model, persisted to JSON after every update (safe across threads)."""
+
+    def __init__(self, path, restart=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+        if os.path.exists(path) and not restart:
+            with open(path, "r", encoding="utf-8") as f:
+                self.done = json.load(f)
+
+    def is_done(self, model, batch_start):
+        return batch_start.isoformat() in self.done.get(model, [])
+
+    def mark_done(self, model, batch_start):
+        with self.lock:
+            self.done.setdefault(model, []).append(batch_start.isoformat())
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.done, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def run_batch(model, batch, target, profiles_dir, full_refresh=False):
+    """One dbt invocation for one batch; own target/log path so parallel runs don't clobber each other."""
+    batch_start, batch_end = batch
+    batch_target = f"target/backfill/{model}/{batch_start.isoformat()}"
+    backfill_vars = json.dumps({"backfill_start": batch_start.isoformat(), "backfill_end": batch_end.isoformat()})
+    args = [
+        "dbt", "run", "--select", model, "--target", target, "--vars", backfill_vars,
+        "--target-path", batch_target, "--log-path", f"{batch_target}/logs",
+    ]
+    if profiles_dir:
+        args += ["--profiles-dir", profiles_dir]
+    if full_refresh:
+        args.append("--full-refresh")
+
+    start = time.perf_counter()
+    result = subprocess.run(args, cwd=PROJECT_DIR, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    status = "ok" if result.returncode == 0 else "FAILED"
+    print(f"  {model} {batch_start} -> {batch_end}: {status} ({elapsed:.1f}s)", flush=True)
+    if result.returncode != 0:
+        print(result.stdout[-2000:], file=sys.stderr)
+    return result.returncode == 0
+
+
+def backfill_model(model, batches, checkpoint, args):
+    """Runs the pending batches of one model; returns the failed batches."""
+    pending = [batch for batch in batches if not checkpoint.is_done(model, batch[0])]
+    print(f"{model}: {len(batches) - len(pending)} done, {len(pending)} pending", flush=True)
+    if not pending:
+        return []
+
+    def run(batch, full_refresh=False):
+        ok = run_batch(model, batch, args.target, args.profiles_dir, full_refresh)
+        if ok:
+            checkpoint.mark_done(model, batch[0])
+        return ok
+
+    # Lô đầu chạy một mình: tạo bảng nếu chưa có (hoặc tạo lại với --recreate) trước khi các lô khác ghi vào
+    first, rest = pending[0], pending[1:]
+    if not run(first, full_refresh=args.recreate and len(pending) == len(batches)):
+        return [first]
+
+    with ThreadPoolExecutor(max_workers=args.parallelism) as pool:
+        results = list(pool.map(run, rest))
+    return [batch for batch, ok in zip(rest, results) if not ok]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel date-partitioned backfill of the fact models")
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, type=date.fromisoformat, help="Last day, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--models", nargs="+", default=BACKFILL_MODELS, choices=BACKFILL_MODELS)
+    parser.add_argument("--batch-days", type=int, default=7, help="Days (partitions) per dbt invocation")
+    parser.add_argument("--parallelism", type=int, default=4, help="Max concurrent batches per model")
+    parser.add_argument("--target", default="prod", help="dbt target (duckdb runs batches one at a time)")
+    parser.add_argument("--profiles-dir", default=None)
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint JSON (default: nyc_taxi_pipeline/target/backfill/<start>_<end>.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and run every batch")
+    parser.add_argument("--recreate", action="store_true",
+                        help="Recreate each table with its first batch (schema change). "
+                             "Partitions outside --start/--end are dropped")
+    args = parser.parse_args()
+
+    if args.target == "duckdb" and args.parallelism > 1:
+        # File DuckDB chỉ cho một process ghi
+        print("duckdb target: running batches sequentially")
+        args.parallelism = 1
+
+    checkpoint_path = args.checkpoint or os.path.join(
+        PROJECT_DIR, "target", "backfill", f"{args.start.isoformat()}_{args.end.isoformat()}.json")
+    checkpoint = Checkpoint(checkpoint_path, restart=args.restart)
+    batches = split_batches(args.start, args.end, args.batch_days)
+    print(f"Backfill {args.start} -> {args.end}: {len(batches)} batch(es) of {args.batch_days} day(s), "
+          f"parallelism {args.parallelism}, checkpoint {checkpoint_path}")
+
+    # Model sau đọc kết quả của model trước -> không bắt đầu khi model trước còn lô lỗi
+    for model in [m for m in BACKFILL_MODELS if m in args.models]:
+        failed = backfill_model(model, batches, checkpoint, args)
+        if failed:
+            print(f"\n{model}: {len(failed)} batch(es) failed "
+                  f"({', '.join(batch[0].isoformat() for batch in failed)}). Re-run the same command to resume.")
+            sys.exit(1)
+
+    print("\nBackfill complete")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+dbt_perf_report.py
+Per-model performance report for a dbt invocation (run_results.json + BigQuery job statistics)
+
+For every model of the last invocation it collects:
+- execution time (run_results.json)
+- bytes processed / billed, slot-ms, rows affected, job id (adapter_response of dbt-bigquery,
+  completed from the BigQuery job itself with --enrich-jobs when a field is missing)
+
+The rows are appended to a history (Parquet file and/or BigQuery table) and each model is
+compared with the rolling median of its previous successful runs to print regressions.
+
+Usage:
+    # Local history file
+    python tools/dbt_perf_report.py --run-results nyc_taxi_pipeline/target/run_results.json \
+        --history-parquet dbt_perf_history.parquet
+
+    # BigQuery history table (Airflow task dbt_perf_report)
+    python tools/dbt_perf_report.py --run-results /path/target/run_results.json \
+        --bq-table nyc-taxi-project-477115.monitoring.dbt_model_runs --enrich-jobs
+"""
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+GCP_PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "nyc-taxi-project-477115")
+
+HISTORY_COLUMNS = [
+    "invocation_id",
+    "generated_at",
+    "target",
+    "model",
+    "status",
+    "execution_time_s",
+    "bytes_processed",
+    "bytes_billed",
+    "slot_ms",
+    "rows_affected",
+    "job_id",
+]
+
+# Metric -> mức tăng tuyệt đối tối thiểu để coi là regression (tránh báo động với model rất nhỏ)
+REGRESSION_METRICS = {
+    "execution_time_s": 5.0,
+    "bytes_processed": 100 * 1024 ** 2,
+    "slot_ms": 10_000,
+}
+
+
+def load_model_stats(run_results_path, target=None):
+    """Returns one dict per model from run_results.json (tests / seeds are skipped)."""
+    with open(run_results_path, "r", encoding="utf-8") as f:
+        run_results = json.load(f)
+
+    metadata = run_results["metadata"]
+    target = target or run_results.get("args", {}).get("target") or "default"
+    stats = []
+    for result in run_results["results"]:
+        if not result["unique_id"].startswith("model."):
+            continue
+        response = result.get("adapter_response") or {}
+        stats.append({
+            "invocation_id": metadata["invocation_id"],
+            "generated_at": pd.Timestamp(metadata["generated_at"]),
+            "target": target,
+            "model": result["unique_id"].split(".")[-1],
+            "status": result["status"],
+            "execution_time_s": round(result["execution_time"], 3),
+            "bytes_processed": response.get("bytes_processed"),
+            "bytes_billed": response.get("bytes_billed"),
+            "slot_ms": response.get("slot_ms"),
+            "rows_affected": response.get("rows_affected"),
+            "job_id": response.get("job_id"),
+            "_location": response.get("location"),
+            "_project_id": response.get("project_id"),
+        })
+    return stats
+
+
+def enrich_from_bigquery_jobs(stats, project_id=GCP_PROJECT_ID):
+    """Fills bytes / slot-ms missing from adapter_response using the BigQuery job statistics."""
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=project_id)
+    for row in stats:
+        if not row["job_id"] or None not in (row["bytes_processed"], row["bytes_billed"], row["slot_ms"]):
+            continue
+        job = client.get_job(row["job_id"], project=row["_project_id"] or project_id, location=row["_location"])
+        row["bytes_processed"] = row["bytes_processed"] if row["bytes_processed"] is not None else job.total_bytes_processed
+        row["bytes_billed"] = row["bytes_billed"] if row["bytes_billed"] is not None else job.total_bytes_billed
+        row["slot_ms"] = row["slot_ms"] if row["slot_ms"] is not None else job.slot_millis
+    return stats
+
+
+def to_frame(stats):
+    """History rows as a DataFrame with stable column order and dtypes."""
+    df = pd.DataFrame(stats, columns=HISTORY_COLUMNS)
+    for column in ("bytes_processed", "bytes_billed", "slot_ms", "rows_affected"):
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("Int64")
+    df["generated_at"] = pd.to_datetime(df["generated_at"], utc=True)
+    return df
+
+
+# =====================
+# History backends
+# =====================
+def load_history_parquet(path):
+    """Reads the Parquet history (empty frame when the file does not exist yet)."""
+    if not os.path.exists(path):
+        return to_frame([])
+    return pd.read_parquet(path)
+
+
+def append_history_parquet(df, path):
+    """Appends the rows of one invocation to the Parquet history."""
+    history = load_history_parquet(path)
+    history = history[~history["invocation_id"].isin(df["invocation_id"].unique())]  # Chạy lại report không ghi trùng
+    combined = pd.concat([history, df], ignore_index=True) if len(history) else df
+    combined.to_parquet(path, index=False)
+
+
+def load_history_bigquery(table_id, models, window, project_id=GCP_PROJECT_ID):
+    """Last `window` successful runs of each model from the BigQuery history table."""
+    from google.api_core.exceptions import NotFound
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=project_id)
+    query = f"""
+        SELECT *
+        FROM `{table_id}`
+        WHERE model IN UNNEST(@models)
+          AND status = 'success'
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY target, model ORDER BY generated_at DESC) <= @window
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("models", "STRING", models),
+        bigquery.ScalarQueryParameter("window", "INT64", window),
+    ])
+    try:
+        return client.query(query, job_config=job_config).to_dataframe()
+    except NotFound:
+        return to_frame([])
+
+
+def append_history_bigquery(df, table_id, project_id=GCP_PROJECT_ID):
+    """Appends the rows to a day-partitioned BigQuery table (created on first use)."""
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=project_id)
+    dataset_id = table_id.rsplit(".", 1)[0]
+    client.create_dataset(dataset_id, exists_ok=True)
+
+    job_config = bigquery.LoadJobConfig(
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        time_partitioning=bigquery.TimePartitioning(field="generated_at"),
+        schema=[
+            bigquery.SchemaField("invocation_id", "STRING"),
+            bigquery.SchemaField("generated_at", "TIMESTAMP"),
+            bigquery.SchemaField("target", "STRING"),
+            bigquery.SchemaField("model", "STRING"),
+            bigquery.SchemaField("status", "STRING"),
+            bigquery.SchemaField("execution_time_s", "FLOAT64"),
+            bigquery.SchemaField("bytes_processed", "INT64"),
+            bigquery.SchemaField("bytes_billed", "INT64"),
+            bigquery.SchemaField("slot_ms", "INT64"),
+            bigquery.SchemaField("rows_affected", "INT64"),
+            bigquery.SchemaField("job_id", "STRING"),
+        ],
+    )
+    client.load_table_from_dataframe(df, table_id, job_config=job_config).result()
+
+
+# =====================
+# Report
+# =====================
+def find_regressions(current, history, window=7, threshold=0.5):
+    """Compares each model with the median of its previous `window` successful runs on the same target.
+
+    A metric regresses when it is more than `threshold` (50% by default) above the baseline
+    and the absolute increase is above the floor in REGRESSION_METRICS.
+    """
+    previous = history[
+        (history["status"] == "success")
+        & (~history["invocation_id"].isin(current["invocation_id"].unique()))
+    ].sort_values("generated_at")
+
+    regressions = []
+    for row in current.itertuples(index=False):
+        runs = previous[(previous["model"] == row.model) & (previous["target"] == row.target)].tail(window)
+        if runs.empty:
+            continue
+        for metric, min_delta in REGRESSION_METRICS.items():
+            value = getattr(row, metric)
+            baseline = pd.to_numeric(runs[metric], errors="coerce").median()
+            if pd.isna(value) or pd.isna(baseline):
+                continue
+            if value > baseline * (1 + threshold) and value - baseline > min_delta:
+                regressions.append({
+                    "model": row.model,
+                    "metric": metric,
+                    "value": float(value),
+                    "baseline": float(baseline),
+                    "runs_in_baseline": len(runs),
+                })
+    return regressions
+
+
+def _format_bytes(value):
+    if pd.isna(value):
+        return "-"
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if value < 1024 or unit == "TB":
+            return f"{value:,.1f} {unit}"
+        value /= 1024
+
+
+def print_report(current, regressions):
+    """Prints the models of this invocation (slowest first) and the regressions found."""
+    print(f"\n{'model':40s} {'status':8s} {'seconds':>9s} {'processed':>12s} {'slot-ms':>12s} {'rows':>12s}")
+    print("-" * 98)
+    for row in current.sort_values("execution_time_s", ascending=False).itertuples(index=False):
+        slot_ms = "-" if pd.isna(row.slot_ms) else f"{row.slot_ms:,d}"
+        rows = "-" if pd.isna(row.rows_affected) else f"{row.rows_affected:,d}"
+        print(f"{row.model:40s} {row.status:8s} {row.execution_time_s:9.2f} "
+              f"{_format_bytes(row.bytes_processed):>12s} {slot_ms:>12s} {rows:>12s}")
+    print("-" * 98)
+    print(f"{'total':49s} {current['execution_time_s'].sum():9.2f} "
+          f"{_format_bytes(current['bytes_processed'].sum(min_count=1)):>12s}")
+
+    if not regressions:
+        print("\nNo regressions against the rolling baseline")
+        return
+    print(f"\nREGRESSIONS ({len(regressions)}):")
+    for item in regressions:
+        value, baseline = item["value"], item["baseline"]
+        if item["metric"] == "bytes_processed":
+            value, baseline = _format_bytes(value), _format_bytes(baseline)
+        else:
+            value, baseline = f"{value:,.2f}", f"{baseline:,.2f}"
+        print(f"  {item['model']:40s} {item['metric']:18s} {value:>14s} vs median {baseline:>14s} "
+              f"(last {item['runs_in_baseline']} runs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-model dbt performance report with rolling-baseline regressions")
+    parser.add_argument("--run-results", default="target/run_results.json", help="Path to dbt run_results.json")
+    parser.add_argument("--target", help="Target name stored with the rows (default: from run_results args)")
+    parser.add_argument("--history-parquet", help="Parquet history file to compare with and append to")
+    parser.add_argument("--bq-table", help="BigQuery history table to compare with and append to")
+    parser.add_argument("--enrich-jobs", action="store_true", help="Read missing bytes / slot-ms from BigQuery jobs")
+    parser.add_argument("--window", type=int, default=7, help="Number of previous runs in the baseline")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Relative increase counted as regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with code 1 when regressions are found")
+    args = parser.parse_args()
+
+    stats = load_model_stats(args.run_results, args.target)
+    if not stats:
+        print(f"No model results in {args.run_results}")
+        return
+    if args.enrich_jobs:
+        enrich_from_bigquery_jobs(stats)
+    current = to_frame(stats)
+
+    # So sánh với lịch sử TRƯỚC khi ghi lần chạy hiện tại vào
+    histories = []
+    if args.history_parquet:
+        histories.append(load_history_parquet(args.history_parquet))
+    if args.bq_table:
+        histories.append(load_history_bigquery(args.bq_table, current["model"].tolist(), args.window))
+    history = pd.concat(histories, ignore_index=True) if histories else to_frame([])
+
+    regressions = find_regressions(current, history, args.window, args.threshold)
+    print_report(current, regressions)
+
+    if args.history_parquet:
+        append_history_parquet(current, args.history_parquet)
+    if args.bq_table:
+        append_history_bigquery(current, args.bq_table)
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+duckdb_sources.py
+Synthetic source tables for running the dbt project locally (target `duckdb`)
+
+Creates, inside a DuckDB file, every table declared in models/sources.yml with the
+same schema / table names and column types as the BigQuery originals:
+
+    new_york_taxi_trips.tlc_yellow_trips_2021   (historical trips, 2021)
+    new_york_taxi_trips.taxi_zone_geom          (265 zones with polygon geometry)
+    noaa_gsod.gsod2021                          (3 NYC stations, daily)
+    raw_data.weather_api_data                   (OpenWeather JSON payloads)
+    streaming.processed_trips                   (streamed trips after 2025-11-24)
+    staging.fake_weather_2025                   (same SQL as test/populate_weather_data.sql)
+
+All rows are generated in SQL with range() / random(), so millions of trips take
+seconds and never pass through Python.
+
+Usage:
+    python tools/duckdb_sources.py --path nyc_taxi_pipeline/nyc_taxi_local.duckdb --rows 5000000
+"""
+import argparse
+import os
+import time
+
+import duckdb
+
+N_ZONES = 263  # Taxi zones 1-263, zones 264/265 are 'Unknown' like the real lookup
+HISTORICAL_START = "2021-01-01"
+HISTORICAL_DAYS = 327  # 2021-01-01 -> 2021-11-24 (cut-off của stg_taxi_trips)
+STREAMING_START = "2025-11-24"
+STREAMING_DAYS = 38  # 2025-11-24 -> 2025-12-31
+WEATHER_STATIONS = ("725030", "744860", "725053")
+
+SOURCE_SCHEMAS = ("new_york_taxi_trips", "noaa_gsod", "raw_data", "streaming", "staging")
+
+
+def load_extensions(con):
+    """Loads the extensions the generator needs (json for payloads, spatial for zone polygons)."""
+    for extension in ("json", "spatial"):
+        con.install_extension(extension)
+        con.load_extension(extension)
+
+
+def create_zone_table(con):
+    """Taxi zones: square polygons (~1 km) scattered over the NYC bounding box."""
+    con.execute(f"""
+        CREATE OR REPLACE TABLE new_york_taxi_trips.taxi_zone_geom AS
+        WITH zones AS (
+            SELECT
+                range + 1 AS zone_id,
+                -74.05 + random() * 0.30 AS lng,
+                40.57 + random() * 0.30 AS lat
+            FROM range({N_ZONES + 2})
+        )
+        SELECT
+            CAST(zone_id AS VARCHAR) AS zone_id,
+            'Zone ' || zone_id AS zone_name,
+            CASE
+                WHEN zone_id > {N_ZONES} THEN 'Unknown'
+                WHEN zone_id % 5 = 0 THEN 'Manhattan'
+                WHEN zone_id % 5 = 1 THEN 'Brooklyn'
+                WHEN zone_id % 5 = 2 THEN 'Queens'
+                WHEN zone_id % 5 = 3 THEN 'Bronx'
+                ELSE 'Staten Island'
+            END AS borough,
+            ST_GeomFromText(printf(
+                'POLYGON((%f %f, %f %f, %f %f, %f %f, %f %f))',
+                lng - 0.006, lat - 0.004, lng + 0.006, lat - 0.004, lng + 0.006, lat + 0.004,
+                lng - 0.006, lat + 0.004, lng - 0.006, lat - 0.004
+            )) AS zone_geom
+        FROM zones
+    """)
+
+
+def _trip_select(n_rows, start, days):
+    """SELECT producing TLC-shaped trips; a few rows are invalid on purpose to exercise the staging filters."""
+    return f"""
+        WITH base AS (
+            SELECT
+                TIMESTAMP '{start}' + to_seconds(CAST(floor(random() * {days * 86400}) AS BIGINT)) AS pickup_datetime,
+                round(0.3 + -ln(1 - random()) * 2.7, 2) AS trip_distance,
+                -- Zone phổ biến hơn ở id nhỏ (phân phối lệch như dữ liệu thật)
+                CAST(1 + floor(pow(random(), 2.5) * {N_ZONES}) AS INTEGER) AS pickup_zone,
+                CAST(1 + floor(pow(random(), 2.0) * {N_ZONES}) AS INTEGER) AS dropoff_zone,
+                CASE WHEN random() < 0.01 THEN 0 ELSE CAST(1 + floor(pow(random(), 3) * 5) AS INTEGER) END AS passenger_count,
+                CAST(1 + floor(random() * 2) AS INTEGER) AS vendor,
+                CASE WHEN random() < 0.7 THEN '1' ELSE '2' END AS payment_type,
+                random() AS noise
+            FROM range({n_rows})
+        ),
+        priced AS (
+            SELECT
+                *,
+                120 + trip_distance * 170 + noise * 600 AS duration_seconds,
+                round(2.5 + trip_distance * 2.5 + noise * 4, 2) AS fare_amount
+            FROM base
+        )
+        SELECT
+            CAST(vendor AS VARCHAR) AS vendor_id,
+            pickup_datetime,
+            pickup_datetime + to_seconds(CAST(duration_seconds AS BIGINT)) AS dropoff_datetime,
+            passenger_count,
+            CAST(trip_distance AS DECIMAL(9, 2)) AS trip_distance,
+            '1' AS rate_code,
+            'N' AS store_and_fwd_flag,
+            payment_type,
+            CAST(fare_amount AS DECIMAL(9, 2)) AS fare_amount,
+            CAST(0.5 AS DECIMAL(9, 2)) AS extra,
+            CAST(0.5 AS DECIMAL(9, 2)) AS mta_tax,
+            CAST(CASE WHEN payment_type = '1' THEN round(fare_amount * 0.2, 2) ELSE 0 END AS DECIMAL(9, 2)) AS tip_amount,
+            CAST(0 AS DECIMAL(9, 2)) AS tolls_amount,
+            CAST(0.3 AS DECIMAL(9, 2)) AS imp_surcharge,
+            CAST(0 AS DECIMAL(9, 2)) AS airport_fee,
+            CAST(fare_amount + 1.3 + CASE WHEN payment_type = '1' THEN round(fare_amount * 0.2, 2) ELSE 0 END
+                 AS DECIMAL(9, 2)) AS total_amount,
+            CAST(pickup_zone AS VARCHAR) AS pickup_location_id,
+            CAST(dropoff_zone AS VARCHAR) AS dropoff_location_id
+        FROM priced
+    """
+
+
+def create_trip_tables(con, n_trips, parquet_dir=None):
+    """Historical 2021 trips plus a smaller streaming tail (2% of the volume) after the cut-off.
+
+    With `parquet_dir` the historical trips are loaded from tools/synthetic_tlc.py output instead.
+    """
+    if parquet_dir:
+        trips_glob = os.path.join(parquet_dir, "trips", "**", "*.parquet")
+        money_columns = ("trip_distance", "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+                         "imp_surcharge", "airport_fee", "total_amount")
+        con.execute(f"""
+            CREATE OR REPLACE TABLE new_york_taxi_trips.tlc_yellow_trips_2021 AS
+            SELECT
+                * EXCLUDE (year, month, {", ".join(money_columns)}),
+                {", ".join(f"CAST({column} AS DECIMAL(9, 2)) AS {column}" for column in money_columns)}
+            FROM read_parquet('{trips_glob}', hive_partitioning = true)
+        """)
+        n_trips = con.execute("SELECT COUNT(*) FROM new_york_taxi_trips.tlc_yellow_trips_2021").fetchone()[0]
+    else:
+        con.execute(f"""
+            CREATE OR REPLACE TABLE new_york_taxi_trips.tlc_yellow_trips_2021 AS
+            {_trip_select(n_trips, HISTORICAL_START, HISTORICAL_DAYS)}
+        """)
+    n_streaming = max(n_trips // 50, 1000)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE streaming.processed_trips AS
+        SELECT *, pickup_datetime + INTERVAL 2 SECOND AS processing_timestamp
+        FROM ({_trip_select(n_streaming, STREAMING_START, STREAMING_DAYS)})
+    """)
+
+
+def _create_gsod_table(con):
+    """Synthetic NOAA GSOD rows (°F, inches, '0'/'1' flags)."""
+    stations = ", ".join(f"('{stn}')" for stn in WEATHER_STATIONS)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE noaa_gsod.gsod2021 AS
+        WITH days AS (
+            SELECT
+                stations.stn,
+                CAST(day AS DATE) AS date,
+                -- Nhiệt độ theo mùa (°F): lạnh nhất giữa tháng 1, nóng nhất giữa tháng 7
+                55 - 22 * cos(2 * pi() * (dayofyear(day) - 15) / 365) + (random() - 0.5) * 10 AS temp,
+                CASE WHEN random() < 0.3 THEN round(random() * 1.2, 2) ELSE 0 END AS prcp,
+                random() AS fog_draw
+            FROM range(DATE '2021-01-01', DATE '2022-01-01', INTERVAL 1 DAY) AS t(day)
+            CROSS JOIN (VALUES {stations}) AS stations(stn)
+        )
+        SELECT
+            stn,
+            date,
+            round(temp, 1) AS temp,
+            round(temp + 8, 1) AS max,
+            round(temp - 8, 1) AS min,
+            prcp,
+            CASE WHEN fog_draw < 0.1 THEN '1' ELSE '0' END AS fog,
+            CASE WHEN prcp > 0 AND temp >= 34 THEN '1' ELSE '0' END AS rain_drizzle,
+            CASE WHEN prcp > 0 AND temp < 34 THEN '1' ELSE '0' END AS snow_ice_pellets
+        FROM days
+    """)
+
+
+def create_weather_tables(con, parquet_dir=None):
+    """NOAA GSOD 2021 for the 3 NYC stations, OpenWeather payloads and fake_weather_2025."""
+    if parquet_dir:
+        con.execute(f"""
+            CREATE OR REPLACE TABLE noaa_gsod.gsod2021 AS
+            SELECT * FROM read_parquet('{os.path.join(parquet_dir, "weather", "gsod.parquet")}')
+        """)
+    else:
+        _create_gsod_table(con)
+
+    # Một payload OpenWeather mỗi giờ cho giai đoạn streaming
+    con.execute(f"""
+        CREATE OR REPLACE TABLE raw_data.weather_api_data AS
+        WITH hours AS (
+            SELECT
+                ts,
+                8 + (random() - 0.5) * 8 AS temp,
+                CASE WHEN random() < 0.2 THEN round(random() * 3, 2) END AS rain_1h
+            FROM range(TIMESTAMP '{STREAMING_START}', TIMESTAMP '{STREAMING_START}' + INTERVAL {STREAMING_DAYS} DAY,
+                       INTERVAL 1 HOUR) AS t(ts)
+        )
+        SELECT
+            CAST(json_object(
+                'dt', CAST(epoch(ts) AS BIGINT),
+                'main', json_object('temp', round(temp, 2), 'temp_max', round(temp + 2, 2), 'temp_min', round(temp - 2, 2)),
+                'rain', CASE WHEN rain_1h IS NOT NULL THEN json_object('1h', rain_1h) END,
+                'weather', json_array(json_object('main', CASE WHEN rain_1h IS NOT NULL THEN 'Rain' ELSE 'Clouds' END))
+            ) AS VARCHAR) AS raw_json,
+            ts + INTERVAL 1 MINUTE AS inserted_at
+        FROM hours
+    """)
+
+    # Giống test/populate_weather_data.sql (NOAA 2021 + 4 năm, gộp theo ngày)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE staging.fake_weather_2025 AS
+        SELECT
+            CAST(date + INTERVAL 4 YEAR AS DATE) AS observation_date,
+            ROUND(AVG((CAST(temp AS DECIMAL(18, 3)) - 32) * 5 / 9), 2) AS avg_temp_celsius,
+            ROUND(MAX((CAST(max AS DECIMAL(18, 3)) - 32) * 5 / 9), 2) AS max_temp_celsius,
+            ROUND(MIN((CAST(min AS DECIMAL(18, 3)) - 32) * 5 / 9), 2) AS min_temp_celsius,
+            ROUND(AVG(CAST(prcp AS DECIMAL(18, 3)) * 25.4), 2) AS precipitation_mm,
+            BOOL_OR(CAST(rain_drizzle AS INTEGER) = 1) AS is_rainy,
+            BOOL_OR(CAST(snow_ice_pellets AS INTEGER) = 1) AS is_snowy,
+            BOOL_OR(CAST(fog AS INTEGER) = 1) AS is_foggy
+        FROM noaa_gsod.gsod2021
+        WHERE stn IN ({", ".join(f"'{stn}'" for stn in WEATHER_STATIONS)})
+          AND date BETWEEN DATE '2021-01-01' AND DATE '2021-12-06'
+        GROUP BY 1
+        ORDER BY 1
+    """)
+
+
+def create_sources(con, n_trips, seed=0.42, parquet_dir=None):
+    """Creates every source table and returns {table: (row_count, seconds)}.
+
+    `parquet_dir` (output of tools/synthetic_tlc.py) replaces the SQL-generated trips and NOAA rows.
+    """
+    con.execute(f"SELECT setseed({seed})")
+    for schema in SOURCE_SCHEMAS:
+        con.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+
+    steps = [
+        ("new_york_taxi_trips.taxi_zone_geom", lambda: create_zone_table(con)),
+        ("new_york_taxi_trips.tlc_yellow_trips_2021", lambda: create_trip_tables(con, n_trips, parquet_dir)),
+        ("noaa_gsod.gsod2021", lambda: create_weather_tables(con, parquet_dir)),
+    ]
+    timings = {}
+    for label, step in steps:
+        start = time.perf_counter()
+        step()
+        timings[label] = time.perf_counter() - start
+
+    stats = {}
+    for table in (
+        "new_york_taxi_trips.taxi_zone_geom",
+        "new_york_taxi_trips.tlc_yellow_trips_2021",
+        "streaming.processed_trips",
+        "noaa_gsod.gsod2021",
+        "raw_data.weather_api_data",
+        "staging.fake_weather_2025",
+    ):
+        row_count = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        stats[table] = (row_count, timings.get(table))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic source tables for the DuckDB dbt target")
+    parser.add_argument("--path", default="nyc_taxi_pipeline/nyc_taxi_local.duckdb", help="DuckDB database file")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of historical trips")
+    parser.add_argument("--seed", type=float, default=0.42, help="DuckDB random seed (between 0 and 1)")
+    parser.add_argument("--parquet-dir", help="Load trips / NOAA rows from tools/synthetic_tlc.py output")
+    args = parser.parse_args()
+
+    con = duckdb.connect(args.path)
+    load_extensions(con)
+    stats = create_sources(con, args.rows, args.seed, args.parquet_dir)
+    con.close()
+
+    for table, (row_count, seconds) in stats.items():
+        elapsed = f"{seconds:6.2f}s" if seconds is not None else ""
+        print(f"{table:45s} {row_count:>12,d} {elapsed}")
+
+
+if __name__ == "__main__":
+    main()
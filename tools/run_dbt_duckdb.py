@@ -0,0 +1,127 @@
+"""
+run_dbt_duckdb.py
+Runs the whole dbt DAG (staging -> marts) locally on DuckDB and reports per-model timings
+
+Steps:
+1. Generate synthetic source tables (tools/duckdb_sources.py) unless --skip-generate
+2. dbt seed + dbt run with `--target duckdb` (profile in nyc_taxi_pipeline/profiles.yml)
+3. Read target/run_results.json and print execution time / status / row count of every model
+4. Optionally (--history) append the timings to a Parquet history and print regressions
+   against the rolling baseline (tools/dbt_perf_report.py)
+
+Usage:
+    python tools/run_dbt_duckdb.py --rows 5000000
+    python tools/run_dbt_duckdb.py --parquet-dir data/synthetic_tlc   # output of tools/synthetic_tlc.py
+    python tools/run_dbt_duckdb.py --skip-generate --select fct_trips+
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import duckdb
+
+import dbt_perf_report
+import duckdb_sources
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nyc_taxi_pipeline")
+DEFAULT_DB_PATH = os.path.join(PROJECT_DIR, "nyc_taxi_local.duckdb")
+
+
+def run_dbt(command, db_path, extra_args=()):
+    """Runs one dbt command against the duckdb target, raising if it fails."""
+    env = {**os.environ, "DBT_DUCKDB_PATH": os.path.abspath(db_path)}
+    args = ["dbt", *command, "--target", "duckdb", "--profiles-dir", PROJECT_DIR, *extra_args]
+    print(f"$ {' '.join(args)}")
+    subprocess.run(args, cwd=PROJECT_DIR, env=env, check=True)
+
+
+def load_run_results(path=None):
+    """Returns the model results from dbt's run_results.json."""
+    path = path or os.path.join(PROJECT_DIR, "target", "run_results.json")
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def table_row_counts(db_path):
+    """Row counts of materialized tables (views are not counted, that would re-run them)."""
+    con = duckdb.connect(db_path, read_only=True)
+    rows = con.execute("""
+        SELECT table_schema, table_name
+        FROM information_schema.tables
+        WHERE table_type = 'BASE TABLE'
+    """).fetchall()
+    counts = {
+        table_name: con.execute(f'SELECT COUNT(*) FROM "{schema}"."{table_name}"').fetchone()[0]
+        for schema, table_name in rows
+    }
+    con.close()
+    return counts
+
+
+def print_model_timings(results, row_counts):
+    """Prints models sorted by execution time, slowest first."""
+    print(f"\n{'model':40s} {'status':8s} {'seconds':>9s} {'rows':>12s}")
+    print("-" * 72)
+    total = 0.0
+    for result in sorted(results, key=lambda r: r["execution_time"], reverse=True):
+        model = result["unique_id"].split(".")[-1]
+        rows = row_counts.get(model)
+        total += result["execution_time"]
+        print(f"{model:40s} {result['status']:8s} {result['execution_time']:9.2f} "
+              f"{(f'{rows:,d}' if rows is not None else 'view'):>12s}")
+    print("-" * 72)
+    print(f"{'total (sum of model times)':49s} {total:9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the dbt project on DuckDB and report per-model timings")
+    parser.add_argument("--path", default=DEFAULT_DB_PATH, help="DuckDB database file")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of synthetic historical trips")
+    parser.add_argument("--parquet-dir", help="Use trips / NOAA rows written by tools/synthetic_tlc.py")
+    parser.add_argument("--skip-generate", action="store_true", help="Reuse the source tables already in --path")
+    parser.add_argument("--select", help="dbt node selection passed to `dbt run`")
+    parser.add_argument("--history", help="Parquet file collecting per-model timings across runs")
+    args = parser.parse_args()
+
+    if not args.skip_generate:
+        start = time.perf_counter()
+        con = duckdb.connect(args.path)
+        duckdb_sources.load_extensions(con)
+        stats = duckdb_sources.create_sources(con, args.rows, parquet_dir=args.parquet_dir)
+        con.close()
+        print(f"Generated sources in {time.perf_counter() - start:.1f}s "
+              f"({stats['new_york_taxi_trips.tlc_yellow_trips_2021'][0]:,d} trips)")
+
+    if not os.path.isdir(os.path.join(PROJECT_DIR, "dbt_packages")):
+        run_dbt(["deps"], args.path)
+    run_dbt(["seed"], args.path)
+
+    start = time.perf_counter()
+    try:
+        run_dbt(["run"], args.path, ["--select", args.select] if args.select else ())
+    except subprocess.CalledProcessError:
+        # Vẫn in timings của các model đã chạy trước khi fail
+        print_model_timings(load_run_results(), table_row_counts(args.path))
+        sys.exit(1)
+    wall_clock = time.perf_counter() - start
+
+    print_model_timings(load_run_results(), table_row_counts(args.path))
+    print(f"{'dbt run wall clock':49s} {wall_clock:9.2f}")
+
+    if args.history:
+        run_results_path = os.path.join(PROJECT_DIR, "target", "run_results.json")
+        current = dbt_perf_report.to_frame(dbt_perf_report.load_model_stats(run_results_path, "duckdb"))
+        history = dbt_perf_report.load_history_parquet(args.history)
+        regressions = dbt_perf_report.find_regressions(current, history)
+        dbt_perf_report.append_history_parquet(current, args.history)
+        if regressions:
+            print(f"\nREGRESSIONS ({len(regressions)}):")
+            for item in regressions:
+                print(f"  {item['model']:40s} {item['metric']:18s} {item['value']:,.2f} vs median {item['baseline']:,.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+synthetic_tlc.py
+Vectorised generator of TLC-shaped synthetic trips, weather and events (partitioned Parquet)
+
+Demand follows the shapes already used by dashboard/demo_data.py:
+- hour of day: 3000 off-peak / 5000 midday (10-16h) / 8000 rush hours (7-9h, 17-19h)
+- day of week: Sun 35000, Mon-Thu 40000, Fri-Sat 55000
+- month: winter (12, 1, 2) 700k, summer (6, 7, 8) 950k, other months 800k
+- vendor 2 has 1.3x the trips of vendor 1, speeds 35 mph at night / 12 mph at rush hour / 20 mph otherwise
+- distance ~ exponential(3) + 0.5 miles, fare = 2.5 + 2.5 * distance + N(0, 2)
+Zones get a fixed Zipf-like popularity, holidays lower the daily volume and local events
+(concerts, games) pull late-evening pickups towards their venue zone.
+
+The work is split into chunks of at most --chunk-rows trips, each inside a single month, so
+memory stays bounded whatever the total size and every chunk is written by one worker process.
+A chunk's random stream only depends on (--seed, chunk id): the output is identical for any
+number of workers.
+
+Output layout:
+    <output>/trips/year=2021/month=01/part-00000.parquet   (columns of tlc_yellow_trips_2021)
+    <output>/weather/gsod.parquet                          (columns of noaa_gsod.gsod2021)
+    <output>/events/events.parquet
+
+Usage:
+    python tools/synthetic_tlc.py --rows 10000000 --output data/synthetic_tlc
+    python tools/synthetic_tlc.py --rows 1000000000 --workers 16 --chunk-rows 5000000
+    # Load test of the dbt models on DuckDB
+    python tools/run_dbt_duckdb.py --parquet-dir data/synthetic_tlc
+"""
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+N_ZONES = 263
+WEATHER_STATIONS = ("725030", "744860", "725053")
+EVENTS_CALENDAR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "nyc_taxi_pipeline", "seeds", "events_calendar.csv"
+)
+
+HOLIDAY_FACTOR = 0.8  # Ngày lễ ít chuyến hơn ngày thường
+EVENT_PULL = 0.25  # Tỉ lệ pickup 21h-23h của ngày có sự kiện bị kéo về zone tổ chức
+EVENT_VENUES = (161, 230, 132, 138, 43)  # Midtown, Times Sq, JFK, LaGuardia, Central Park
+
+TRIP_SCHEMA = pa.schema([
+    ("vendor_id", pa.string()),
+    ("pickup_datetime", pa.timestamp("us")),
+    ("dropoff_datetime", pa.timestamp("us")),
+    ("passenger_count", pa.int64()),
+    ("trip_distance", pa.float64()),
+    ("rate_code", pa.string()),
+    ("store_and_fwd_flag", pa.string()),
+    ("payment_type", pa.string()),
+    ("fare_amount", pa.float64()),
+    ("extra", pa.float64()),
+    ("mta_tax", pa.float64()),
+    ("tip_amount", pa.float64()),
+    ("tolls_amount", pa.float64()),
+    ("imp_surcharge", pa.float64()),
+    ("airport_fee", pa.float64()),
+    ("total_amount", pa.float64()),
+    ("pickup_location_id", pa.string()),
+    ("dropoff_location_id", pa.string()),
+])
+
+
+# =====================
+# Demand shapes (demo_data.py)
+# =====================
+def hourly_profile():
+    """Relative trips per hour of day."""
+    weights = np.full(24, 3000.0)
+    weights[10:17] = 5000.0
+    weights[7:10] = 8000.0
+    weights[17:20] = 8000.0
+    return weights
+
+
+def weekday_profile():
+    """Relative trips per weekday, numpy convention (Mon=0 ... Sun=6)."""
+    return np.array([40000.0, 40000.0, 40000.0, 40000.0, 55000.0, 55000.0, 35000.0])
+
+
+def monthly_profile():
+    """Relative trips per month, index 0 = January."""
+    weights = np.full(12, 800000.0)
+    weights[[11, 0, 1]] = 700000.0
+    weights[[5, 6, 7]] = 950000.0
+    return weights
+
+
+def speed_profile():
+    """Average speed (mph) per hour of day."""
+    speeds = np.full(24, 20.0)
+    speeds[0:6] = 35.0
+    speeds[7:10] = 12.0
+    speeds[17:20] = 12.0
+    return speeds
+
+
+def zone_popularity(seed):
+    """Fixed Zipf-like pickup probability per zone id (index 0 = zone 1)."""
+    rng = np.random.default_rng([seed, 0])
+    ranks = rng.permutation(N_ZONES) + 1
+    weights = 1.0 / ranks ** 1.1
+    return weights / weights.sum()
+
+
+# =====================
+# Events
+# =====================
+def build_events(start, end, seed):
+    """Holidays from the events_calendar seed (moved to each generated year) plus synthetic venue events."""
+    start_day, end_day = np.datetime64(start, "D"), np.datetime64(end, "D")
+    rows = []
+
+    years = range(start_day.astype(object).year, end_day.astype(object).year + 1)
+    with open(EVENTS_CALENDAR, "r", encoding="utf-8") as f:
+        for holiday in csv.DictReader(f):
+            for year in years:
+                day = np.datetime64(f"{year}{holiday['event_date'][4:]}", "D")
+                if start_day <= day < end_day:
+                    rows.append((day, holiday["event_name"], holiday["event_type"], None, None))
+
+    # Khoảng 2 sự kiện mỗi tuần tại các venue lớn
+    rng = np.random.default_rng([seed, 1])
+    n_days = int((end_day - start_day).astype(int))
+    event_days = np.flatnonzero(rng.random(n_days) < 2 / 7)
+    for offset in event_days:
+        rows.append((
+            start_day + offset,
+            str(rng.choice(["Concert", "Basketball Game", "Hockey Game", "Conference"])),
+            "Local Event",
+            int(rng.choice(EVENT_VENUES)),
+            int(rng.integers(2000, 20000)),
+        ))
+
+    rows.sort(key=lambda row: row[0])
+    return pa.table({
+        "event_date": pa.array(np.array([row[0] for row in rows], dtype="datetime64[D]"), pa.date32()),
+        "event_name": pa.array([row[1] for row in rows], pa.string()),
+        "event_type": pa.array([row[2] for row in rows], pa.string()),
+        "zone_id": pa.array([None if row[3] is None else str(row[3]) for row in rows], pa.string()),
+        "expected_attendance": pa.array([row[4] for row in rows], pa.int64()),
+    })
+
+
+def hour_weights(hours, events):
+    """Sampling weight of every hour in `hours` (datetime64[h]) and the venue zone pulling its pickups (0 = none)."""
+    days = hours.astype("datetime64[D]")
+    hour_of_day = (hours - days).astype(int)
+    weekday = (days.astype(int) + 3) % 7  # 1970-01-01 là thứ Năm
+    month = days.astype("datetime64[M]").astype(int) % 12
+
+    weights = hourly_profile()[hour_of_day] * weekday_profile()[weekday] * monthly_profile()[month]
+
+    event_days = events.column("event_date").to_numpy().astype("datetime64[D]")
+    is_holiday = np.isin(days, event_days[np.array(events.column("event_type").to_pylist()) == "Holiday"])
+    weights[is_holiday] *= HOLIDAY_FACTOR
+
+    venue_zone = np.zeros(len(hours), dtype=np.int64)
+    zone_ids = events.column("zone_id").to_pylist()
+    late_evening = hour_of_day >= 21
+    for event_day, zone_id in zip(event_days, zone_ids):
+        if zone_id is not None:
+            venue_zone[(days == event_day) & late_evening] = int(zone_id)
+    return weights, venue_zone
+
+
+# =====================
+# Trips
+# =====================
+def plan_chunks(n_rows, start, end, chunk_rows, events):
+    """Splits the trips over months (by demand weight) and each month into chunks of <= chunk_rows."""
+    hours = np.arange(np.datetime64(start, "h"), np.datetime64(end, "h"))
+    weights, _ = hour_weights(hours, events)
+    months = hours.astype("datetime64[M]")
+    month_starts = np.unique(months)
+    month_weight = np.array([weights[months == m].sum() for m in month_starts])
+
+    month_rows = np.floor(n_rows * month_weight / month_weight.sum()).astype(np.int64)
+    month_rows[np.argmax(month_weight)] += n_rows - month_rows.sum()  # Phần dư do làm tròn
+
+    tasks = []
+    for month_start, rows in zip(month_starts, month_rows):
+        window_start = max(np.datetime64(month_start, "h"), hours[0])
+        window_end = min(np.datetime64(month_start + np.timedelta64(1, "M"), "h"), hours[-1] + np.timedelta64(1, "h"))
+        for offset in range(0, rows, chunk_rows):
+            tasks.append({
+                "chunk_id": len(tasks),
+                "start": str(window_start),
+                "end": str(window_end),
+                "n_rows": int(min(chunk_rows, rows - offset)),
+            })
+    return tasks
+
+
+def generate_trip_chunk(task, seed, events, zone_probs):
+    """Generates one chunk of trips as an Arrow table (all columns vectorised)."""
+    rng = np.random.default_rng([seed, 2, task["chunk_id"]])
+    n = task["n_rows"]
+
+    hours = np.arange(np.datetime64(task["start"], "h"), np.datetime64(task["end"], "h"))
+    weights, venue_zone = hour_weights(hours, events)
+    hour_index = rng.choice(len(hours), size=n, p=weights / weights.sum())
+    pickup_seconds = hours[hour_index].astype("datetime64[s]").astype(np.int64) + rng.integers(0, 3600, size=n)
+    hour_of_day = (hour_index + hours[0].astype(np.int64)) % 24
+
+    pickup_zone = rng.choice(N_ZONES, size=n, p=zone_probs) + 1
+    dropoff_zone = rng.choice(N_ZONES, size=n, p=zone_probs) + 1
+    venue = venue_zone[hour_index]
+    pulled = (venue > 0) & (rng.random(n) < EVENT_PULL)
+    pickup_zone[pulled] = venue[pulled]
+
+    # Vendor 2 có số chuyến gấp 1.3 vendor 1, vendor 1 chạy nhanh hơn 5%
+    vendor = np.where(rng.random(n) < 1 / 2.3, 1, 2)
+    distance = np.round(rng.exponential(3.0, size=n) + 0.5, 2)
+    speed = speed_profile()[hour_of_day] * np.where(vendor == 1, 1.05, 1.0) * rng.lognormal(0.0, 0.2, size=n)
+    duration_seconds = (distance / speed * 3600 + 60).astype(np.int64)
+
+    fare = np.round(np.maximum(2.5 + distance * 2.5 + rng.normal(0, 2, size=n), 3.0), 2)
+    extra = rng.choice([0.0, 0.0, 0.5, 1.0], size=n)
+    payment_type = np.where(rng.random(n) < 0.7, "1", "2")
+    tip = np.where(payment_type == "1", np.round(fare * rng.uniform(0.10, 0.25, size=n), 2), 0.0)
+    tolls = rng.choice([0.0, 0.0, 0.0, 5.76, 6.12], size=n)
+    airport_fee = np.where(distance >= 10, 1.25, 0.0)
+    total = np.round(fare + extra + 0.5 + tip + tolls + 0.3 + airport_fee, 2)
+    passengers = rng.choice(np.arange(1, 7), size=n, p=[0.70, 0.15, 0.05, 0.04, 0.04, 0.02])
+
+    pickup_us = pickup_seconds * 1_000_000
+    return pa.table([
+        pa.array(vendor.astype(str)),
+        pa.array(pickup_us, pa.timestamp("us")),
+        pa.array(pickup_us + duration_seconds * 1_000_000, pa.timestamp("us")),
+        pa.array(passengers),
+        pa.array(distance),
+        pa.array(np.full(n, "1")),
+        pa.array(np.full(n, "N")),
+        pa.array(payment_type),
+        pa.array(fare),
+        pa.array(extra),
+        pa.array(np.full(n, 0.5)),
+        pa.array(tip),
+        pa.array(tolls),
+        pa.array(np.full(n, 0.3)),
+        pa.array(airport_fee),
+        pa.array(total),
+        pa.array(pickup_zone.astype(str)),
+        pa.array(dropoff_zone.astype(str)),
+    ], schema=TRIP_SCHEMA)
+
+
+def write_trip_chunk(task, seed, output_dir):
+    """Worker entry point: generates a chunk and writes it to its year/month partition."""
+    events = pq.read_table(os.path.join(output_dir, "events", "events.parquet"))
+    table = generate_trip_chunk(task, seed, events, zone_popularity(seed))
+
+    month = np.datetime64(task["start"], "M").astype(object)
+    partition = os.path.join(output_dir, "trips", f"year={month.year}", f"month={month.month:02d}")
+    os.makedirs(partition, exist_ok=True)
+    pq.write_table(table, os.path.join(partition, f"part-{task['chunk_id']:05d}.parquet"), compression="zstd")
+    return table.num_rows
+
+
+# =====================
+# Weather
+# =====================
+def build_weather(start, end, seed):
+    """Daily NOAA GSOD-shaped rows (°F, inches, '0'/'1' flags) for the 3 NYC stations."""
+    rng = np.random.default_rng([seed, 3])
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D"))
+    day_of_year = (days - days.astype("datetime64[Y]")).astype(int)
+
+    n = len(days) * len(WEATHER_STATIONS)
+    station = np.repeat(np.array(WEATHER_STATIONS), len(days))
+    date = np.tile(days, len(WEATHER_STATIONS))
+    # Lạnh nhất giữa tháng 1, nóng nhất giữa tháng 7
+    temp = np.round(55 - 22 * np.cos(2 * np.pi * (np.tile(day_of_year, len(WEATHER_STATIONS)) - 15) / 365)
+                    + rng.normal(0, 5, size=n), 1)
+    prcp = np.where(rng.random(n) < 0.3, np.round(rng.exponential(0.3, size=n), 2), 0.0)
+
+    return pa.table({
+        "stn": pa.array(station),
+        "date": pa.array(date, pa.date32()),
+        "temp": pa.array(temp),
+        "max": pa.array(np.round(temp + rng.uniform(4, 12, size=n), 1)),
+        "min": pa.array(np.round(temp - rng.uniform(4, 12, size=n), 1)),
+        "prcp": pa.array(prcp),
+        "fog": pa.array(np.where(rng.random(n) < 0.1, "1", "0")),
+        "rain_drizzle": pa.array(np.where((prcp > 0) & (temp >= 34), "1", "0")),
+        "snow_ice_pellets": pa.array(np.where((prcp > 0) & (temp < 34), "1", "0")),
+    })
+
+
+def generate(n_rows, start, end, output_dir, chunk_rows=2_000_000, workers=None, seed=42):
+    """Writes events, weather and trips; returns the number of trips written."""
+    os.makedirs(os.path.join(output_dir, "events"), exist_ok=True)
+    os.makedirs(os.path.join(output_dir, "weather"), exist_ok=True)
+
+    events = build_events(start, end, seed)
+    pq.write_table(events, os.path.join(output_dir, "events", "events.parquet"))
+    pq.write_table(build_weather(start, end, seed), os.path.join(output_dir, "weather", "gsod.parquet"))
+
+    tasks = plan_chunks(n_rows, start, end, chunk_rows, events)
+    print(f"{n_rows:,d} trips in {len(tasks)} chunks, {workers or os.cpu_count()} workers")
+
+    started = time.perf_counter()
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_trip_chunk, task, seed, output_dir) for task in tasks]
+        for done, future in enumerate(futures, start=1):
+            written += future.result()
+            elapsed = time.perf_counter() - started
+            print(f"  chunk {done}/{len(tasks)}: {written:,d} trips, {written / elapsed:,.0f} trips/s")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic TLC trips, weather and events as Parquet")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Total number of trips")
+    parser.add_argument("--start", default="2021-01-01", help="First pickup day (inclusive)")
+    parser.add_argument("--end", default="2021-11-24", help="Last pickup day (exclusive)")
+    parser.add_argument("--output", default="data/synthetic_tlc", help="Output directory")
+    parser.add_argument("--chunk-rows", type=int, default=2_000_000, help="Max trips per chunk (bounds memory)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    written = generate(args.rows, args.start, args.end, args.output, args.chunk_rows, args.workers, args.seed)
+    print(f"Wrote {written:,d} trips to {args.output} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()